@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import deque
+
+from metrics import REGISTRY, snowflake_time
+
+
+class AdmissionControl(object):
+    """ Decide which mentions are handled, and in which order, when they arrive faster than the bot can answer them:
+        - every account can request at most quota word clouds every quota_seconds, its extra mentions are dropped as
+          soon as they are downloaded (see admit)
+        - the mentions posted more than max_age seconds ago are dropped, their authors have likely given up
+        - at most max_pending mentions wait to be handled, the oldest ones beyond it are dropped
+        - the mentions are handled the oldest first, but while more than lifo_depth are waiting the newest go first:
+          during a flood the fresh requests are answered in time and the old ones age out, instead of every request
+          waiting behind the whole backlog (see schedule)
+        Every dropped mention is counted in mentions_shed_total, by reason. A limit of 0 disables it.
+    """
+    QUOTA = 'quota'
+    STALE = 'stale'
+    OVERFLOW = 'overflow'
+
+    def __init__(self, quota=0, quota_seconds=3600, max_age=0, max_pending=0, lifo_depth=0, clock=time.time):
+        """
+        :param quota: max number of mentions of an account admitted every quota_seconds
+        :param quota_seconds: seconds
+        :param max_age: max seconds between a mention and its reply
+        :param max_pending: max number of mentions waiting to be handled
+        :param lifo_depth: handle the newest mentions first while more than this many are waiting
+        :param clock: function returning the current unix time
+        """
+        self.quota = quota
+        self.quota_seconds = quota_seconds
+        self.max_age = max_age
+        self.max_pending = max_pending
+        self.lifo_depth = lifo_depth
+        self.clock = clock
+        self._requests = {}  # lowercase screen name -> times of its admitted mentions, the oldest first
+        self._lock = threading.Lock()
+
+    def admit(self, mentions):
+        """ Drop the new mentions of the accounts over their quota.
+        :param mentions: list of Mention, the newest at the top (as returned by TwitterApi.get_mentions)
+        :return: list of the admitted mentions, the newest at the top
+        """
+        if not self.quota:
+            return mentions
+        now = self.clock()
+        admitted = []
+        with self._lock:
+            for m in reversed(mentions):
+                # the time of the mention, so that downloading it late doesn't give its author more requests
+                posted = snowflake_time(m.id_str) or now
+                times = self._requests.setdefault(m.screen_name.lower(), deque())
+                while times and times[0] <= posted - self.quota_seconds:
+                    times.popleft()
+                if len(times) >= self.quota:
+                    continue
+                times.append(posted)
+                admitted.append(m)
+            # forget the accounts that didn't request anything lately
+            for name in [name for name, times in self._requests.items() if times[-1] <= now - self.quota_seconds]:
+                del self._requests[name]
+        if len(admitted) < len(mentions):
+            print("Dropped {0} mention(s) over the quota of their account".format(len(mentions) - len(admitted)))
+            REGISTRY.inc('mentions_shed_total', len(mentions) - len(admitted), reason=self.QUOTA)
+        admitted.reverse()
+        return admitted
+
+    def is_stale(self, mention_id):
+        """
+        :param mention_id: id of a mention (string)
+        :return: True if the mention was posted more than max_age seconds ago
+        """
+        if not self.max_age:
+            return False
+        posted = snowflake_time(mention_id)
+        return posted is not None and self.clock() - posted > self.max_age
+
+    def drop_stale(self, mention_id):
+        """ Same as is_stale, counting the mention as shed if it's stale. """
+        if not self.is_stale(mention_id):
+            return False
+        REGISTRY.inc('mentions_shed_total', reason=self.STALE)
+        return True
+
+    def schedule(self, mention_ids):
+        """ Order the mentions waiting to be handled and pick the ones to drop.
+        :param mention_ids: list of the ids of the mentions waiting to be handled (strings)
+        :return: (list of the ids of the mentions to handle, in order, list of the ids of the mentions to drop)
+        """
+        mention_ids = sorted(mention_ids, key=int)
+        stale = [i for i in mention_ids if self.is_stale(i)]
+        if stale:
+            stale_ids = set(stale)
+            mention_ids = [i for i in mention_ids if i not in stale_ids]
+        overflow = []
+        if self.max_pending and len(mention_ids) > self.max_pending:
+            overflow = mention_ids[:-self.max_pending]
+            mention_ids = mention_ids[-self.max_pending:]
+        if stale:
+            REGISTRY.inc('mentions_shed_total', len(stale), reason=self.STALE)
+        if overflow:
+            REGISTRY.inc('mentions_shed_total', len(overflow), reason=self.OVERFLOW)
+        if stale or overflow:
+            print("Dropped {0} stale mention(s) and {1} mention(s) over the max backlog"
+                  .format(len(stale), len(overflow)))
+        if self.lifo_depth and len(mention_ids) > self.lifo_depth:
+            mention_ids.reverse()
+        return mention_ids, stale + overflow
@@ -0,0 +1,206 @@
+import asyncio
+import base64
+import json
+
+import aiohttp
+from imgurpython.client import API_URL
+from imgurpython.helpers.error import ImgurClientError, ImgurClientRateLimitError
+
+from metrics import REGISTRY
+from ratelimit import RateLimiter
+from records import Mention, Tweet
+
+
+def make_session(max_connections=20, keepalive_timeout=60):
+    """
+    :param max_connections: max number of connections open at the same time
+    :param keepalive_timeout: seconds an idle connection is kept open to be reused
+    :return: aiohttp.ClientSession whose pool of keep-alive connections is shared by the clients below
+    """
+    connector = aiohttp.TCPConnector(limit=max_connections, keepalive_timeout=keepalive_timeout)
+    return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=120))
+
+
+class AsyncTwitterHTTPError(Exception):
+    def __init__(self, code, headers, body):
+        super(AsyncTwitterHTTPError, self).__init__('Twitter sent status {0}: {1}'.format(code, body))
+        self.code = code
+        self.headers = headers
+
+
+class AsyncTwitterApi(object):
+    """ asyncio version of TwitterApi for the endpoints used by the bot, on a shared aiohttp session.
+        The requests are signed by the twitter.oauth.OAuth object of a TwitterApi, and they are scheduled by the same
+        kind of RateLimiter, so an instance of both clients can share it.
+    """
+    def __init__(self, auth, session, rate_limiter=None, domain='api.twitter.com', secure=True, api_version='1.1'):
+        """
+        :param auth: twitter.oauth.OAuth object (see TwitterApi.oauth_login)
+        :param session: aiohttp.ClientSession (see make_session)
+        :param rate_limiter: RateLimiter scheduling the calls, None for a new one
+        """
+        self.auth = auth
+        self.session = session
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self.base_url = '{0}://{1}/{2}/'.format('https' if secure else 'http', domain, api_version)
+
+    async def _call(self, method, endpoint, params):
+        url = self.base_url + endpoint + '.json'
+        params = {k: str(v) for k, v in params.items()}
+        signed = self.auth.encode_params(url, method, params)
+        if method == 'GET':
+            request = self.session.get(url + '?' + signed)
+        else:
+            request = self.session.post(url, data=signed.encode('utf-8'),
+                                        headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        async with request as response:
+            if response.status >= 400:
+                # the errors of the proxies and of an overloaded Twitter can be html or empty
+                text = await response.text(errors='replace')
+                try:
+                    body = json.loads(text)
+                except ValueError:
+                    body = text
+                raise AsyncTwitterHTTPError(response.status, response.headers, body)
+            try:
+                body = await response.json(content_type=None)
+            except ValueError as e:
+                # a truncated response, retried like a connection error
+                raise aiohttp.ClientPayloadError('Invalid json from Twitter: {0}'.format(e))
+            self.rate_limiter.update(endpoint, response.headers)
+            return body
+
+    async def make_twitter_request(self, method, endpoint, params, max_errors=10):
+        """ Call an endpoint, with the same retry semantics of TwitterApi.make_twitter_request.
+        :param method: 'GET' or 'POST'
+        :param endpoint: e.g. 'statuses/user_timeline'
+        :param params: dict of the parameters of the call
+        :return: the decoded json response, None for 401 and 404 errors
+        """
+        wait_period = 2
+        error_count = 0
+
+        while True:
+            await self.rate_limiter.acquire_async(endpoint)
+            REGISTRY.inc('twitter_api_calls_total', endpoint=endpoint)
+            try:
+                with REGISTRY.time('twitter_api_call_seconds', endpoint=endpoint):
+                    return await self._call(method, endpoint, params)
+            except AsyncTwitterHTTPError as e:
+                error_count = 0
+                if wait_period > 3600: # Seconds
+                    print('Too many retries. Quitting.')
+                    raise
+                if e.code == 401:
+                    print('Encountered 401 Error (Not Authorized)')
+                    return None
+                elif e.code == 404:
+                    print('Encountered 404 Error (Not Found)')
+                    return None
+                elif e.code == 429:
+                    print('Encountered 429 Error (Rate Limit Exceeded) on {0}'.format(endpoint))
+                    REGISTRY.inc('twitter_api_rate_limited_total', endpoint=endpoint)
+                    self.rate_limiter.rate_limited(endpoint, e.headers)
+                    wait_period = 2
+                elif e.code in (500, 502, 503, 504):
+                    print('Encountered {0} Error. Retrying in {1} seconds'.format(e.code, wait_period))
+                    REGISTRY.inc('twitter_api_retries_total', endpoint=endpoint, reason=str(e.code))
+                    await asyncio.sleep(wait_period)
+                    wait_period *= 1.5
+                else:
+                    raise
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error_count += 1
+                print("{0} encountered. Continuing.".format(type(e).__name__))
+                REGISTRY.inc('twitter_api_retries_total', endpoint=endpoint, reason=type(e).__name__)
+                if error_count > max_errors:
+                    print("Too many consecutive errors...bailing out.")
+                    raise
+
+    async def harvest_user_timeline(self, screen_name, max_results=3200, since_id=1):
+        """ See TwitterApi.harvest_user_timeline """
+        kw = {'count': 200, 'trim_user': 'true', 'include_rts': 'true', 'since_id': since_id,
+              'screen_name': screen_name}
+        max_pages = 16
+
+        tweets = await self.make_twitter_request('GET', 'statuses/user_timeline', kw)
+        if tweets is None:
+            tweets = []
+        results = [Tweet.from_json(t) for t in tweets]
+        print('Fetched {0} tweets'.format(len(tweets)))
+
+        page_num = 1
+        if max_results == kw['count']:
+            page_num = max_pages
+        if since_id != 1 and len(tweets) < kw['count']:
+            page_num = max_pages
+
+        while page_num < max_pages and len(tweets) > 0 and len(results) < max_results:
+            kw['max_id'] = min([tweet['id'] for tweet in tweets]) - 1
+            tweets = await self.make_twitter_request('GET', 'statuses/user_timeline', kw)
+            if tweets is None:
+                tweets = []
+            results += [Tweet.from_json(t) for t in tweets]
+            print('Fetched {0} tweets'.format(len(tweets)))
+            page_num += 1
+
+        print('Done fetching tweets')
+        return results[:max_results]
+
+    async def get_mentions(self, last_mention_id=1):
+        """ See TwitterApi.get_mentions """
+        kw = {'count': 200, 'trim_user': 'false', 'include_rts': 'true', 'since_id': last_mention_id}
+        mentions = await self.make_twitter_request('GET', 'statuses/mentions_timeline', kw)
+        if mentions is None:
+            mentions = []
+        return [Mention.from_json(m) for m in mentions]
+
+    async def reply_tweet(self, status, in_reply_to_status_id):
+        """ See TwitterApi.reply_tweet """
+        kw = {'status': status, 'in_reply_to_status_id': in_reply_to_status_id}
+        return await self.make_twitter_request('POST', 'statuses/update', kw)
+
+
+class AsyncImgurClient(object):
+    """ Upload images to imgur on a shared aiohttp session, with the credentials of an imgurpython ImgurClient. """
+    def __init__(self, imgur_client, session):
+        """
+        :param imgur_client: imgurpython.ImgurClient object, its tokens are used and refreshed when they expire
+        :param session: aiohttp.ClientSession (see make_session)
+        """
+        self.imgur_client = imgur_client
+        self.session = session
+
+    async def upload(self, image, config=None, anon=True):
+        """ Same as ImgurClient.upload_from_path
+        :param image: path to the image file or the image itself (bytes)
+        :return: an imgur object (use `id` key to get the id to use in https://imgur.com/<id>)
+        """
+        if isinstance(image, str):
+            with open(image, 'rb') as f:
+                image = f.read()
+        data = {'image': base64.b64encode(image).decode('ascii'), 'type': 'base64'}
+        config = config or {}
+        data.update({k: config[k] for k in set(self.imgur_client.allowed_image_fields).intersection(config)})
+
+        status, response_data = await self._post('upload', data, anon)
+        if status == 403 and self.imgur_client.auth is not None:
+            # the access token expired, refresh it (imgurpython only has a blocking call for that)
+            await asyncio.get_running_loop().run_in_executor(None, self.imgur_client.auth.refresh)
+            status, response_data = await self._post('upload', data, anon)
+
+        if status == 429:
+            raise ImgurClientRateLimitError()
+        if response_data is None:
+            raise ImgurClientError('JSON decoding of response failed.')
+        if isinstance(response_data.get('data'), dict) and 'error' in response_data['data']:
+            raise ImgurClientError(response_data['data']['error'], status)
+        return response_data['data']
+
+    async def _post(self, route, data, anon):
+        headers = self.imgur_client.prepare_headers(anon)
+        async with self.session.post(API_URL + '3/' + route, data=data, headers=headers) as response:
+            try:
+                return response.status, await response.json(content_type=None)
+            except ValueError:
+                return response.status, None
@@ -0,0 +1,119 @@
+""" Simulate an hour of mentions with a flood in the middle (for ten minutes a few accounts spam #wordcloud and the
+    followers of a popular account try the bot, on top of the usual requests) and compare handling the backlog oldest first with the AdmissionControl: how many requests
+    of the usual users are answered, how long they wait for the reply, and the mentions dropped by reason.
+    Every mention takes SERVICE_SECONDS to answer and the mentions are downloaded every 10 answers, like
+    handle_mentions does. The spam asks for a different account every time, so grouping the requests doesn't help.
+
+    python -m benchmarks.bench_admission
+"""
+import io
+import random
+import time
+from contextlib import redirect_stdout
+
+from admission import AdmissionControl
+from benchmarks.replay import percentile
+from metrics import TWITTER_EPOCH, snowflake_time
+from records import Mention
+
+DURATION = 3600
+SERVICE_SECONDS = 4
+USERS_RATE = 1 / 6.0  # mentions per second of the usual users, 2/3 of what the bot can answer
+SPAMMERS = 3
+SPAM_EVERY = 5  # seconds between the mentions of every spammer
+FLOOD = (1200, 1800)
+FLOOD_USERS_RATE = 1 / 2.0  # mentions per second of the followers of the popular account
+
+CONFIGS = [('oldest first', {}),
+           ('quota', {'quota': 5}),
+           ('quota + max age', {'quota': 5, 'max_age': 600}),
+           ('all, lifo', {'quota': 5, 'max_age': 600, 'max_pending': 200, 'lifo_depth': 20})]
+
+
+def make_arrivals(start, seed=0):
+    """
+    :param start: unix time of the beginning of the hour
+    :return: list of Mention, the oldest first, with ids telling when they were posted
+    """
+    rnd = random.Random(seed)
+    arrivals = []
+    t = rnd.expovariate(USERS_RATE)
+    while t < DURATION:
+        arrivals.append((t, 'user{0}'.format(rnd.randrange(10000))))
+        t += rnd.expovariate(USERS_RATE)
+    t = FLOOD[0] + rnd.expovariate(FLOOD_USERS_RATE)
+    while t < FLOOD[1]:
+        arrivals.append((t, 'user{0}'.format(rnd.randrange(10000))))
+        t += rnd.expovariate(FLOOD_USERS_RATE)
+    for n in range(SPAMMERS):
+        t = FLOOD[0] + rnd.uniform(0, SPAM_EVERY)
+        while t < FLOOD[1]:
+            arrivals.append((t, 'spammer{0}'.format(n)))
+            t += SPAM_EVERY
+    arrivals.sort()
+    return [Mention(str(((int((start + t) * 1000) - TWITTER_EPOCH) << 22) + i), '#wordcloud', name, ['wordcloud'])
+            for i, (t, name) in enumerate(arrivals)]
+
+
+def simulate(arrivals, start, **limits):
+    """
+    :return: (list of (screen name, seconds waited) of the answered mentions, dict mapping every reason to the number
+             of mentions dropped for it)
+    """
+    clock = [start]
+    admission = AdmissionControl(clock=lambda: clock[0], **limits)
+    posted = {m.id_str: snowflake_time(m.id_str) for m in arrivals}
+    authors = {m.id_str: m.screen_name for m in arrivals}
+    dropped = {AdmissionControl.QUOTA: 0, AdmissionControl.STALE: 0, AdmissionControl.OVERFLOW: 0}
+    waits = []
+    next_arrival = 0
+    pending = []
+    answered = 0
+    while clock[0] < start + DURATION * 2:
+        if answered % 10 == 0 or not pending:
+            new = []
+            while next_arrival < len(arrivals) and posted[arrivals[next_arrival].id_str] <= clock[0]:
+                new.append(arrivals[next_arrival])
+                next_arrival += 1
+            admitted = admission.admit(list(reversed(new)))
+            dropped[AdmissionControl.QUOTA] += len(new) - len(admitted)
+            order, shed = admission.schedule(pending + [m.id_str for m in admitted])
+            for mention_id in shed:
+                dropped[AdmissionControl.STALE if admission.is_stale(mention_id) else AdmissionControl.OVERFLOW] += 1
+            pending = order
+        if not pending:
+            if next_arrival == len(arrivals):
+                break
+            clock[0] = posted[arrivals[next_arrival].id_str]
+            continue
+        mention_id = pending.pop(0)
+        if admission.drop_stale(mention_id):
+            dropped[AdmissionControl.STALE] += 1
+            continue
+        clock[0] += SERVICE_SECONDS
+        answered += 1
+        waits.append((authors[mention_id], clock[0] - posted[mention_id]))
+    return waits, dropped
+
+
+def main():
+    start = time.time() - DURATION
+    arrivals = make_arrivals(start)
+    users = sum(1 for m in arrivals if m.screen_name.startswith('user'))
+    print('{0} mentions of the usual users, {1} of {2} spammers, the bot answers one every {3} seconds\n'
+          .format(users, len(arrivals) - users, SPAMMERS, SERVICE_SECONDS))
+    print('{0:<16} {1:>9} {2:>9} {3:>9} {4:>9} {5:>9} {6:>7} {7:>7} {8:>9}'
+          .format('', 'answered', 'p50', 'p99', 'max', 'spam', 'quota', 'stale', 'overflow'))
+    for name, limits in CONFIGS:
+        # AdmissionControl prints every mention it drops
+        with redirect_stdout(io.StringIO()):
+            waits, dropped = simulate(arrivals, start, **limits)
+        user_waits = sorted(w for author, w in waits if author.startswith('user'))
+        print('{0:<16} {1:>8.0%} {2:>7.0f} s {3:>7.0f} s {4:>7.0f} s {5:>9} {6:>7} {7:>7} {8:>9}'
+              .format(name, len(user_waits) / float(users), percentile(user_waits, 50), percentile(user_waits, 99),
+                      max(user_waits), len(waits) - len(user_waits), dropped[AdmissionControl.QUOTA],
+                      dropped[AdmissionControl.STALE], dropped[AdmissionControl.OVERFLOW]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+""" Compare the encodings of a full-size word cloud: the RGB png written by WordCloud.to_file before ImageEncoder, the
+    palette png (the default), webp and jpeg. Size of the image, size of the upload payload (base64) and encode time.
+
+    python -m benchmarks.bench_encoding
+"""
+import base64
+import io
+import time
+
+from wordcloud import WordCloud
+
+from benchmarks.common import as_harvested, make_settings, make_timeline
+from encoder import ImageEncoder
+from main import TwitterWordCloudBot
+
+ENCODERS = [('png rgb', ImageEncoder('png', colors=0)),
+            ('png palette', ImageEncoder('png')),
+            ('png palette level 9', ImageEncoder('png', compress_level=9)),
+            ('webp', ImageEncoder('webp')),
+            ('jpeg', ImageEncoder('jpeg'))]
+
+
+def to_file_bytes(image):
+    """ What WordCloud.to_file wrote before: an RGB png with optimize=True """
+    buffer = io.BytesIO()
+    image.save(buffer, format='png', optimize=True)
+    return buffer.getvalue()
+
+
+def best_time(func, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    settings = make_settings()
+    bot = TwitterWordCloudBot(None, None, settings.read_stopwords(), settings)
+    frequencies = bot.clean_tweets(as_harvested(make_timeline(3200)))
+    image = WordCloud(width=bot.WIDTH, height=bot.HEIGHT, max_words=bot.MAX_WORDS,
+                      font_path=bot.FONT_PATH).generate_from_frequencies(frequencies).to_image()
+
+    print('{0:<24} {1:>12} {2:>14} {3:>12}'.format('', 'image', 'upload', 'encode'))
+    encodings = [('to_file (before)', to_file_bytes)] + [(name, encoder.encode) for name, encoder in ENCODERS]
+    for name, encode in encodings:
+        seconds, data = best_time(encode, image)
+        print('{0:<24} {1:>8.1f} KiB {2:>10.1f} KiB {3:>9.1f} ms'
+              .format(name, len(data) / 1024, len(base64.b64encode(data)) / 1024, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+""" Compare the old way of feeding WordCloud (list of words -> joined string -> WordCloud.process_text) with the
+    word frequencies counted directly by clean_tweets, on a full-size timeline. First check that both give the same
+    top words: clean_tweets drops the stopwords of WordCloud and the numbers and folds the plurals like process_text,
+    only its collocations (pairs of words counted as one) are missing.
+
+    python -m benchmarks.bench_frequencies
+"""
+from collections import Counter
+
+from wordcloud import WordCloud
+
+from benchmarks.common import as_harvested, make_settings, make_timeline, measure, report
+from main import TwitterWordCloudBot
+
+
+def legacy_frequencies(bot, tweets, min_length=2):
+    """ The pipeline used before clean_tweets returned a Counter: build the list of every word, join it and let
+        WordCloud split and count the text again.
+    """
+    words = []
+    langs = {}
+    for t in tweets:
+        text = t.text
+        if text.find('RT @') == 0:
+            continue
+        text = bot.clean_text(text)
+        # the stopwords of the most used language for the tweets whose language is unknown
+        stopwords = bot._tweet_stopwords(t, langs)
+        for word in text.split():
+            if len(word) >= min_length and (stopwords is None or word not in stopwords):
+                words.append(word)
+    text = ' '.join(words)
+    return WordCloud(max_words=bot.MAX_WORDS).process_text(text)
+
+
+def check_top_words(bot, tweets, min_shared=0.95):
+    """
+    :return: number of the MAX_WORDS most frequent words of the legacy pipeline also among the ones of clean_tweets
+    """
+    legacy = [word for word, _ in Counter(legacy_frequencies(bot, tweets)).most_common(bot.MAX_WORDS)]
+    words = set(word for word, _ in bot.clean_tweets(tweets).most_common(bot.MAX_WORDS))
+    shared = sum(1 for word in legacy if word in words)
+    assert shared >= min_shared * len(legacy), 'only {0} of the top {1} words are the same: missing {2}'.format(
+        shared, len(legacy), [word for word in legacy if word not in words])
+    return shared
+
+
+def main():
+    settings = make_settings()
+    bot = TwitterWordCloudBot(None, None, settings.read_stopwords(), settings)
+    for seed in range(3):
+        shared = check_top_words(bot, as_harvested(make_timeline(3200, seed=seed)))
+        print('timeline {0}: {1} of the top {2} words are the same'.format(seed, shared, bot.MAX_WORDS))
+    print()
+    tweets = as_harvested(make_timeline(3200))
+
+    print('{0:<40} {1:>13} {2:>14}'.format('', 'best time', 'peak memory'))
+    seconds, peak, _ = measure(legacy_frequencies, bot, tweets)
+    report('words list + join + process_text', seconds, peak)
+    seconds, peak, _ = measure(bot.clean_tweets, tweets)
+    report('clean_tweets -> Counter', seconds, peak)
+
+
+if __name__ == '__main__':
+    main()
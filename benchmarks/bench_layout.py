@@ -0,0 +1,89 @@
+""" Compare the default WordCloud layout with FastWordCloud at several layout scales and maxwords values, on the word
+    frequencies of a full-size timeline: render time (layout and drawing, without encoding), how many words fit in the
+    image, which share of the frequencies they carry, how much of the image they cover and how much the words
+    overlap once drawn at full size.
+
+    python -m benchmarks.bench_layout
+"""
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+from wordcloud import WordCloud
+
+from benchmarks.common import as_harvested, make_settings, make_timeline
+from layout import FastWordCloud, glyph_cache
+from main import TwitterWordCloudBot
+
+MAX_WORDS = [40, 80, 160, 300]
+LAYOUT_SCALES = [1, 2, 3]
+REPEAT = 3
+
+
+def render(make, frequencies):
+    """
+    :return: (best time in seconds, word cloud and image of the last run)
+    """
+    best = None
+    for seed in range(REPEAT):
+        start = time.perf_counter()
+        wordcloud = make(seed).generate_from_frequencies(frequencies)
+        image = wordcloud.to_image()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, wordcloud, image
+
+
+def overlap(wordcloud, image):
+    """
+    :return: share of the pixels of the words which are covered by more than one word once drawn at full size
+    """
+    glyphs = glyph_cache(wordcloud.font_path)
+    scale_y = image.size[1] / float(wordcloud.height)
+    counts = np.zeros((image.size[1], image.size[0]), dtype=np.uint16)
+    for (word, _), font_size, (row, column), orientation, _ in wordcloud.layout_:
+        # draw the word alone where to_image draws it
+        mask = Image.new('L', image.size)
+        ImageDraw.Draw(mask).text((int(column * wordcloud.scale), int(row * scale_y)), word, fill=255,
+                                  font=glyphs.font(int(font_size * wordcloud.scale), orientation))
+        counts += np.asarray(mask) > 0
+    return np.count_nonzero(counts > 1) / float(max(1, np.count_nonzero(counts)))
+
+
+def coverage(image):
+    """
+    :return: share of the pixels of the image which are not background
+    """
+    histogram = image.convert('L').histogram()
+    return 1 - histogram[0] / float(sum(histogram))
+
+
+def main():
+    settings = make_settings()
+    bot = TwitterWordCloudBot(None, None, settings.read_stopwords(), settings)
+    frequencies = bot.clean_tweets(as_harvested(make_timeline(3200)))
+    width, height = bot.WIDTH, bot.HEIGHT
+
+    print('{0:<10} {1:<16} {2:>10} {3:>9} {4:>8} {5:>8} {6:>10} {7:>9}'
+          .format('maxwords', '', 'time', 'speedup', 'words', 'weight', 'coverage', 'overlap'))
+    for max_words in MAX_WORDS:
+        top = dict(frequencies.most_common(max_words))
+        total = float(sum(top.values()))
+        modes = [('default', lambda seed: WordCloud(width=width, height=height, max_words=max_words,
+                                                    random_state=seed))]
+        for scale in LAYOUT_SCALES:
+            modes.append(('fast, scale {0}'.format(scale),
+                          lambda seed, scale=scale: FastWordCloud(width, height, scale, max_words=max_words,
+                                                                  random_state=seed)))
+        baseline = None
+        for name, make in modes:
+            seconds, wordcloud, image = render(make, top)
+            baseline = baseline or seconds
+            placed = [word for (word, _), _, _, _, _ in wordcloud.layout_]
+            print('{0:<10} {1:<16} {2:>7.0f} ms {3:>8.1f}x {4:>8} {5:>7.1%} {6:>9.1%} {7:>9.2%}'
+                  .format(max_words, name, seconds * 1000, baseline / seconds, len(placed),
+                          sum(top[word] for word in placed) / total, coverage(image), overlap(wordcloud, image)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+""" Check that TweetNormalizer splits the tweets exactly like clean_text, then compare their speed on 3200-tweet
+    timelines.
+
+    python -m benchmarks.bench_normalizer
+"""
+from benchmarks.common import load_fixture_tweets, make_settings, make_timeline, measure, report
+from main import TwitterWordCloudBot
+from normalizer import TweetNormalizer
+
+
+def check_identical(bot, normalizer, texts):
+    expected = [bot.clean_text(text) for text in texts]
+    for text, words, exp in zip(texts, normalizer.tokenize_many(texts), expected):
+        assert words == exp.split(), 'tokenize_many({0!r}) = {1!r}, expected {2!r}'.format(text, words, exp)
+        assert normalizer.normalize(text) == exp, 'normalize({0!r}) != {1!r}'.format(text, exp)
+
+
+def main():
+    settings = make_settings()
+    bot = TwitterWordCloudBot(None, None, {}, settings)
+    normalizer = TweetNormalizer()
+
+    fixture = load_fixture_tweets()
+    check_identical(bot, normalizer, fixture)
+    timelines = [[t['text'] for t in make_timeline(3200, seed=seed)] for seed in range(3)]
+    for texts in timelines:
+        check_identical(bot, normalizer, texts)
+    print('Same output as clean_text on {0} fixture tweets and {1} timeline tweets\n'
+          .format(len(fixture), sum(len(texts) for texts in timelines)))
+
+    print('{0:<40} {1:>13} {2:>14}'.format('3200 tweets', 'best time', 'peak memory'))
+    texts = timelines[0]
+    seconds, peak, _ = measure(lambda: [bot.clean_text(text).split() for text in texts])
+    report('clean_text + split', seconds, peak)
+    seconds, peak, _ = measure(lambda: [normalizer.tokenize(text) for text in texts])
+    report('TweetNormalizer.tokenize', seconds, peak)
+    seconds, peak, _ = measure(lambda: list(normalizer.tokenize_many(texts)))
+    report('TweetNormalizer.tokenize_many', seconds, peak)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+""" Simulate a week of mentions (quiet hours with a few scattered mentions and bursts of many) and compare polling
+    every 5 minutes with the adaptive PollSchedule: number of polls of mentions_timeline and how long a mention waits
+    before a poll downloads it.
+
+    python -m benchmarks.bench_polling
+"""
+import random
+
+from benchmarks.replay import percentile
+from poller import PollSchedule
+
+DURATION = 7 * 24 * 3600
+
+
+def make_arrivals(seed=0):
+    """
+    :return: sorted list of the times of the mentions, in seconds
+    """
+    rnd = random.Random(seed)
+    arrivals = []
+    for hour in range(DURATION // 3600):
+        start = hour * 3600
+        if rnd.random() < 0.2:
+            # a burst: somebody popular used the bot, their followers try it for ten minutes
+            rate, length = 1 / 20.0, 600
+        else:
+            rate, length = 1 / 1800.0, 3600
+        t = start + rnd.expovariate(rate)
+        while t < start + length:
+            arrivals.append(t)
+            t += rnd.expovariate(rate)
+    return sorted(arrivals)
+
+
+def simulate(arrivals, next_interval):
+    """
+    :param next_interval: function mapping the number of mentions found by a poll to the seconds until the next one
+    :return: (number of polls, list of the seconds every mention waited for a poll)
+    """
+    polls = 0
+    waits = []
+    t = 0.0
+    i = 0
+    while t < DURATION:
+        polls += 1
+        new = 0
+        while i < len(arrivals) and arrivals[i] <= t:
+            waits.append(t - arrivals[i])
+            i += 1
+            new += 1
+        t += next_interval(new)
+    return polls, sorted(waits)
+
+
+def main():
+    arrivals = make_arrivals()
+    print('{0} mentions in a week\n'.format(len(arrivals)))
+    print('{0:<20} {1:>8} {2:>12} {3:>12} {4:>12}'.format('', 'polls', 'median wait', 'p90 wait', 'max wait'))
+    schedules = [('every 5 minutes', lambda new: 300), ('adaptive', PollSchedule().next_interval)]
+    for name, next_interval in schedules:
+        polls, waits = simulate(arrivals, next_interval)
+        print('{0:<20} {1:>8} {2:>10.0f} s {3:>10.0f} s {4:>10.0f} s'
+              .format(name, polls, percentile(waits, 50), percentile(waits, 90), waits[-1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+""" Count the calls to the Twitter API needed to answer the same mentions with and without the users/lookup
+    pre-flight (preflightlookup), over two rounds of mentions: the accounts have timelines of several sizes, and some
+    requested accounts don't exist. In the second round the same accounts are requested again and they haven't
+    tweeted in the meantime.
+
+    python -m benchmarks.bench_preflight
+"""
+import contextlib
+import os
+
+from benchmarks.common import make_timeline
+from benchmarks.replay import make_mentions, make_replay_bot
+
+# number of tweets of every account
+SIZES = [20, 150, 199, 250, 420, 1000, 3200]
+MISSING = ['deleted{0}'.format(i) for i in range(3)]
+ENDPOINTS = ['users/lookup', 'statuses/user_timeline']
+
+
+def make_data(num_mentions):
+    accounts = ['account{0}'.format(i) for i in range(len(SIZES))]
+    timelines = {name: make_timeline(size, seed=i) for i, (name, size) in enumerate(zip(accounts, SIZES))}
+    rounds = []
+    for n in range(2):
+        mentions = make_mentions(num_mentions, accounts + MISSING, seed=n, first_id=10**18 + n * num_mentions)
+        rounds.append(mentions)
+    return rounds, timelines
+
+
+def run(preflight, rounds, timelines):
+    """
+    :return: (dict mapping every endpoint to its number of calls, number of replies)
+    """
+    bot, replay_twitter, _ = make_replay_bot([], timelines, preflightlookup=preflight)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for mentions in rounds:
+            replay_twitter.mentions = sorted(replay_twitter.mentions + mentions, key=lambda m: -m['id'])
+            bot.handle_mentions()
+    counts = replay_twitter.faults.counts
+    return {e: counts[e, 'ok'] for e in ENDPOINTS}, len(replay_twitter.replies)
+
+
+def main():
+    rounds, timelines = make_data(40)
+    print('{0:<16} {1:>14} {2:>14} {3:>8} {4:>9}'.format('', 'users/lookup', 'user_timeline', 'total', 'replies'))
+    for preflight in (False, True):
+        calls, replies = run(preflight, rounds, timelines)
+        print('{0:<16} {1:>14} {2:>14} {3:>8} {4:>9}'.format('pre-flight' if preflight else 'no pre-flight',
+                                                             calls['users/lookup'], calls['statuses/user_timeline'],
+                                                             sum(calls.values()), replies))
+
+
+if __name__ == '__main__':
+    main()
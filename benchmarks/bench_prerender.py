@@ -0,0 +1,65 @@
+""" Replay two batches of mentions with new tweets posted in between, and compare answering the second batch with and
+    without the Prerenderer refreshing the word clouds of the popular accounts while the bot was idle: word clouds
+    rendered and uploaded while answering, and how long every mention of the second batch waits for its reply.
+
+    python -m benchmarks.bench_prerender
+"""
+import io
+import time
+from contextlib import redirect_stdout
+
+from benchmarks.common import make_timeline
+from benchmarks.replay import make_mentions, make_replay_bot, make_timelines, percentile
+
+ACCOUNTS = ['account{0}'.format(i) for i in range(20)]
+MENTIONS = 60
+NEW_TWEETS = 5
+
+
+def run(prerender):
+    """
+    :return: (renders, uploads, sorted list of the seconds every reply of the second batch waited, idle seconds spent
+             refreshing)
+    """
+    first = make_mentions(MENTIONS, ACCOUNTS, seed=1)
+    # the time between the batches is compressed: look up the profiles every time, refresh the word clouds right away
+    bot, tw, im = make_replay_bot(first, make_timelines(ACCOUNTS, 800), width=640, height=480, profilettl=0,
+                                  prerender=prerender, prerenderinterval=0, prerendertargets=5)
+    bot.handle_mentions()
+
+    # the accounts tweet, then the bot is idle until the next poll
+    for i, name in enumerate(ACCOUNTS):
+        tw.timelines[name] = make_timeline(NEW_TWEETS, seed=100 + i, first_id=10**17 + 10**6) + tw.timelines[name]
+    start = time.perf_counter()
+    if bot.prerenderer is not None:
+        bot.prerenderer.run()
+    idle = time.perf_counter() - start
+
+    tw.mentions = make_mentions(MENTIONS, ACCOUNTS, seed=2, first_id=10**18 + 10**6)
+    renders = len(bot.stage_times.samples.get('render', []))
+    uploads = im.uploads
+    start = time.perf_counter()
+    waits = []
+    post_status = bot.post_status
+
+    def timed_post_status(status, in_reply_to_status_id):
+        result = post_status(status, in_reply_to_status_id)
+        waits.append(time.perf_counter() - start)
+        return result
+    bot.post_status = timed_post_status
+    bot.handle_mentions()
+    return (len(bot.stage_times.samples.get('render', [])) - renders, im.uploads - uploads, sorted(waits), idle)
+
+
+def main():
+    print('{0:<14} {1:>8} {2:>8} {3:>10} {4:>10} {5:>10} {6:>10}'
+          .format('', 'renders', 'uploads', 'p50', 'p90', 'max', 'idle'))
+    for name, prerender in [('on request', False), ('prerendered', True)]:
+        with redirect_stdout(io.StringIO()):
+            renders, uploads, waits, idle = run(prerender)
+        print('{0:<14} {1:>8} {2:>8} {3:>8.2f} s {4:>8.2f} s {5:>8.2f} s {6:>8.2f} s'
+              .format(name, renders, uploads, percentile(waits, 50), percentile(waits, 90), waits[-1], idle))
+
+
+if __name__ == '__main__':
+    main()
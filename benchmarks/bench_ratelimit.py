@@ -0,0 +1,51 @@
+""" Run TwitterApi against a local FakeTwitterServer with tiny rate limit windows: timeline harvesting exhausts its
+    endpoint while replies keep flowing, and the rate limiter should pace the calls so that no 429 is ever returned.
+
+    python -m benchmarks.bench_ratelimit
+"""
+import threading
+import time
+
+from benchmarks.fake_twitter import FakeTwitter, FakeTwitterServer, make_tweets
+from twitterapi import TwitterApi
+
+WINDOW_SECONDS = 5
+
+
+def main():
+    fake = FakeTwitter(limits={'statuses/user_timeline': 6, 'statuses/update': 20}, window_seconds=WINDOW_SECONDS)
+    for name in ['alice', 'bob', 'carol']:
+        fake.timelines[name] = make_tweets(1000)
+
+    with FakeTwitterServer(fake) as server:
+        api = TwitterApi('key', 'secret', 'token', 'token-secret', domain=server.domain, secure=False)
+        start = time.time()
+        done = {}
+
+        def harvest():
+            for name in ['alice', 'bob', 'carol']:
+                tweets = api.harvest_user_timeline(screen_name=name, max_results=1000)
+                assert len(tweets) == 1000
+            done['harvest'] = time.time() - start
+
+        def reply():
+            for i in range(10):
+                api.reply_tweet('@someone reply {0}'.format(i), str(i))
+            done['reply'] = time.time() - start
+
+        threads = [threading.Thread(target=harvest), threading.Thread(target=reply)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    print('user_timeline: {0} calls, {1} rate limited, 15 pages done after {2:.1f} seconds'
+          .format(fake.calls['statuses/user_timeline'], fake.rate_limited['statuses/user_timeline'], done['harvest']))
+    print('update:        {0} calls, {1} rate limited, 10 replies done after {2:.1f} seconds'
+          .format(fake.calls['statuses/update'], fake.rate_limited['statuses/update'], done['reply']))
+    assert fake.rate_limited['statuses/update'] == 0
+    assert done['reply'] < WINDOW_SECONDS, 'the replies waited for the timeline rate limit'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+""" Compare the memory taken by the full objects of the Twitter API with the compact records the bot keeps instead
+    (see records.py): a harvest of 3200 tweets, a backlog of 1000 mentions, and the disk taken by the same backlog in
+    the mention journal and by the harvest in the tweet cache.
+
+    python -m benchmarks.bench_records
+"""
+import json
+import os
+import pickle
+import tempfile
+import tracemalloc
+
+from benchmarks.common import make_timeline
+from benchmarks.replay import make_mentions
+from mentionjournal import MentionJournal
+from records import Mention, Tweet
+
+NUM_TWEETS = 3200
+NUM_MENTIONS = 1000
+
+
+def api_user(screen_name, user_id):
+    """
+    :return: a user object like the ones embedded in the tweets of the Twitter API
+    """
+    return {'id': user_id, 'id_str': str(user_id), 'name': screen_name.title(), 'screen_name': screen_name,
+            'location': 'Somewhere, Earth', 'description': 'Just a synthetic account for the benchmarks #bench',
+            'url': 'https://t.co/abcdefghij', 'entities': {'url': {'urls': [{
+                'url': 'https://t.co/abcdefghij', 'expanded_url': 'https://example.com/' + screen_name,
+                'display_url': 'example.com/' + screen_name, 'indices': [0, 23]}]}, 'description': {'urls': []}},
+            'protected': False, 'followers_count': 1234, 'friends_count': 567, 'listed_count': 8,
+            'created_at': 'Sat Mar 14 15:09:26 +0000 2015', 'favourites_count': 910, 'utc_offset': None,
+            'time_zone': None, 'geo_enabled': False, 'verified': False, 'statuses_count': 4321, 'lang': None,
+            'contributors_enabled': False, 'is_translator': False, 'is_translation_enabled': False,
+            'profile_background_color': 'C0DEED',
+            'profile_background_image_url': 'http://abs.twimg.com/images/themes/theme1/bg.png',
+            'profile_background_image_url_https': 'https://abs.twimg.com/images/themes/theme1/bg.png',
+            'profile_background_tile': False,
+            'profile_image_url': 'http://pbs.twimg.com/profile_images/1234567890/abcdefgh_normal.jpg',
+            'profile_image_url_https': 'https://pbs.twimg.com/profile_images/1234567890/abcdefgh_normal.jpg',
+            'profile_banner_url': 'https://pbs.twimg.com/profile_banners/1234567890/1500000000',
+            'profile_link_color': '1DA1F2', 'profile_sidebar_border_color': 'C0DEED',
+            'profile_sidebar_fill_color': 'DDEEF6', 'profile_text_color': '333333',
+            'profile_use_background_image': True, 'has_extended_profile': False, 'default_profile': True,
+            'default_profile_image': False, 'following': False, 'follow_request_sent': False,
+            'notifications': False, 'translator_type': 'none'}
+
+
+def api_tweet(tweet_id, text, lang, user, hashtags=(), user_mentions=()):
+    """
+    :param user: user object of the author, or only its ids for the timelines downloaded with trim_user
+    :return: a tweet object of the Twitter API
+    """
+    return {'created_at': 'Wed Oct 10 20:19:24 +0000 2018', 'id': tweet_id, 'id_str': str(tweet_id), 'text': text,
+            'truncated': False,
+            'entities': {'hashtags': [{'text': h, 'indices': [0, len(h) + 1]} for h in hashtags], 'symbols': [],
+                         'user_mentions': [{'screen_name': u, 'name': u.title(), 'id': 1000 + i,
+                                            'id_str': str(1000 + i), 'indices': [0, len(u) + 1]}
+                                           for i, u in enumerate(user_mentions)],
+                         'urls': []},
+            'source': '<a href="http://twitter.com/download/android" rel="nofollow">Twitter for Android</a>',
+            'in_reply_to_status_id': None, 'in_reply_to_status_id_str': None, 'in_reply_to_user_id': None,
+            'in_reply_to_user_id_str': None, 'in_reply_to_screen_name': None, 'user': user, 'geo': None,
+            'coordinates': None, 'place': None, 'contributors': None, 'is_quote_status': False,
+            'retweet_count': 3, 'favorite_count': 7, 'favorited': False, 'retweeted': False,
+            'possibly_sensitive': False, 'lang': lang}
+
+
+def measure(build):
+    """
+    :return: (bytes allocated by python for the result of build, result)
+    """
+    tracemalloc.start()
+    result = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, result
+
+
+def report(name, full, compact, unit):
+    print('{0:<32} {1:>10.1f} KiB {2:>10.1f} KiB {3:>8.1f}x {4:>12.0f} B'
+          .format(name, full / 1024., compact / 1024., full / float(compact), compact / float(unit)))
+
+
+def main():
+    # the responses of the API as downloaded, parsed like the twitter library does
+    timeline = json.dumps([api_tweet(t['id'], t['text'], t.get('lang'), {'id': 42, 'id_str': '42'})
+                           for t in make_timeline(NUM_TWEETS)])
+    mentions = json.dumps([api_tweet(m['id'], m['text'], 'en', api_user(m['user']['screen_name'], 42),
+                                     [h['text'] for h in m['entities']['hashtags']],
+                                     [u['screen_name'] for u in m['entities']['user_mentions']])
+                           for m in make_mentions(NUM_MENTIONS, ['account{0}'.format(i) for i in range(50)])])
+
+    print('{0:<32} {1:>14} {2:>14} {3:>9} {4:>14}'.format('', 'api objects', 'records', 'ratio', 'per record'))
+    full, _ = measure(lambda: json.loads(timeline))
+    compact, tweets = measure(lambda: [Tweet.from_json(t) for t in json.loads(timeline)])
+    report('harvest of {0} tweets'.format(NUM_TWEETS), full, compact, NUM_TWEETS)
+    full, api_mentions = measure(lambda: json.loads(mentions))
+    compact, backlog = measure(lambda: [Mention.from_json(m) for m in json.loads(mentions)])
+    report('backlog of {0} mentions'.format(NUM_MENTIONS), full, compact, NUM_MENTIONS)
+
+    # on disk: the journal wrote the whole mention objects, the tweet cache pickled the whole tweet objects
+    tmp_dir = tempfile.mkdtemp(prefix='wordcloud-bench-')
+    full_path = os.path.join(tmp_dir, 'full.journal')
+    with open(full_path, 'wb') as f:
+        for m in reversed(api_mentions):
+            f.write('+ {0} {1}\n'.format(m['id_str'], json.dumps(m, separators=(',', ':'))).encode('utf-8'))
+    journal = MentionJournal(os.path.join(tmp_dir, 'compact.journal'), fsync_every=0)
+    journal.add(backlog)
+    journal.close()
+    report('journal of {0} mentions'.format(NUM_MENTIONS), os.path.getsize(full_path), os.path.getsize(journal.path),
+           NUM_MENTIONS)
+    report('tweet cache of {0} tweets'.format(NUM_TWEETS), len(pickle.dumps(json.loads(timeline))),
+           len(pickle.dumps(tweets)), NUM_TWEETS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+""" Replay mentions and timelines through the bot with stand-ins for Twitter and imgur (see benchmarks.replay), and
+    report the throughput, the latency percentiles of every stage and the peak RSS of:
+    - clean_tweets: counting the words of the timelines
+    - make_wordcloud: harvesting the timelines and rendering their word clouds
+    - loop: handle_mentions (or handle_mentions_pipelined with --pipeline) on all the mentions
+
+    Every scenario runs in its own process, so that its peak RSS is its own. The data and the injected faults only
+    depend on --seed, so two runs do the same work: save the results of a run with --output and check a later run
+    against them with --baseline, which fails if a throughput drops by more than --tolerance.
+
+    python -m benchmarks.bench_replay
+    python -m benchmarks.bench_replay --latency 0.05 --error-rate 0.05 --rate-limit-rate 0.02 --pipeline
+    python -m benchmarks.bench_replay --output baseline.json
+    python -m benchmarks.bench_replay --baseline baseline.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.common import as_harvested
+from benchmarks.replay import Faults, load_recording, make_mentions, make_replay_bot, make_timelines
+
+SCENARIOS = ['clean_tweets', 'make_wordcloud', 'loop']
+
+
+def peak_rss_kib():
+    """
+    :return: peak resident set size of this process in KiB
+    """
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KiB elsewhere
+    return peak / 1024 if sys.platform == 'darwin' else peak
+
+
+def load_data(args):
+    """
+    :return: (list of mentions, dict of timelines)
+    """
+    if args.recording:
+        return load_recording(args.recording)
+    accounts = ['account{0}'.format(i) for i in range(args.accounts)]
+    return make_mentions(args.mentions, accounts, seed=args.seed), \
+           make_timelines(accounts, args.tweets, seed=args.seed)
+
+
+def make_bot(args, mentions, timelines):
+    twitter_faults = Faults(args.latency, args.jitter, args.error_rate, args.rate_limit_rate, seed=args.seed)
+    imgur_faults = Faults(args.upload_latency, args.jitter, args.error_rate, args.rate_limit_rate, seed=args.seed)
+    configs = {'width': args.width, 'height': args.height, 'pipeline': args.pipeline}
+    return make_replay_bot(mentions, timelines, twitter_faults, imgur_faults, rate_limit_wait=args.rate_limit_wait,
+                           **configs)
+
+
+def run_scenario(name, args):
+    """ Run a scenario in this process, the output of the bot is discarded.
+    :return: dict of the results
+    """
+    mentions, timelines = load_data(args)
+    bot, replay_twitter, replay_imgur = make_bot(args, mentions, timelines)
+    result = {'scenario': name}
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        harvested = [as_harvested(tweets) for tweets in timelines.values()]
+        start = time.perf_counter()
+        if name == 'clean_tweets':
+            for tweets in harvested:
+                with bot.stage_times.time('frequencies'):
+                    bot.clean_tweets(tweets)
+            items, unit = sum(len(tweets) for tweets in timelines.values()), 'tweets'
+        elif name == 'make_wordcloud':
+            for screen_name in timelines:
+                bot.make_wordcloud(screen_name)
+            items, unit = len(timelines), 'word clouds'
+        else:
+            if args.pipeline:
+                items = bot.handle_mentions_pipelined()
+            else:
+                items = bot.handle_mentions()
+            unit = 'mentions'
+        seconds = time.perf_counter() - start
+
+    result.update({'seconds': seconds, 'items': items, 'unit': unit, 'throughput': items / seconds,
+                   'stages': bot.stage_times.summary(), 'peak_rss_kib': peak_rss_kib()})
+    if name == 'loop':
+        result['replies'] = len(replay_twitter.replies)
+        result['uploads'] = replay_imgur.uploads
+        result['calls'] = dict(replay_twitter.faults.summary(), **replay_imgur.faults.summary())
+    return result
+
+
+def run_in_child(name, argv):
+    """ Run a scenario in a new process.
+    :return: dict of the results
+    """
+    output = subprocess.check_output([sys.executable, '-m', 'benchmarks.bench_replay', '--scenario', name] + argv)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def print_result(result):
+    print('{0}: {1} {2} in {3:.2f} s, {4:.1f} {2}/s, peak RSS {5:.1f} MiB'
+          .format(result['scenario'], result['items'], result['unit'], result['seconds'], result['throughput'],
+                  result['peak_rss_kib'] / 1024))
+    for stage, times in sorted(result['stages'].items()):
+        print('    {0:<12} {1:>6} calls  p50 {2:>9.2f} ms  p90 {3:>9.2f} ms  p99 {4:>9.2f} ms'
+              .format(stage, times['count'], times['p50'] * 1000, times['p90'] * 1000, times['p99'] * 1000))
+    if 'replies' in result:
+        print('    {0} replies, {1} uploads'.format(result['replies'], result['uploads']))
+        for call, count in sorted(result['calls'].items()):
+            print('    {0:<40} {1:>6}'.format(call, count))
+
+
+def check_baseline(results, baseline_path, tolerance):
+    """
+    :return: list of the scenarios whose throughput dropped by more than tolerance
+    """
+    with open(baseline_path, 'r') as f:
+        baseline = {r['scenario']: r for r in json.load(f)}
+    regressions = []
+    for result in results:
+        expected = baseline.get(result['scenario'])
+        if expected is None:
+            continue
+        change = result['throughput'] / expected['throughput'] - 1
+        print('{0}: {1:+.1%} throughput against the baseline'.format(result['scenario'], change))
+        if change < -tolerance:
+            regressions.append(result['scenario'])
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', choices=SCENARIOS, help='run a single scenario in this process')
+    parser.add_argument('--recording', help='json file saved by benchmarks.replay.save_recording, '
+                                            'instead of synthetic data')
+    parser.add_argument('--mentions', type=int, default=60, help='number of synthetic mentions')
+    parser.add_argument('--accounts', type=int, default=12, help='number of synthetic accounts')
+    parser.add_argument('--tweets', type=int, default=1600, help='number of tweets of every synthetic account')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds every call to Twitter takes')
+    parser.add_argument('--upload-latency', type=float, default=0.0, help='seconds every upload takes')
+    parser.add_argument('--jitter', type=float, default=0.0, help='max seconds added to the latency of a call')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of the calls with an error')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='fraction of the calls with a 429')
+    parser.add_argument('--rate-limit-wait', type=float, default=1, help='seconds to wait after a 429')
+    parser.add_argument('--width', type=int, default=400)
+    parser.add_argument('--height', type=int, default=300)
+    parser.add_argument('--pipeline', action='store_true', help='use handle_mentions_pipelined in the loop')
+    parser.add_argument('--output', help='save the results to this json file')
+    parser.add_argument('--baseline', help='json file saved with --output to compare the results with')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='max relative drop of throughput against the baseline')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    if args.scenario:
+        print(json.dumps(run_scenario(args.scenario, args)))
+        return
+
+    child_argv = [a for a in argv if a not in ('--output', args.output, '--baseline', args.baseline)]
+    results = []
+    for name in SCENARIOS:
+        result = run_in_child(name, child_argv)
+        print_result(result)
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        regressions = check_baseline(results, args.baseline, args.tolerance)
+        if regressions:
+            print('Regressions: ' + ', '.join(regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+""" Replay a batch of mentions against a flaky imgur and compare retrying the failed uploads right away, sleeping
+    RETRY_SECONDS between the attempts like the bot used to do, with parking them in the RetryQueue: how long the batch
+    keeps the mention loop busy, how long every mention waits for its reply (the parked ones until their retry
+    succeeds), the mentions left without a reply and the word clouds rendered. RETRY_SECONDS stands for the minute the
+    bot waits with the real services.
+
+    python -m benchmarks.bench_retry
+"""
+import io
+import os
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+from benchmarks.replay import Faults, make_mentions, make_replay_bot, make_timelines, percentile
+
+ACCOUNTS = ['account{0}'.format(i) for i in range(30)]
+MENTIONS = 60
+RETRY_SECONDS = 1.0
+IMGUR_ERROR_RATE = 0.3
+
+
+def run(park):
+    """
+    :return: (seconds the batch kept the mention loop busy, sorted list of the seconds every reply waited, mentions
+              answered, word clouds rendered)
+    """
+    configs = {}
+    if park:
+        configs = {'retryqueue': os.path.join(tempfile.mkdtemp(prefix='wordcloud-bench-'), 'retries.sqlite'),
+                   'retrybasedelay': RETRY_SECONDS, 'retrymaxdelay': 8 * RETRY_SECONDS}
+    bot, tw, im = make_replay_bot(make_mentions(MENTIONS, ACCOUNTS, seed=3), make_timelines(ACCOUNTS, 400),
+                                  imgur_faults=Faults(latency=0.05, error_rate=IMGUR_ERROR_RATE, seed=5),
+                                  width=640, height=480, **configs)
+    bot.retry_seconds = RETRY_SECONDS
+    start = time.perf_counter()
+    waits = []
+    post_status = bot.post_status
+
+    def timed_post_status(status, in_reply_to_status_id):
+        result = post_status(status, in_reply_to_status_id)
+        if result is not None:
+            waits.append(time.perf_counter() - start)
+        return result
+    bot.post_status = timed_post_status
+    bot.handle_mentions(poll=True)
+    busy = time.perf_counter() - start
+    # the parked uploads are tried again while the bot waits for the next mentions
+    while bot.retry_queue is not None and len(bot.retry_queue):
+        bot.idle(RETRY_SECONDS / 4)
+    return busy, sorted(waits), len(tw.replies), len(bot.stage_times.samples.get('render', []))
+
+
+def main():
+    print('{0} mentions, {1:.0%} of the uploads fail, {2:.0f} s between the retries\n'
+          .format(MENTIONS, IMGUR_ERROR_RATE, RETRY_SECONDS))
+    print('{0:<8} {1:>10} {2:>9} {3:>9} {4:>9} {5:>9} {6:>8}'
+          .format('', 'loop busy', 'p50', 'p90', 'max', 'answered', 'renders'))
+    for name, park in [('inline', False), ('parked', True)]:
+        with redirect_stdout(io.StringIO()):
+            busy, waits, answered, renders = run(park)
+        print('{0:<8} {1:>8.2f} s {2:>7.2f} s {3:>7.2f} s {4:>7.2f} s {5:>9} {6:>8}'
+              .format(name, busy, percentile(waits, 50), percentile(waits, 90), waits[-1], answered, renders))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+""" Compare the cold start of every mode of the bot (see main.main) when the rendering stack and imgurpython are
+    imported up front, like the bot used to do, with the lazy imports: every mode starts in a new interpreter, builds
+    the bot and stops before its first call to Twitter. The modes that render also build a first word cloud and
+    import the imgur client, which pay for the imports the lazy start skipped. The bot used to build the ImgurClient
+    up front too, which also asks imgur for the credits left: that request is not counted.
+
+    python -m benchmarks.bench_startup
+"""
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks.common import make_settings
+
+REPEATS = 5
+
+# modes of main.main -> True if the mode renders word clouds
+MODES = [('collect', False), ('poller', False), ('backlog', True), ('worker', True), ('run', True)]
+
+# the modules main.py used to import before building the bot
+EAGER_IMPORTS = 'import asyncio, imgurpython, layout, renderer'
+
+HEAVY_MODULES = ['wordcloud', 'numpy', 'PIL', 'matplotlib', 'imgurpython', 'requests', 'asyncio']
+
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+{eager}
+import main
+bot = main.make_bot(main.Settings(sys.argv[1]))
+ready = time.perf_counter() - start
+heavy = sorted(m for m in sys.argv[3:] if m in sys.modules)
+modules = len(sys.modules)
+first = None
+if sys.argv[2] == 'render':
+    start = time.perf_counter()
+    bot.render_image({{'cold': 3, 'start': 2, 'benchmark': 1}})
+    # building the ImgurClient would ask imgur for the credits left, time only its import
+    from imgurpython import ImgurClient
+    first = time.perf_counter() - start
+print(json.dumps({{'ready': ready, 'first': first, 'modules': modules, 'heavy': heavy}}))
+'''
+
+
+def write_settings():
+    """
+    :return: path to a settings.ini with made-up accounts
+    """
+    settings = make_settings()
+    settings.config[settings.CONFIGS]['workqueue'] = os.path.join(os.path.dirname(settings.settings_file), 'queue.db')
+    settings.config.read_dict({settings.TWITTER: {'consumerkey': 'key', 'consumersecret': 'secret',
+                                                  'accesstoken': 'token', 'accesstokensecret': 'secret'},
+                               settings.IMGUR: {'clientid': 'id', 'clientsecret': 'secret',
+                                                'accesstoken': 'token', 'refreshtoken': 'token'}})
+    with open(settings.settings_file, 'w') as f:
+        settings.config.write(f)
+    return settings.settings_file
+
+
+def start(settings_file, renders, eager):
+    """ Start the bot in a new interpreter REPEATS times.
+    :return: (best time to build the bot, best time to build it and its first word cloud or None, the last run)
+    """
+    code = CHILD.format(eager=EAGER_IMPORTS if eager else '')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    runs = []
+    for _ in range(REPEATS):
+        output = subprocess.check_output([sys.executable, '-c', code, settings_file,
+                                          'render' if renders else 'none'] + HEAVY_MODULES, cwd=root)
+        runs.append(json.loads(output.decode('utf-8').strip().splitlines()[-1]))
+    first = min(r['ready'] + r['first'] for r in runs) if renders else None
+    return min(r['ready'] for r in runs), first, runs[-1]
+
+
+def main():
+    settings_file = write_settings()
+    print('{0:<9} {1:>11} {2:>11} {3:>8} {4:>9} {5:>15} {6:>14}  {7}'
+          .format('mode', 'start eager', 'start lazy', 'speedup', 'modules', '1st cloud eager', '1st cloud lazy',
+                  'heavy modules'))
+    for mode, renders in MODES:
+        eager, eager_first, eager_run = start(settings_file, renders, True)
+        lazy, lazy_first, lazy_run = start(settings_file, renders, False)
+        first = ''
+        if renders:
+            first = '{0:>12.0f} ms {1:>11.0f} ms'.format(eager_first * 1000, lazy_first * 1000)
+        print('{0:<9} {1:>8.0f} ms {2:>8.0f} ms {3:>7.1f}x {4:>4}/{5:<4} {6:<30}  {7}'
+              .format(mode, eager * 1000, lazy * 1000, eager / lazy, lazy_run['modules'], eager_run['modules'],
+                      first, ', '.join(lazy_run['heavy']) or '-'))
+
+if __name__ == '__main__':
+    main()
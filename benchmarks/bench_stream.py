@@ -0,0 +1,47 @@
+""" Compare harvesting whole timelines then counting their words (the default) with the streaming harvest, which
+    counts every page in a bounded sketch and stops when the most frequent words are stable: pages downloaded, peak
+    memory, time and how much of the exact word cloud the streamed one keeps.
+
+    python -m benchmarks.bench_stream
+"""
+import contextlib
+import os
+import time
+import tracemalloc
+
+from benchmarks.replay import make_mentions, make_replay_bot, make_timelines
+
+ACCOUNTS = ['account{0}'.format(i) for i in range(4)]
+
+
+def fetch_all(bot):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return {name: bot.fetch_wordcloud(name)[2] for name in ACCOUNTS}
+
+
+def main():
+    timelines = make_timelines(ACCOUNTS, 3200)
+    results = {}
+    print('{0:<10} {1:>8} {2:>12} {3:>14} {4:>14}'.format('', 'pages', 'time', 'peak memory', 'cloud kept'))
+    for stream in (False, True):
+        bot, replay_twitter, _ = make_replay_bot(make_mentions(1, ACCOUNTS), timelines, streamharvest=stream)
+        tracemalloc.start()
+        start = time.perf_counter()
+        results[stream] = fetch_all(bot)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # share of the exact word cloud (by word counts) among the words of this one
+        kept = []
+        for name in ACCOUNTS:
+            exact = dict(results[False][name].most_common(bot.MAX_WORDS))
+            words = results[stream][name]
+            kept.append(sum(c for w, c in exact.items() if w in words) / float(sum(exact.values())))
+        pages = replay_twitter.faults.counts['statuses/user_timeline', 'ok']
+        print('{0:<10} {1:>8} {2:>9.2f} s {3:>10.1f} KiB {4:>13.1%}'
+              .format('stream' if stream else 'full', pages, elapsed, peak / 1024, min(kept)))
+
+
+if __name__ == '__main__':
+    main()
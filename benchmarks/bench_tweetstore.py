@@ -0,0 +1,117 @@
+""" Compare counting the words of the tweets again for every word cloud (clean_tweets) with the counts kept by the
+    TweetStore: the word cloud of one account, of several accounts and of the last 7 days of several accounts, and
+    the cost of adding the new tweets of an account to the store. The top words must be the same, and only an
+    explicit "last N days" must ask for the tweets of the last days.
+
+    python -m benchmarks.bench_tweetstore
+"""
+import os
+import tempfile
+import time
+from collections import Counter
+
+from benchmarks.common import as_harvested, make_settings, make_timeline, measure
+from main import TwitterWordCloudBot
+from metrics import TWITTER_EPOCH, snowflake_time
+from records import Mention
+from tweetstore import TweetStore
+
+ACCOUNTS = ['account{0}'.format(i) for i in range(5)]
+DAYS = 7
+NEW_TWEETS = 20
+
+
+def make_timelines(now):
+    """
+    :return: dict mapping every account to a timeline with a tweet every 6 hours up to now, with real tweet ids
+    """
+    timelines = {}
+    for n, name in enumerate(ACCOUNTS):
+        tweets = make_timeline(3200 + NEW_TWEETS, seed=n)
+        for i, tweet in enumerate(tweets):
+            posted_ms = int((now - i * 6 * 3600) * 1000)
+            tweet['id'] = ((posted_ms - TWITTER_EPOCH) << 22) + n
+            tweet['id_str'] = str(tweet['id'])
+        timelines[name] = as_harvested(tweets)
+    return timelines
+
+
+def recent(tweets, days, now):
+    today = TweetStore.today(now)
+    return [t for t in tweets if snowflake_time(t.id) // (24 * 3600) > today - days]
+
+
+# text of a mention -> days of the window it asks for
+QUERY_DAYS = {
+    '@bot #wordcloud last 7 days': 7,
+    '@bot #wordcloud @alice last 30 days': 30,
+    '@bot last 1 day #wordcloud': 1,
+    '@bot #wordcloud LAST 14 Days please': 14,
+    '@bot #wordcloud': None,
+    '@bot #wordcloud 7 days': None,
+    '@bot #wordcloud 30d': None,
+    '@bot #wordcloud of my 3d printer tweets': None,
+    '@bot #wordcloud I tweeted a lot these 2 days': None,
+    '@bot #wordcloud what did I say in the last 2 days': None,
+    '@bot #wordcloud #last7days': None,
+}
+
+
+def check_query_days(bot):
+    for text, days in QUERY_DAYS.items():
+        query = bot.parse_query(Mention('1', text, 'alice', ['wordcloud'], ['bot']))
+        parsed = query.days if query is not None else None
+        assert parsed == days, 'parse_query({0!r}) asks for {1} days, expected {2}'.format(text, parsed, days)
+
+
+def report(name, clean, store, same):
+    print('{0:<28} {1:>9.1f} ms {2:>9.1f} ms {3:>8.0f}x {4:>10}'
+          .format(name, clean * 1000, store * 1000, clean / store, 'yes' if same else 'NO'))
+
+
+def main():
+    now = time.time()
+    timelines = make_timelines(now)
+    settings = make_settings()
+    bot = TwitterWordCloudBot(None, None, settings.read_stopwords(), settings)
+    store = TweetStore(os.path.join(tempfile.mkdtemp(prefix='wordcloud-bench-'), 'tweets.db'))
+    bot.tweet_store = store
+    check_query_days(bot)
+    print('parse_query found the days of {0} mentions\n'.format(len(QUERY_DAYS)))
+    max_words = bot.MAX_WORDS
+
+    # the store holds the timelines without the newest tweets, then they arrive
+    start = time.perf_counter()
+    for name, tweets in timelines.items():
+        store.add(name, tweets[NEW_TWEETS:], bot.tweet_words)
+    load = time.perf_counter() - start
+    start = time.perf_counter()
+    store.add(ACCOUNTS[0], timelines[ACCOUNTS[0]], bot.tweet_words)
+    update = time.perf_counter() - start
+    for name in ACCOUNTS[1:]:
+        store.add(name, timelines[name], bot.tweet_words)
+    print('store {0} timelines of 3200 tweets: {1:.0f} ms, add {2} new tweets: {3:.1f} ms\n'
+          .format(len(ACCOUNTS), load * 1000, NEW_TWEETS, update * 1000))
+
+    def top(counter):
+        return dict(counter.most_common(max_words))
+
+    print('{0:<28} {1:>12} {2:>12} {3:>9} {4:>10}'.format('', 'clean_tweets', 'store', 'speedup', 'same top'))
+    cases = [('one account', ACCOUNTS[:1], None), ('{0} accounts'.format(len(ACCOUNTS)), ACCOUNTS, None),
+             ('{0} accounts, {1} days'.format(len(ACCOUNTS), DAYS), ACCOUNTS, DAYS)]
+    for name, users, days in cases:
+        timelines_of = [timelines[user][:3200] for user in users]
+        if days is not None:
+            timelines_of = [recent(tweets, days, now) for tweets in timelines_of]
+        # every timeline is cleaned on its own, like the word cloud of every account
+        clean, _, expected = measure(lambda: sum((bot.clean_tweets(tweets) for tweets in timelines_of), Counter()))
+        # the plurals are folded like stored_frequencies does
+        stored, _, counts = measure(lambda: Counter(dict(bot.normalizer.fold_plurals(
+            store.terms(users, days, now=now)).most_common(max_words))))
+        # counts of the same words, the order of the ties may differ
+        same = all(counts[w] == c for w, c in top(expected).items() if c > min(counts.values()))
+        report(name, clean, stored, same)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+""" Helpers shared by the benchmarks. Run the benchmarks from the root of the repository, e.g.
+    python -m benchmarks.bench_frequencies
+"""
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from records import Tweet
+from settings import Settings
+
+
+VOCABULARY_SIZE = 5000
+LANGS = ['en', 'en', 'en', 'it', 'es', 'fr', 'de', 'ja']
+
+
+def make_settings(**configs):
+    """ Build a Settings object without a settings.ini, every file the bot writes goes into a temporary directory.
+    :param configs: values overriding the defaults of the [configs] section
+    :return: Settings object
+    """
+    tmp_dir = tempfile.mkdtemp(prefix='wordcloud-bench-')
+    defaults = {'lastmentionid': '1',
+                'botname': 'benchbot',
+                'wordcloudhashtag': 'wordcloud',
+                'maxwords': '80',
+                'outputdir': os.path.join(tmp_dir, 'output'),
+                'maxresults': '3200',
+                'width': '1280',
+                'height': '960',
+                'descriptionimagestr': '(benchmark)',
+                'tweetcachedir': os.path.join(tmp_dir, 'cache'),
+                'mentionsjournal': os.path.join(tmp_dir, 'mentions.journal')}
+    defaults.update({k: str(v) for k, v in configs.items()})
+    os.makedirs(defaults['outputdir'], exist_ok=True)
+    settings = Settings(os.path.join(tmp_dir, 'settings.ini'))
+    settings.config.read_dict({settings.CONFIGS: defaults})
+    return settings
+
+
+def load_fixture_tweets():
+    """
+    :return: list of tweet texts full of corner cases (entities, links, emails, mentions, unicode, whitespace)
+    """
+    with open(os.path.join(os.path.dirname(__file__), 'fixtures', 'tweets.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def make_timeline(num_tweets=3200, seed=0, first_id=10**17):
+    """ Build a deterministic synthetic timeline that looks like the output of harvest_user_timeline:
+        a mix of languages, retweets, mentions, links, emails, html entities and punctuation.
+    :param num_tweets: number of tweets
+    :param seed: seed of the random generator
+    :param first_id: id of the oldest tweet
+    :return: list of tweets, the newest at the top
+    """
+    rnd = random.Random(seed)
+    with open('assets/stopwords-en.txt', 'r', encoding='utf-8-sig') as f:
+        stopwords = f.read().split()
+    vocabulary = [''.join(rnd.choice('abcdefghijklmnopqrstuvwxyzàèéìòù') for _ in range(rnd.randint(2, 12)))
+                  for _ in range(VOCABULARY_SIZE)]
+    extras = ['@someone', '@other_user', 'http://t.co/abc123', 'https://example.com/a/b?c=d', 'me@example.com',
+              '&amp;', '&lt;3', '#hashtag', '!!!', '...', '2015', ':)', 'l\'amore']
+    tweets = []
+    for i in range(num_tweets):
+        words = []
+        for _ in range(rnd.randint(5, 25)):
+            r = rnd.random()
+            if r < 0.35:
+                words.append(rnd.choice(stopwords))
+            elif r < 0.9:
+                # zipf-like distribution, few words are very frequent
+                words.append(vocabulary[int(rnd.paretovariate(1.2)) % VOCABULARY_SIZE])
+            else:
+                words.append(rnd.choice(extras))
+        text = ' '.join(words)
+        if rnd.random() < 0.2:
+            text = 'RT @someone: ' + text
+        tweet = {'id': first_id + num_tweets - i, 'id_str': str(first_id + num_tweets - i), 'text': text[:140]}
+        if rnd.random() < 0.95:
+            tweet['lang'] = rnd.choice(LANGS)
+        tweets.append(tweet)
+    return tweets
+
+
+def as_harvested(tweets):
+    """
+    :param tweets: list of tweet objects, e.g. from make_timeline
+    :return: list of Tweet, as returned by TwitterApi.harvest_user_timeline
+    """
+    return [Tweet.from_json(t) for t in tweets]
+
+
+def measure(func, *args, repeat=5, **kw):
+    """ Run func several times.
+    :return: (best wall time in seconds, peak memory allocated by python in bytes, result of the last run)
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kw)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    tracemalloc.start()
+    result = func(*args, **kw)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def report(name, seconds, peak_bytes):
+    print('{0:<40} {1:>10.2f} ms {2:>10.1f} KiB'.format(name, seconds * 1000, peak_bytes / 1024))
@@ -0,0 +1,153 @@
+""" A local stand-in for the Twitter REST API v1.1, enough for TwitterApi: mentions_timeline, user_timeline and
+    update, with per-endpoint rate limit windows reported in the x-rate-limit-* headers (429 when exhausted).
+    Authentication is not checked.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class RateWindow(object):
+    def __init__(self, limit, window_seconds):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.reset = 0
+        self.remaining = limit
+
+    def hit(self, now):
+        """
+        :return: True if the call is allowed
+        """
+        if now >= self.reset:
+            self.reset = now + self.window_seconds
+            self.remaining = self.limit
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+    def headers(self):
+        return {'x-rate-limit-limit': str(self.limit),
+                'x-rate-limit-remaining': str(self.remaining),
+                # like Twitter, the reset time is an integer unix time
+                'x-rate-limit-reset': str(int(self.reset + 0.999))}
+
+
+class FakeTwitter(object):
+    """ The state of the fake Twitter: timelines, mentions, posted replies and counters of the calls. """
+    ENDPOINTS = ['statuses/mentions_timeline', 'statuses/user_timeline', 'statuses/update']
+
+    def __init__(self, limits=None, window_seconds=900):
+        """
+        :param limits: dict mapping an endpoint to the number of calls allowed in every window (the default limits
+                       are the ones of Twitter for user authentication)
+        :param window_seconds: length of the rate limit windows
+        """
+        defaults = {'statuses/mentions_timeline': 75, 'statuses/user_timeline': 900, 'statuses/update': 300}
+        defaults.update(limits or {})
+        self.windows = {e: RateWindow(defaults[e], window_seconds) for e in self.ENDPOINTS}
+        self.timelines = {}  # lowercase screen name -> list of tweets, the newest at the top
+        self.mentions = []  # the newest at the top
+        self.replies = []
+        self.calls = {e: 0 for e in self.ENDPOINTS}
+        self.rate_limited = {e: 0 for e in self.ENDPOINTS}
+        self.lock = threading.Lock()
+
+    def handle(self, endpoint, params):
+        """
+        :return: (http status, headers, json body)
+        """
+        with self.lock:
+            window = self.windows[endpoint]
+            self.calls[endpoint] += 1
+            if not window.hit(time.time()):
+                self.rate_limited[endpoint] += 1
+                return 429, window.headers(), {'errors': [{'code': 88, 'message': 'Rate limit exceeded'}]}
+            headers = window.headers()
+            if endpoint == 'statuses/mentions_timeline':
+                body = self._page(self.mentions, params)
+            elif endpoint == 'statuses/user_timeline':
+                timeline = self.timelines.get(params.get('screen_name', '').lower())
+                if timeline is None:
+                    return 404, headers, {'errors': [{'code': 34, 'message': 'Sorry, that page does not exist.'}]}
+                body = self._page(timeline, params)
+            else:
+                reply = {'id': len(self.replies) + 1, 'id_str': str(len(self.replies) + 1),
+                         'text': params.get('status'), 'in_reply_to_status_id_str': params.get('in_reply_to_status_id')}
+                self.replies.append(reply)
+                body = reply
+            return 200, headers, body
+
+    @staticmethod
+    def _page(tweets, params):
+        count = int(params.get('count', 20))
+        since_id = int(params.get('since_id', 0) or 0)
+        max_id = int(params['max_id']) if 'max_id' in params else None
+        page = [t for t in tweets if t['id'] > since_id and (max_id is None or t['id'] <= max_id)]
+        return page[:count]
+
+
+class FakeTwitterServer(object):
+    """ Serve a FakeTwitter on localhost, use it with
+        TwitterApi(..., domain=server.domain, secure=False)
+    """
+    def __init__(self, fake_twitter):
+        self.fake_twitter = fake_twitter
+        handler = self._make_handler(fake_twitter)
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.httpd.daemon_threads = True
+        self.domain = '127.0.0.1:{0}'.format(self.httpd.server_address[1])
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    @staticmethod
+    def _make_handler(fake_twitter):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _serve(self, params):
+                path = urlparse(self.path).path
+                # /1.1/statuses/user_timeline.json -> statuses/user_timeline
+                endpoint = path.split('/', 2)[-1].rsplit('.', 1)[0]
+                if endpoint not in fake_twitter.windows:
+                    status, headers, body = 404, {}, {'errors': [{'code': 34, 'message': 'Not found'}]}
+                else:
+                    status, headers, body = fake_twitter.handle(endpoint, params)
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                self._serve({k: v[0] for k, v in query.items()})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                query = parse_qs(self.rfile.read(length).decode('utf-8'))
+                self._serve({k: v[0] for k, v in query.items()})
+
+            def log_message(self, *args):
+                pass
+        return Handler
+
+
+def make_tweets(num_tweets, first_id=10**6, text='just a tweet about words and clouds'):
+    """
+    :return: list of tweets, the newest at the top
+    """
+    return [{'id': i, 'id_str': str(i), 'text': '{0} {1}'.format(text, i), 'lang': 'en'}
+            for i in range(first_id + num_tweets - 1, first_id - 1, -1)]
@@ -0,0 +1,335 @@
+""" In-process stand-ins for twitter.Twitter and ImgurClient, to replay recorded or synthetic mentions and timelines
+    through the real TwitterApi and TwitterWordCloudBot code without any network. Every call can be slowed down or
+    made to fail with a connection error or a 429, deterministically for a given seed.
+"""
+import base64
+import io
+import json
+import math
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from types import SimpleNamespace
+from urllib.error import HTTPError, URLError
+
+import twitter
+from imgurpython.helpers.error import ImgurClientError, ImgurClientRateLimitError
+
+from benchmarks.common import make_settings, make_timeline
+from main import TwitterWordCloudBot
+from ratelimit import RateLimiter
+from twitterapi import TwitterApi
+
+
+class Faults(object):
+    """ What happens to the calls to a stand-in service. The n-th call to an endpoint always gets the same latency and
+        the same fault for the same seed, whatever the order in which the threads make their calls.
+    """
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit_rate=0.0, seed=0):
+        """
+        :param latency: seconds every call takes
+        :param jitter: max seconds randomly added to the latency of a call
+        :param error_rate: fraction of the calls failing with a connection error
+        :param rate_limit_rate: fraction of the calls rejected with a 429
+        :param seed: seed of the random generators
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.seed = seed
+        self.counts = Counter()  # (endpoint, 'ok' or 'error' or 'rate_limit') -> number of calls
+        self._calls = Counter()
+        self._lock = threading.Lock()
+
+    def next(self, endpoint):
+        """ Wait for the latency of the next call to the endpoint.
+        :return: the fault of the call: None, 'error' or 'rate_limit'
+        """
+        with self._lock:
+            n = self._calls[endpoint]
+            self._calls[endpoint] += 1
+        rnd = random.Random(zlib.crc32('{0}/{1}/{2}'.format(self.seed, endpoint, n).encode('utf-8')))
+        delay = self.latency + rnd.random() * self.jitter
+        if delay > 0:
+            time.sleep(delay)
+        r = rnd.random()
+        if r < self.rate_limit_rate:
+            fault = 'rate_limit'
+        elif r < self.rate_limit_rate + self.error_rate:
+            fault = 'error'
+        else:
+            fault = None
+        with self._lock:
+            self.counts[endpoint, fault or 'ok'] += 1
+        return fault
+
+    def summary(self):
+        """
+        :return: dict mapping 'endpoint ok/error/rate_limit' to the number of calls
+        """
+        return {'{0} {1}'.format(*k): v for k, v in sorted(self.counts.items())}
+
+
+class ReplayTwitter(object):
+    """ Stand-in for twitter.Twitter serving statuses/mentions_timeline, statuses/user_timeline, statuses/update and
+        users/lookup from memory. Use it with
+        api = TwitterApi(...); api.twitter_api = ReplayTwitter(...)
+    """
+    def __init__(self, mentions, timelines, faults=None, rate_limit_wait=1):
+        """
+        :param mentions: list of mention objects
+        :param timelines: dict mapping a screen name to its list of tweets, the newest at the top
+        :param faults: Faults of the calls, None for no latency and no faults
+        :param rate_limit_wait: seconds until the reset of the window reported with an injected 429
+        """
+        self.mentions = sorted(mentions, key=lambda m: -m['id'])
+        self.timelines = {name.lower(): tweets for name, tweets in timelines.items()}
+        self.faults = faults if faults is not None else Faults()
+        self.rate_limit_wait = rate_limit_wait
+        self.replies = []
+        self._lock = threading.Lock()
+        self.statuses = SimpleNamespace(**{name: self._endpoint(name)
+                                           for name in ['mentions_timeline', 'user_timeline', 'update']})
+        self.users = SimpleNamespace(lookup=self._endpoint('lookup', 'users'))
+
+    def _endpoint(self, name, resource='statuses'):
+        uriparts = ('1.1', resource, name)
+
+        def call(**kw):
+            return self._call(uriparts, kw)
+        call.uriparts = uriparts
+        return call
+
+    def _call(self, uriparts, kw):
+        endpoint = '/'.join(uriparts[1:])
+        fault = self.faults.next(endpoint)
+        if fault == 'rate_limit':
+            reset = int(time.time() + self.rate_limit_wait + 0.999)
+            raise self._http_error(uriparts, 429, {'x-rate-limit-limit': '1', 'x-rate-limit-remaining': '0',
+                                                   'x-rate-limit-reset': str(reset)})
+        if fault == 'error':
+            raise URLError('injected connection error')
+
+        if endpoint == 'statuses/mentions_timeline':
+            body = self._page(self.mentions, kw)
+        elif endpoint == 'users/lookup':
+            body = [self._profile(name) for name in kw['screen_name'].lower().split(',') if name in self.timelines]
+            if not body:
+                raise self._http_error(uriparts, 404, {})
+        elif endpoint == 'statuses/user_timeline':
+            timeline = self.timelines.get(str(kw.get('screen_name', '')).lower())
+            if timeline is None:
+                raise self._http_error(uriparts, 404, {})
+            body = self._page(timeline, kw)
+        else:
+            with self._lock:
+                reply = {'id': len(self.replies) + 1, 'id_str': str(len(self.replies) + 1), 'text': kw['status'],
+                         'in_reply_to_status_id_str': str(kw['in_reply_to_status_id'])}
+                self.replies.append(reply)
+            body = reply
+        return twitter.api.wrap_response(body, {})
+
+    def _profile(self, screen_name):
+        timeline = self.timelines[screen_name]
+        profile = {'screen_name': screen_name, 'protected': False, 'statuses_count': len(timeline)}
+        if timeline:
+            profile['status'] = {'id': timeline[0]['id'], 'id_str': str(timeline[0]['id'])}
+        return profile
+
+    @staticmethod
+    def _page(tweets, kw):
+        count = int(kw.get('count', 20))
+        since_id = int(kw.get('since_id', 0) or 0)
+        max_id = int(kw['max_id']) if 'max_id' in kw else None
+        page = []
+        for t in tweets:
+            if t['id'] <= since_id or len(page) == count:
+                break
+            if max_id is None or t['id'] <= max_id:
+                page.append(t)
+        return page
+
+    @staticmethod
+    def _http_error(uriparts, code, headers):
+        uri = '/'.join(uriparts)
+        e = HTTPError(uri, code, 'injected', headers, io.BytesIO(b'{"errors": []}'))
+        return twitter.api.TwitterHTTPError(e, uri, 'json', uriparts)
+
+
+class ReplayImgurClient(object):
+    """ Stand-in for ImgurClient: every upload returns a new id, upload_bytes counts the size of the payloads. """
+    allowed_image_fields = {'album', 'name', 'title', 'description'}
+
+    def __init__(self, faults=None):
+        """
+        :param faults: Faults of the uploads, None for no latency and no faults
+        """
+        self.faults = faults if faults is not None else Faults()
+        self.uploads = 0
+        self.upload_bytes = 0
+        self._lock = threading.Lock()
+
+    def upload_from_path(self, path, config=None, anon=True):
+        with open(path, 'rb') as f:
+            data = {'image': base64.b64encode(f.read()), 'type': 'base64'}
+        return self.make_request('POST', 'upload', data, anon)
+
+    def make_request(self, method, route, data=None, force_anon=False):
+        fault = self.faults.next(route)
+        if fault == 'rate_limit':
+            raise ImgurClientRateLimitError()
+        if fault == 'error':
+            raise ImgurClientError('injected error', 500)
+        with self._lock:
+            self.uploads += 1
+            self.upload_bytes += len(data['image'])
+            return {'id': 'replay{0}'.format(self.uploads)}
+
+
+def percentile(samples, p):
+    """
+    :param samples: sorted list of numbers
+    :param p: percentile between 0 and 100
+    :return: the nearest-rank percentile of the samples, None if there are none
+    """
+    if not samples:
+        return None
+    rank = max(1, math.ceil(p / 100.0 * len(samples)))
+    return samples[rank - 1]
+
+
+class StageTimes(object):
+    """ Durations of the stages of the mentions, e.g. 'harvest' or 'render' """
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.samples.setdefault(stage, []).append(elapsed)
+
+    def summary(self, percentiles=(50, 90, 99)):
+        """
+        :return: dict mapping every stage to {'count': n, 'p50': seconds, ...}
+        """
+        result = {}
+        for stage, samples in self.samples.items():
+            samples = sorted(samples)
+            result[stage] = {'count': len(samples)}
+            for p in percentiles:
+                result[stage]['p{0}'.format(p)] = percentile(samples, p)
+        return result
+
+
+class ReplayBot(TwitterWordCloudBot):
+    """ TwitterWordCloudBot timing every stage of the mentions, which retries right away after an injected error
+        instead of waiting like it does with the real services.
+    """
+    STAGES = ['harvest', 'frequencies', 'render', 'upload', 'reply']
+
+    def __init__(self, *args, retry_seconds=0, **kw):
+        super(ReplayBot, self).__init__(*args, **kw)
+        self.stage_times = StageTimes()
+        self.retry_seconds = retry_seconds
+
+    def harvest_tweets(self, twitter_user, profile=None):
+        with self.stage_times.time('harvest'):
+            return super(ReplayBot, self).harvest_tweets(twitter_user, profile)
+
+    def get_word_frequencies(self, tweets, twitter_user=None):
+        with self.stage_times.time('frequencies'):
+            return super(ReplayBot, self).get_word_frequencies(tweets, twitter_user)
+
+    def render_image(self, frequencies):
+        with self.stage_times.time('render'):
+            return super(ReplayBot, self).render_image(frequencies)
+
+    def upload_wordcloud(self, image, user_name):
+        with self.stage_times.time('upload'):
+            return super(ReplayBot, self).upload_wordcloud(image, user_name)
+
+    def post_status(self, status, in_reply_to_status_id):
+        with self.stage_times.time('reply'):
+            return super(ReplayBot, self).post_status(status, in_reply_to_status_id)
+
+    def upload_image(self, image, title, max_errors=3, sleep_seconds=60):
+        return super(ReplayBot, self).upload_image(image, title, max_errors, self.retry_seconds)
+
+    def reply_to(self, status, in_reply_to_status_id, max_errors=3, sleep_seconds=60):
+        return super(ReplayBot, self).reply_to(status, in_reply_to_status_id, max_errors, self.retry_seconds)
+
+
+def make_replay_bot(mentions, timelines, twitter_faults=None, imgur_faults=None, rate_limit_wait=1, **configs):
+    """ Build a ReplayBot whose TwitterApi and imgur client are stand-ins.
+    :param configs: see benchmarks.common.make_settings
+    :return: (ReplayBot, ReplayTwitter, ReplayImgurClient)
+    """
+    replay_twitter = ReplayTwitter(mentions, timelines, twitter_faults, rate_limit_wait)
+    replay_imgur = ReplayImgurClient(imgur_faults)
+    rate_limiter = RateLimiter()
+    # the injected 429s report their exact reset time
+    rate_limiter.RESET_MARGIN = 0
+    twitter_api = TwitterApi('replay', 'replay', 'replay', 'replay', rate_limiter=rate_limiter)
+    twitter_api.twitter_api = replay_twitter
+
+    settings = make_settings(**configs)
+    bot = ReplayBot(twitter_api, replay_imgur, settings.read_stopwords(), settings)
+    return bot, replay_twitter, replay_imgur
+
+
+def make_mentions(num_mentions, accounts, seed=0, bot_name='benchbot', hashtag='wordcloud', first_id=10**18):
+    """ Build deterministic synthetic mentions: most request the word cloud of their author, some the word cloud of
+        another account and a few are not requests at all. A few accounts are requested much more than the others.
+    :param accounts: list of the screen names whose word clouds are requested
+    :return: list of mentions, the newest at the top
+    """
+    rnd = random.Random(seed)
+    mentions = []
+    for i in range(num_mentions):
+        author = accounts[int(rnd.paretovariate(1.0)) % len(accounts)]
+        user_mentions = [{'screen_name': bot_name}]
+        hashtags = [{'text': hashtag}]
+        r = rnd.random()
+        if r < 0.2:
+            user_mentions.append({'screen_name': accounts[int(rnd.paretovariate(1.0)) % len(accounts)]})
+        elif r < 0.25:
+            hashtags = []
+        text = ' '.join('@' + u['screen_name'] for u in user_mentions) + ' ' + \
+               ' '.join('#' + h['text'] for h in hashtags)
+        mention_id = first_id + i
+        mentions.append({'id': mention_id, 'id_str': str(mention_id), 'text': text,
+                         'user': {'screen_name': author},
+                         'entities': {'hashtags': hashtags, 'user_mentions': user_mentions}})
+    mentions.reverse()
+    return mentions
+
+
+def make_timelines(accounts, num_tweets=3200, seed=0):
+    """
+    :return: dict mapping every account to a synthetic timeline (see benchmarks.common.make_timeline)
+    """
+    return {name: make_timeline(num_tweets, seed=seed + i) for i, name in enumerate(accounts)}
+
+
+def load_recording(path):
+    """ Load mentions and timelines saved by save_recording (e.g. downloaded from Twitter once).
+    :return: (list of mentions, dict mapping a screen name to its timeline)
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        recording = json.load(f)
+    return recording['mentions'], recording['timelines']
+
+
+def save_recording(path, mentions, timelines):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'mentions': mentions, 'timelines': timelines}, f)
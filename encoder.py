@@ -0,0 +1,63 @@
+import io
+
+
+class ImageEncoder(object):
+    """ Encode the word cloud images in memory, ready to be uploaded.
+
+        A word cloud only has a few colors, so by default the PNG images are quantized to a palette: they are about
+        three times smaller than RGB ones and look the same. WebP and JPEG are lossy and, with the flat backgrounds
+        and sharp text of a word cloud, usually bigger than a palette PNG (see benchmarks/bench_encoding.py).
+        The encoder is picklable, so it can be sent to the workers of a RenderPool. PIL is imported by the first
+        encode, so the modes of the bot that never render don't load it.
+    """
+    # format name -> (PIL format, file extension)
+    FORMATS = {'png': ('PNG', '.png'), 'webp': ('WEBP', '.webp'), 'jpeg': ('JPEG', '.jpg')}
+
+    def __init__(self, image_format='png', colors=256, compress_level=6, quality=85):
+        """
+        :param image_format: 'png', 'webp' or 'jpeg'
+        :param colors: number of colors of the palette of the png images, 0 to keep them RGB
+        :param compress_level: zlib compression level of the png images, from 0 (none) to 9 (smallest and slowest)
+        :param quality: quality of the webp and jpeg images, from 1 to 100
+        """
+        if image_format not in self.FORMATS:
+            raise ValueError('Unknown image format {0}, use one of {1}'.format(image_format,
+                                                                               ', '.join(sorted(self.FORMATS))))
+        self.image_format = image_format
+        self.colors = colors
+        self.compress_level = compress_level
+        self.quality = quality
+
+    @property
+    def extension(self):
+        return self.FORMATS[self.image_format][1]
+
+    @property
+    def signature(self):
+        """
+        :return: string naming the settings the encoded images depend on, e.g. 'png-c256-z6' or 'webp-q85'
+        """
+        if self.image_format == 'png':
+            return 'png-c{0}-z{1}'.format(self.colors, self.compress_level)
+        return '{0}-q{1}'.format(self.image_format, self.quality)
+
+    def encode(self, image):
+        """
+        :param image: PIL image, e.g. WordCloud.to_image()
+        :return: the encoded image (bytes)
+        """
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        pil_format = self.FORMATS[self.image_format][0]
+        if self.image_format == 'png':
+            if self.colors:
+                # Pillow < 9.1 has the quantization methods in the Image module
+                method = getattr(Image, 'Quantize', Image).FASTOCTREE
+                image = image.quantize(colors=self.colors, method=method)
+            image.save(buffer, format=pil_format, compress_level=self.compress_level)
+        elif self.image_format == 'webp':
+            image.save(buffer, format=pil_format, quality=self.quality, method=4)
+        else:
+            image.convert('RGB').save(buffer, format=pil_format, quality=self.quality, optimize=True)
+        return buffer.getvalue()
@@ -0,0 +1,155 @@
+import atexit
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import REGISTRY
+
+
+class ImageCache(object):
+    """ The word cloud images already rendered, addressed by everything they depend on (see key), together with the
+        imgur id they were uploaded to, so that the same word cloud is never rendered or uploaded twice.
+
+        The images are kept in cache_dir, whose total size stays within max_bytes: when it grows beyond, the least
+        recently used images are deleted. The entries are listed in cache_dir/index.json from the least recently used,
+        so a lookup never needs to scan the directory. The index is written when an image is added (or evicted), the
+        order of the lookups and the imgur ids only every FLUSH_SECONDS, by flush and at exit: a lookup never rewrites
+        the whole index.
+        With save_images False the images are not written at all: only their imgur ids are cached, up to MAX_ENTRIES.
+    """
+    INDEX_FILE = 'index.json'
+    MAX_ENTRIES = 100000
+    FLUSH_SECONDS = 60
+
+    def __init__(self, cache_dir, max_bytes, save_images=True):
+        """
+        :param cache_dir: directory where the images are saved
+        :param max_bytes: max total size of the images
+        :param save_images: False to keep the images only in memory until they are uploaded
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.save_images = save_images
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        self._lock = threading.Lock()
+        # key -> {'file': file name or None if not saved, 'size': bytes, 'imgur_id': string or None}
+        self._entries = OrderedDict()
+        self._size = 0
+        self._dirty = False
+        self._saved = time.time()
+        self._load()
+        atexit.register(self.flush)
+
+    @staticmethod
+    def key(twitter_user, newest_tweet_id, width, height, max_words, style=''):
+        """
+        :param style: string naming the other settings the image depends on: encoding, layout scale and font
+        :return: the key of the word cloud of a twitter user rendered from the tweets up to newest_tweet_id
+        """
+        key = '{0}/{1}/{2}x{3}/{4}'.format(twitter_user.lower(), newest_tweet_id, width, height, max_words)
+        return key + '/' + style if style else key
+
+    def path(self, key, extension='.png'):
+        """
+        :return: the path where the image of a key is saved
+        """
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + extension)
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.cache_dir, self.INDEX_FILE), 'r') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        for key, entry in entries:
+            if entry['file'] is None or os.path.exists(os.path.join(self.cache_dir, entry['file'])):
+                self._entries[key] = entry
+                self._size += entry['size']
+
+    def _save(self):
+        with tempfile.NamedTemporaryFile('w', dir=self.cache_dir, suffix='.tmp', delete=False) as f:
+            json.dump(list(self._entries.items()), f)
+        os.replace(f.name, os.path.join(self.cache_dir, self.INDEX_FILE))
+        self._dirty = False
+        self._saved = time.time()
+
+    def _touch(self):
+        """ Remember that the index changed, it's written if it wasn't for FLUSH_SECONDS. """
+        self._dirty = True
+        if time.time() - self._saved >= self.FLUSH_SECONDS:
+            self._save()
+
+    def flush(self):
+        """ Write the index if it changed. """
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def get(self, key):
+        """
+        :param key: see key
+        :return: (path to the image or None if it wasn't saved, imgur id or None if it wasn't uploaded yet),
+                 None if the image is not cached
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry['file'] is None and entry['imgur_id'] is None):
+                REGISTRY.inc('cache_lookups_total', cache='image', result='miss')
+                return None
+            REGISTRY.inc('cache_lookups_total', cache='image', result='hit')
+            self._entries.move_to_end(key)
+            self._touch()
+            path = os.path.join(self.cache_dir, entry['file']) if entry['file'] is not None else None
+            return path, entry['imgur_id']
+
+    def put_bytes(self, key, image, extension='.png'):
+        """ Add an encoded image to the cache, it's written to path(key, extension) only if save_images is True.
+        :param key: see key
+        :param image: the encoded image (bytes)
+        :return: the path to the cached image, None if it wasn't saved
+        """
+        if not self.save_images:
+            self._add(key, {'file': None, 'size': 0, 'imgur_id': None})
+            return None
+        path = self.path(key, extension)
+        with tempfile.NamedTemporaryFile('wb', dir=self.cache_dir, suffix='.tmp', delete=False) as f:
+            f.write(image)
+        os.replace(f.name, path)
+        self._add(key, {'file': os.path.basename(path), 'size': len(image), 'imgur_id': None})
+        return path
+
+    def _add(self, key, entry):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old['size']
+            self._entries[key] = entry
+            self._size += entry['size']
+            self._evict(keep=key)
+            self._save()
+
+    def set_imgur_id(self, key, imgur_id):
+        """ Remember where the image of key was uploaded. """
+        with self._lock:
+            if key in self._entries:
+                self._entries[key]['imgur_id'] = imgur_id
+                self._touch()
+
+    def _evict(self, keep):
+        while (self._size > self.max_bytes or len(self._entries) > self.MAX_ENTRIES) and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            entry = self._entries.pop(key)
+            self._size -= entry['size']
+            if entry['file'] is None:
+                continue
+            try:
+                os.remove(os.path.join(self.cache_dir, entry['file']))
+            except OSError:
+                pass
@@ -0,0 +1,184 @@
+import threading
+from collections import OrderedDict
+from operator import itemgetter
+from random import Random
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from wordcloud import WordCloud
+from wordcloud.wordcloud import IntegralOccupancyMap
+
+# GlyphCache of every font of the current thread (font path -> GlyphCache)
+_local = threading.local()
+
+
+def glyph_cache(font_path):
+    """
+    :return: the GlyphCache of a font for the current thread, it's kept across the renders
+    """
+    caches = getattr(_local, 'caches', None)
+    if caches is None:
+        caches = _local.caches = {}
+    cache = caches.get(font_path)
+    if cache is None:
+        cache = caches[font_path] = GlyphCache(font_path)
+    return cache
+
+
+def new_wordcloud(width, height, max_words, font_path=None, layout_scale=1):
+    """
+    :param layout_scale: see FastWordCloud, 1 for a plain WordCloud
+    :return: a WordCloud rendering images of width x height
+    """
+    if layout_scale > 1:
+        return FastWordCloud(width, height, layout_scale, max_words=max_words, font_path=font_path)
+    return WordCloud(width=width, height=height, max_words=max_words, font_path=font_path)
+
+
+class GlyphCache(object):
+    """ The loaded sizes of a font and the bounding boxes of the words drawn with them. WordCloud loads the font file
+        again for every size it tries and measures every word from scratch, for every render.
+        Pillow fonts shouldn't be shared between threads, so every thread has its own caches (see glyph_cache).
+    """
+    MAX_FONTS = 512
+    MAX_BOXES = 100000
+
+    def __init__(self, font_path):
+        """
+        :param font_path: path to a TrueType font
+        """
+        self.font_path = font_path
+        self._fonts = OrderedDict()  # (size, orientation) -> TransposedFont
+        self._boxes = {}  # (word, size, orientation) -> bounding box
+        self._draw = ImageDraw.Draw(Image.new('L', (1, 1)))
+
+    def font(self, size, orientation=None):
+        """
+        :param orientation: None or Image.ROTATE_90
+        :return: the font of this size, rotated
+        """
+        key = (size, orientation)
+        font = self._fonts.get(key)
+        if font is not None:
+            self._fonts.move_to_end(key)
+            return font
+        font = ImageFont.TransposedFont(ImageFont.truetype(self.font_path, size), orientation=orientation)
+        self._fonts[key] = font
+        if len(self._fonts) > self.MAX_FONTS:
+            self._fonts.popitem(last=False)
+        return font
+
+    def box(self, word, size, orientation=None):
+        """
+        :return: the bounding box (left, top, right, bottom) of a word drawn at (0, 0)
+        """
+        key = (word, size, orientation)
+        box = self._boxes.get(key)
+        if box is None:
+            if len(self._boxes) >= self.MAX_BOXES:
+                self._boxes.clear()
+            box = self._draw.textbbox((0, 0), word, font=self.font(size, orientation), anchor='lt')
+            self._boxes[key] = box
+        return box
+
+
+class FastWordCloud(WordCloud):
+    """ WordCloud placing the words on a canvas layout_scale times smaller than the image, then drawing them at the
+        full size. Finding the places is most of the cost of a render and it grows with the area of the canvas, so a
+        layout_scale of 2 renders 3 to 5 times faster. The font sizes are multiples of layout_scale and the words
+        which would be smaller than min_font_size * layout_scale pixels are dropped, see benchmarks/bench_layout.py.
+        The fonts and the sizes of the words are cached across the renders (see GlyphCache).
+        Masks and repeat are not supported.
+    """
+    def __init__(self, width, height, layout_scale=2, **kw):
+        """
+        :param width: width of the image
+        :param height: height of the image
+        :param layout_scale: how many times the layout canvas is smaller than the image
+        :param kw: other WordCloud parameters
+        """
+        layout_width = max(1, int(round(width / float(layout_scale))))
+        layout_height = max(1, int(round(height / float(layout_scale))))
+        super(FastWordCloud, self).__init__(width=layout_width, height=layout_height,
+                                            scale=width / float(layout_width), **kw)
+        self.image_width = width
+        self.image_height = height
+        self.glyphs = glyph_cache(self.font_path)
+
+    def generate_from_frequencies(self, frequencies, max_font_size=None):
+        """ Same as WordCloud.generate_from_frequencies, with the fonts and the sizes of the words from the cache """
+        frequencies = sorted(frequencies.items(), key=itemgetter(1), reverse=True)[:self.max_words]
+        if not frequencies:
+            raise ValueError("We need at least 1 word to plot a word cloud, got 0.")
+        max_frequency = float(frequencies[0][1])
+        frequencies = [(word, freq / max_frequency) for word, freq in frequencies]
+        random_state = self.random_state if self.random_state is not None else Random()
+
+        if max_font_size is None:
+            max_font_size = self.max_font_size
+        if max_font_size is not None:
+            font_size = max_font_size
+        elif len(frequencies) == 1:
+            font_size = self.height
+        else:
+            # like WordCloud, start from the sizes of the two most frequent words drawn as big as possible
+            self.generate_from_frequencies(dict(frequencies[:2]), max_font_size=self.height)
+            sizes = [layout[1] for layout in self.layout_]
+            if not sizes:
+                raise ValueError("Couldn't find space to draw. Either the Canvas size is too small or too much of "
+                                 "the image is masked out.")
+            font_size = int(2 * sizes[0] * sizes[1] / (sizes[0] + sizes[1])) if len(sizes) > 1 else sizes[0]
+        self.words_ = dict(frequencies)
+
+        occupancy = IntegralOccupancyMap(self.height, self.width, None)
+        img_grey = Image.new('L', (self.width, self.height))
+        draw = ImageDraw.Draw(img_grey)
+        font_sizes, positions, orientations, colors = [], [], [], []
+        last_freq = 1.
+        for word, freq in frequencies:
+            if freq == 0:
+                continue
+            if self.relative_scaling != 0:
+                font_size = int(round((self.relative_scaling * (freq / float(last_freq)) +
+                                       (1 - self.relative_scaling)) * font_size))
+            orientation = None if random_state.random() < self.prefer_horizontal else Image.ROTATE_90
+            tried_other_orientation = False
+            result = None
+            while font_size >= self.min_font_size:
+                box = self.glyphs.box(word, font_size, orientation)
+                result = occupancy.sample_position(box[3] + self.margin, box[2] + self.margin, random_state)
+                if result is not None:
+                    break
+                # no room: try the other orientation, then a smaller font
+                if not tried_other_orientation and self.prefer_horizontal < 1:
+                    orientation = Image.ROTATE_90
+                    tried_other_orientation = True
+                else:
+                    font_size -= self.font_step
+                    orientation = None
+            if font_size < self.min_font_size:
+                break
+
+            x, y = np.array(result) + self.margin // 2
+            draw.text((y, x), word, fill='white', font=self.glyphs.font(font_size, orientation))
+            positions.append((x, y))
+            orientations.append(orientation)
+            font_sizes.append(font_size)
+            colors.append(self.color_func(word, font_size=font_size, position=(x, y), orientation=orientation,
+                                          random_state=random_state, font_path=self.font_path))
+            occupancy.update(np.asarray(img_grey), x, y)
+            last_freq = freq
+
+        self.layout_ = list(zip(frequencies, font_sizes, positions, orientations, colors))
+        return self
+
+    def to_image(self):
+        """ Draw the layout on an image of width x height """
+        self._check_generated()
+        img = Image.new(self.mode, (self.image_width, self.image_height), self.background_color)
+        draw = ImageDraw.Draw(img)
+        scale_y = self.image_height / float(self.height)
+        for (word, count), font_size, position, orientation, color in self.layout_:
+            font = self.glyphs.font(int(font_size * self.scale), orientation)
+            draw.text((int(position[1] * self.scale), int(position[0] * scale_y)), word, fill=color, font=font)
+        return img
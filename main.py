@@ -1,27 +1,51 @@
 import os
 import re
+import argparse
+import base64
+import threading
 import time
 import html
 import random
 import string
+from collections import Counter, deque
 try:
    import cPickle as pickle
 except:
    import pickle
 
-from imgurpython import ImgurClient
-from imgurpython.helpers.error import ImgurClientError, ImgurClientRateLimitError
-from twitter import TwitterHTTPError
-from wordcloud import WordCloud
-
+from admission import AdmissionControl
+from encoder import ImageEncoder
+from imagecache import ImageCache
+from mentionjournal import CompletionTracker, MentionJournal
+from metrics import REGISTRY, MetricsServer, snowflake_time
+from normalizer import TweetNormalizer
+from pipeline import MentionPipeline
+from poller import MentionPoller, PollSchedule
+from prerender import Prerenderer
+from profiles import ProfileCache
+from records import Mention
+from retryqueue import RetryQueue
 from settings import Settings
+from sketch import SpaceSaving
+from tweetcache import TweetCache
+from tweetstore import CloudQuery, TweetStore
 from twitterapi import TwitterApi
+from workqueue import WorkQueue
 
 
 class TwitterWordCloudBot:
+    """ The rendering stack (wordcloud, numpy, PIL) and imgurpython are imported only when the first word cloud is
+        rendered or uploaded, so the modes that only collect the mentions start fast (see benchmarks/bench_startup.py).
+    """
     def __init__(self, twitter_api, imgur_client, stopwords, settings):
+        """
+        :param twitter_api: TwitterApi object
+        :param imgur_client: ImgurClient object, None to build it from the settings when the first image is uploaded
+        :param stopwords: see Settings.read_stopwords
+        :param settings: Settings object
+        """
         self.twitter_api = twitter_api
-        self.imgur_client = imgur_client
+        self._imgur_client = imgur_client
         self.stopwords = stopwords
         self.settings = settings
 
@@ -44,41 +68,434 @@ class TwitterWordCloudBot:
         self.WIDTH = settings.read_width()
         self.HEIGHT = settings.read_height()
 
+        # font used in the image, None to use the default font of WordCloud
+        self.FONT_PATH = settings.read_font_path()
+
+        # place the words on a canvas this many times smaller than the image (see FastWordCloud), 1 to place them
+        # at full size
+        self.LAYOUT_SCALE = settings.read_layout_scale()
+
+        # encodes the images in memory, ready to be uploaded
+        self.encoder = ImageEncoder(settings.read_image_format(), settings.read_image_colors(),
+                                    settings.read_png_compress_level(), settings.read_image_quality())
+
+        # the settings the images depend on besides their size, part of their key in the image cache: a word cloud
+        # rendered with other settings is rendered and uploaded again
+        self.IMAGE_STYLE = '{0}/s{1}/{2}'.format(self.encoder.signature, self.LAYOUT_SCALE, self.FONT_PATH or 'default')
+
+        # render the images in a pool of this many worker processes (0 to render them in this process), started by
+        # the first render (see get_render_pool)
+        self.RENDER_PROCESSES = settings.read_render_processes()
+        self._render_pool = None
+        self._lazy_lock = threading.Lock()
+
+        # splits the tweets into words
+        self.normalizer = TweetNormalizer()
+
+        # tweets already downloaded for every user
+        self.tweet_cache = TweetCache(settings.read_tweet_cache_dir())
+
+        # words of the harvested tweets and their counts for every user, which also answer the requests for the word
+        # cloud of several accounts or of the last days (see parse_query), None to disable them
+        tweet_store = settings.read_tweet_store()
+        if tweet_store:
+            self.tweet_store = TweetStore(tweet_store, self.MAX_RESULTS)
+        else:
+            self.tweet_store = None
+
+        # max number of accounts in the word cloud of several accounts
+        self.MAX_CLOUD_USERS = settings.read_max_cloud_users()
+
+        # profiles of the requested accounts, looked up in batches before downloading their tweets (None to skip it)
+        if settings.read_preflight_lookup():
+            self.profiles = ProfileCache(twitter_api, settings.read_profile_ttl())
+        else:
+            self.profiles = None
+
+        # count the words of the timelines page by page in a bounded sketch instead of keeping all the tweets
+        # (see stream_wordcloud), the tweet cache is not used then
+        self.STREAM_HARVEST = settings.read_stream_harvest()
+        self.SKETCH_FACTOR = settings.read_sketch_factor()
+        self.STABLE_PAGES = settings.read_stable_pages()
+        self.STABLE_OVERLAP = settings.read_stable_overlap()
+
+        # word cloud images already rendered and uploaded
+        self.image_cache = ImageCache(self.OUTPUT_DIR, settings.read_image_cache_bytes(), settings.read_save_images())
+
+        # mentions waiting to be handled
+        self.journal = MentionJournal(settings.read_mentions_journal(), settings.read_journal_fsync_every())
+        self._import_pickled_mentions()
+
+        # quotas of the requesters, max age of the mentions, max backlog and order of the mentions handled
+        self.admission = AdmissionControl(settings.read_requester_quota(), settings.read_quota_seconds(),
+                                          settings.read_max_mention_age(), settings.read_max_pending(),
+                                          settings.read_lifo_depth())
+
+        # uploads and replies that failed, tried again later instead of sleeping in front of the other mentions, None to
+        # retry them right away (see upload_image and reply_to)
+        retry_queue = settings.read_retry_queue()
+        if retry_queue:
+            self.retry_queue = RetryQueue(retry_queue, settings.read_retry_base_delay(),
+                                          settings.read_retry_max_delay(), settings.read_retry_max_attempts())
+        else:
+            self.retry_queue = None
+
+        # write lastmentionid to settings.ini every this many mentions
+        self.CHECKPOINT_EVERY = settings.read_checkpoint_every()
+        self._checkpoints = 0
+
+        # refresh the word clouds of the accounts requested most often while the bot is idle, None to disable it
+        if settings.read_prerender():
+            self.prerenderer = Prerenderer(self.get_wordcloud_link, settings.read_prerender_targets(),
+                                           settings.read_prerender_min_requests(), settings.read_prerender_interval(),
+                                           settings.read_prerender_reserve(),
+                                           rate_limiter=getattr(twitter_api, 'rate_limiter', None))
+        else:
+            self.prerenderer = None
+
+        # handle the mentions with a MentionPipeline instead of one at a time
+        self.PIPELINE = settings.read_pipeline()
+
+        # poll the mentions in the background, more often while they are arriving (see PollSchedule),
+        # instead of sleeping for a fixed time after every batch
+        self.ADAPTIVE_POLLING = settings.read_adaptive_polling()
+        self.poller = None
+
+        # max number of mentions handled at the same time by run_async
+        self.ASYNC_CONCURRENCY = settings.read_async_concurrency()
+
+        # queue of the mentions shared by a poller process and many worker processes (see run_poller and run_worker),
+        # None if this process handles its own mentions
+        work_queue = settings.read_work_queue()
+        if work_queue:
+            self.work_queue = WorkQueue(work_queue, settings.read_lease_seconds(), settings.read_max_attempts())
+        else:
+            self.work_queue = None
+        # seconds a worker waits before looking again in an empty queue
+        self.WORKER_IDLE_SECONDS = settings.read_worker_idle_seconds()
+
+        # expose the metrics over http and/or write them to a json log
+        if self.work_queue is not None:
+            REGISTRY.set('mentions_pending', self.work_queue.pending_count)
+        else:
+            REGISTRY.set('mentions_pending', lambda: len(self.journal))
+        REGISTRY.set('mention_lag_seconds', self.mention_lag)
+        if self.retry_queue is not None:
+            REGISTRY.set('retries_pending', lambda: len(self.retry_queue) if self.retry_queue is not None else 0)
+        metrics_port = settings.read_metrics_port()
+        if metrics_port is not None:
+            self.metrics_server = MetricsServer(REGISTRY, metrics_port, settings.read_metrics_host()).start()
+        else:
+            self.metrics_server = None
+        metrics_json_log = settings.read_metrics_json_log()
+        if metrics_json_log:
+            REGISTRY.open_json_log(metrics_json_log)
+
     def make_wordcloud(self, twitter_user):
-        """ Build the word cloud png image of a twitter user
+        """ Build the word cloud image of a twitter user
         :param twitter_user: name of the twitter account (string)
-        :return: path to the word cloud image (string),
+        :return: path to the word cloud image (string) if it's saved in the image cache, else the image (bytes),
                  None if an error occurs or there are no words to build the word cloud
         """
+        fetched = self.fetch_wordcloud(twitter_user)
+        if fetched is None:
+            return None
+        key, cached, frequencies = fetched
+        if cached is not None and cached[0] is not None:
+            return cached[0]
+        if cached is not None:
+            # only the imgur id is cached, render the image again
+            fetched = self.fetch_wordcloud(twitter_user, use_cache=False)
+            if fetched is None:
+                return None
+            key, _, frequencies = fetched
+        return self.render_to_cache(twitter_user, frequencies, key)
+
+    def get_wordcloud_link(self, twitter_user, requests=()):
+        """ Build the word cloud of a twitter user and upload it, unless it's already in the image cache.
+        :param twitter_user: name of the twitter account (string)
+        :param requests: list of (id of a mention, beginning of its reply status) waiting for the link, parked with the
+                         upload if it fails (see park_upload)
+        :return: the imgur id of the word cloud image (string), None if an error occurs
+        """
+        fetched = self.fetch_wordcloud(twitter_user)
+        if fetched is None:
+            print("Error: failed building the word cloud\n")
+            return None
+        key, cached, frequencies = fetched
+        if cached is not None and cached[1] is not None:
+            print("This word cloud has already been uploaded: {0}".format(cached[1]))
+            return cached[1]
+        if cached is not None:
+            image = cached[0]
+        else:
+            image = self.render_to_cache(twitter_user, frequencies, key)
+        if image is None:
+            print("Error: failed building the word cloud\n")
+            return None
+        imgur_id = self.upload_wordcloud(image, twitter_user)
+        if imgur_id is None:
+            print("Error: failed uploading the word cloud image\n")
+            if requests:
+                self.park_upload(twitter_user, key, image, requests)
+            return None
+        self.image_cache.set_imgur_id(key, imgur_id)
+        return imgur_id
+
+    def fetch_wordcloud(self, twitter_user, use_cache=True):
+        """ Harvest the tweets of a twitter user and count their words, unless the word cloud is in the image cache.
+        :param twitter_user: name of the twitter account (string)
+        :param use_cache: False to count the words even if the word cloud is in the image cache
+        :return: (key of the word cloud in the image cache,
+                  (path to the image or None, imgur id or None) if the word cloud is cached else None,
+                  Counter of the words or None if the word cloud is cached),
+                 None if an error occurs or there are no words
+        """
+        query = CloudQuery.parse(twitter_user)
+        if query is not None:
+            return self.fetch_query_wordcloud(query, use_cache)
+        profile, wanted = self.get_profile(twitter_user)
+        if not wanted:
+            return None
+        newest_id = ProfileCache.newest_id(profile)
+        if use_cache and newest_id is not None:
+            # the word cloud of the newest tweet may be cached, then there's nothing to download
+            key = self.image_cache.key(twitter_user, newest_id, self.WIDTH, self.HEIGHT, self.MAX_WORDS,
+                                       self.IMAGE_STYLE)
+            cached = self.image_cache.get(key)
+            if cached is not None:
+                return key, cached, None
+        if self.STREAM_HARVEST:
+            return self.stream_wordcloud(twitter_user, use_cache, profile)
+        tweets = self.harvest_tweets(twitter_user, profile)
+        if tweets is None:
+            return None
+        key = self.wordcloud_key(twitter_user, tweets)
+        cached = self.image_cache.get(key) if use_cache else None
+        if cached is not None:
+            return key, cached, None
+        frequencies = self.get_word_frequencies(tweets, twitter_user)
+        if frequencies is None:
+            return None
+        return key, None, frequencies
+
+    def fetch_query_wordcloud(self, query, use_cache=True):
+        """ Same as fetch_wordcloud, for a CloudQuery: the new tweets of every account are harvested and added to the
+            tweet store, then the store counts the words of all of them.
+        :param query: CloudQuery
+        """
+        self.prefetch_profiles(query.users)
+        for user in query.users:
+            profile, wanted = self.get_profile(user)
+            if wanted:
+                self.harvest_tweets(user, profile)
+        newest_id = self.tweet_store.newest_id(query.users)
+        if newest_id is None:
+            return None
+        if query.days is not None:
+            # the same tweets give another word cloud the next day
+            newest_id = '{0}@{1}'.format(newest_id, self.tweet_store.today())
+        key = self.image_cache.key(query.name, newest_id, self.WIDTH, self.HEIGHT, self.MAX_WORDS,
+                                   self.IMAGE_STYLE)
+        cached = self.image_cache.get(key) if use_cache else None
+        if cached is not None:
+            return key, cached, None
+        with REGISTRY.time('wordcloud_stage_seconds', stage='clean'):
+            frequencies = self.stored_frequencies(query.users, query.days)
+        if not frequencies:
+            return None
+        return key, None, frequencies
+
+    def get_profile(self, twitter_user):
+        """
+        :param twitter_user: name of the twitter account (string)
+        :return: (Profile of the account from users/lookup or None if unknown,
+                  False if the account is skipped because it can't have a word cloud)
+        """
+        if self.profiles is None:
+            return None, True
+        profile, skip = self.profiles.get(twitter_user)
+        if skip is not None:
+            print("Skipping @{0}: the account is {1}".format(twitter_user, skip.replace('_', ' ')))
+            return profile, False
+        if profile is not None and ProfileCache.newest_id(profile) is None:
+            print("Skipping @{0}: the account has no tweets".format(twitter_user))
+            return profile, False
+        return profile, True
+
+    def stream_wordcloud(self, twitter_user, use_cache=True, profile=None):
+        """ Same as fetch_wordcloud, but the timeline is counted one page at a time as it's downloaded and the tweets
+            are not kept: the words are counted in a SpaceSaving sketch of SKETCH_FACTOR * MAX_WORDS words, and the
+            download stops when the MAX_WORDS most frequent words have been almost the same (see STABLE_OVERLAP) for
+            STABLE_PAGES pages, or when the first page shows that the word cloud is already in the image cache.
+        """
+        sketch = SpaceSaving(self.SKETCH_FACTOR * self.MAX_WORDS)
+        langs = {}
+        key = None
+        top_words = None
+        stable_pages = 0
+        max_pages = ProfileCache.pages_needed(profile, self.MAX_RESULTS) if profile is not None else None
+        pages = self.twitter_api.iter_user_timeline(screen_name=twitter_user, max_results=self.MAX_RESULTS,
+                                                    max_pages=max_pages)
+        try:
+            with REGISTRY.time('wordcloud_stage_seconds', stage='harvest'):
+                for page in pages:
+                    if key is None:
+                        if not page:
+                            return None
+                        key = self.wordcloud_key(twitter_user, page)
+                        cached = self.image_cache.get(key) if use_cache else None
+                        if cached is not None:
+                            return key, cached, None
+                    sketch.update(self.clean_tweets(page, langs=langs))
+
+                    new_top_words = dict(sketch.most_common(self.MAX_WORDS))
+                    # the share of the cloud (by word counts, which set the font sizes) already in the last top words
+                    kept = sum(count for word, count in new_top_words.items() if word in (top_words or ()))
+                    if top_words is not None and kept >= self.STABLE_OVERLAP * sum(new_top_words.values()):
+                        stable_pages += 1
+                    else:
+                        stable_pages = 0
+                    top_words = new_top_words
+                    if stable_pages >= self.STABLE_PAGES:
+                        print("The most frequent words of @{0} are stable, stopping the download".format(twitter_user))
+                        break
+        except:
+            return None
+        finally:
+            pages.close()
+        if not len(sketch):
+            return None
+        # the plurals of every page were folded, fold them across the pages
+        return key, None, self.normalizer.fold_plurals(Counter(dict(sketch.most_common(self.MAX_WORDS))))
+
+    def harvest_tweets(self, twitter_user, profile=None):
+        """
+        :param twitter_user: name of the twitter account (string)
+        :param profile: Profile of the account from users/lookup, None if unknown
+        :return: list of the tweets of the user, the newest at the top, None if an error occurs or there are no tweets
+        """
         try:
-            tweets = self.twitter_api.harvest_user_timeline(screen_name=twitter_user, max_results=self.MAX_RESULTS)
+            with REGISTRY.time('wordcloud_stage_seconds', stage='harvest'):
+                tweets = self.tweet_cache.harvest(self.twitter_api, twitter_user, self.MAX_RESULTS, profile)
         except:
             return None
         if tweets == []:
             return None
-        words = self.clean_tweets(tweets)
-        if words == []:
+        if self.tweet_store is not None:
+            try:
+                with REGISTRY.time('wordcloud_stage_seconds', stage='clean'):
+                    self.tweet_store.add(twitter_user, tweets, self.tweet_words)
+            except Exception as e:
+                print("Error while storing the tweets of @{0}: {1}".format(twitter_user, e))
+        return tweets
+
+    def wordcloud_key(self, twitter_user, tweets):
+        """
+        :return: the key of the word cloud of these tweets in the image cache
+        """
+        return self.image_cache.key(twitter_user, TweetCache.newest_id(tweets), self.WIDTH, self.HEIGHT,
+                                    self.MAX_WORDS, self.IMAGE_STYLE)
+
+    def render_to_cache(self, twitter_user, frequencies, key):
+        """ Render the word cloud and add it to the image cache
+        :param frequencies: Counter of the words (see clean_tweets)
+        :return: the encoded word cloud image (bytes), None if an error occurs
+        """
+        image = self.render_image(frequencies)
+        if image is None:
+            return None
+        self.image_cache.put_bytes(key, image, self.encoder.extension)
+        return image
+
+    def get_word_frequencies(self, tweets, twitter_user=None):
+        """ Count the words of the tweets
+        :param tweets: list of tweets
+        :param twitter_user: name of the twitter account of the tweets, to take the counts of its words from the tweet
+                             store instead when it holds the same tweets
+        :return: Counter of the words (see clean_tweets), None if there are no words
+        """
+        with REGISTRY.time('wordcloud_stage_seconds', stage='clean'):
+            if (self.tweet_store is not None and twitter_user is not None and
+                    self.tweet_store.newest_id([twitter_user]) == TweetCache.newest_id(tweets)):
+                frequencies = self.stored_frequencies([twitter_user])
+            else:
+                frequencies = self.clean_tweets(tweets)
+        if not frequencies:
             return None
+        return frequencies
+
+    def stored_frequencies(self, users, days=None):
+        """ Count the words of the tweets in the tweet store, the plurals together with their singular
+        :param users: list of names of twitter accounts
+        :param days: count only the tweets of the last days, None for all of them
+        :return: Counter of the MAX_WORDS most frequent words (see clean_tweets)
+        """
+        # fold all the words, a plural can be in the top words while its singular is not
+        frequencies = self.normalizer.fold_plurals(self.tweet_store.terms(users, days))
+        return Counter(dict(frequencies.most_common(self.MAX_WORDS)))
+
+    @property
+    def imgur_client(self):
+        """
+        :return: the ImgurClient, built from the settings on the first call if none was given (building it asks imgur
+                 for the credits left)
+        """
+        if self._imgur_client is None:
+            with self._lazy_lock:
+                if self._imgur_client is None:
+                    from imgurpython import ImgurClient
+
+                    s = self.settings
+                    self._imgur_client = ImgurClient(s.read_imgur_client_id(), s.read_imgur_client_secret(),
+                                                     s.read_imgur_access_token(), s.read_imgur_refresh_token())
+        return self._imgur_client
+
+    def get_render_pool(self):
+        """
+        :return: the RenderPool, started on the first call, None if the images are rendered in this process
+        """
+        if self.RENDER_PROCESSES > 0 and self._render_pool is None:
+            with self._lazy_lock:
+                if self._render_pool is None:
+                    from renderer import RenderPool
+
+                    self._render_pool = RenderPool(self.RENDER_PROCESSES, self.WIDTH, self.HEIGHT, self.MAX_WORDS,
+                                                   self.FONT_PATH, self.encoder, self.LAYOUT_SCALE)
+        return self._render_pool
+
+    def render_image(self, frequencies):
+        """ Render the word cloud and encode it in memory (see ImageEncoder)
+        :param frequencies: Counter of the words (see clean_tweets)
+        :return: the encoded word cloud image (bytes), None if an error occurs
+        """
+        if self.RENDER_PROCESSES > 0:
+            try:
+                # the workers encode the images too
+                with REGISTRY.time('wordcloud_stage_seconds', stage='render'):
+                    return self.get_render_pool().render(frequencies)
+            except:
+                return None
+        from layout import new_wordcloud
+
         try:
-            wordcloud = WordCloud(width=self.WIDTH, height=self.HEIGHT, max_words=self.MAX_WORDS) \
-                .generate(' '.join(words))
+            with REGISTRY.time('wordcloud_stage_seconds', stage='render'):
+                wordcloud = new_wordcloud(self.WIDTH, self.HEIGHT, self.MAX_WORDS, self.FONT_PATH,
+                                          self.LAYOUT_SCALE).generate_from_frequencies(frequencies)
         except:
             return None
-        ts = str(int(time.time()))
-        img_file = os.path.join(self.OUTPUT_DIR, ts + twitter_user + ".png")
-        wordcloud.to_file(img_file)
-        return img_file
+        with REGISTRY.time('wordcloud_stage_seconds', stage='encode'):
+            return self.encoder.encode(wordcloud.to_image())
 
     @staticmethod
     def _contains_hashtag(mention, hashtags, lowercase=True):
         """
-        :param mention: mention object
+        :param mention: Mention
         :param hashtags: list of hashtags without the #, e.g.'wordcloud' not '#wordcloud' (list of string)
         :param lowercase: True if hashtags in the mention should be converted to lowercase before comparison
         :return: True if the mention contains the hashtag, False otherwise
         """
-        for h in mention['entities']['hashtags']:
-            h = h['text']
+        for h in mention.hashtags:
             if lowercase:
                 h = h.lower()
             if h in hashtags:
@@ -87,136 +504,619 @@ class TwitterWordCloudBot:
 
     def _get_first_mention(self, mention):
         """
-        :param mention: mention object
+        :param mention: Mention
         :return: the screen name (string) of the first user mentioned in the tweet that is not this bot,
                  if there's none return None
         """
-        for u in mention['entities']['user_mentions']:
-            if u['screen_name'] != self.BOT_NAME:
-                return u['screen_name']
+        for u in mention.user_mentions:
+            if u != self.BOT_NAME:
+                return u
         return None
 
-    def save_mentions(self, mentions):
-        with open('./mentions', 'wb') as f:
-            pickle.dump(mentions, f)
-
-    def load_mentions(self):
-        with open('./mentions', 'rb') as f:
+    def _import_pickled_mentions(self, path='./mentions'):
+        """ Move the mentions saved by the old versions of this bot into the journal. """
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as f:
             try:
                 mentions = pickle.load(f)
             except:
                 mentions = []
-        return mentions
+        self.journal.add([Mention.from_json(m) for m in mentions])
+        os.rename(path, path + '.imported')
+        print("Imported {0} mentions from {1}\n".format(len(mentions), path))
+
+    def get_new_mentions(self):
+        """ Download the new mentions and add them to the journal. When the MentionPoller is running it has already
+            done it, so just take the mentions it downloaded since the last call.
+        :return: list of the new mentions, the newest mention is at the top
+        """
+        if self.poller is not None:
+            return self.poller.claim()
+        return self.download_mentions()
+
+    def download_mentions(self):
+        """ Download the new mentions and add them to the journal
+        :return: list of the new mentions, the newest mention is at the top
+        """
+        last_mention_id = self.journal.last_mention_id
+        if last_mention_id is None:
+            last_mention_id = self.settings.read_last_mention_id()
+        return self.add_mentions(self.twitter_api.get_mentions(last_mention_id))
+
+    def add_mentions(self, new_mentions):
+        """ Add the new mentions admitted by the AdmissionControl to the journal
+        :param new_mentions: list of Mention, the newest at the top
+        :return: list of the mentions added, the newest at the top
+        """
+        REGISTRY.inc('mentions_received_total', len(new_mentions))
+        admitted = self.admission.admit(new_mentions)
+        self.journal.add(admitted)
+        if self.prerenderer is not None:
+            for mention in admitted:
+                target = self.get_target(mention)
+                if target is not None:
+                    self.prerenderer.record(target)
+        if new_mentions:
+            # don't download the dropped mentions again
+            self.journal.advance(new_mentions[0].id_str)
+        return admitted
+
+    def schedule_mentions(self, mention_ids, tracker):
+        """ Drop the stale mentions and the ones over the max backlog, and order the others (see AdmissionControl)
+        :param mention_ids: ids of mentions in the journal
+        :param tracker: CompletionTracker following the mentions
+        :return: list of the ids of the mentions to handle, in order
+        """
+        mention_ids, dropped = self.admission.schedule(mention_ids)
+        for mention_id in dropped:
+            tracker.complete(mention_id, handled=False)
+        return mention_ids
 
-    def get_new_mentions(self, mentions, last_mention_id=1):
-        """ Download the new mentions
-        :param mentions: list of mentions already downloaded, the newest mention is at the top
-        :param last_mention_id: string containing the id of the last mention. If "mentions" is an empty list then only
-                        mentions arrived after this mention are downloaded, otherwise this parameter is ignored
-        :return: a list of mentions with the new mentions added at the top
+    def mention_lag(self):
         """
-        if mentions:
-            last_mention_id = mentions[0]['id_str']
+        :return: seconds since the oldest mention waiting to be handled was posted, 0 if there are none
+        """
+        if self.work_queue is not None:
+            # the poller moves the mentions from the journal to the work queue
+            oldest = self.work_queue.oldest_pending_id()
         else:
-            last_mention_id = last_mention_id
-        new_mentions = self.twitter_api.get_mentions(last_mention_id)
-        mentions = new_mentions + mentions
-        return mentions
+            pending = self.journal.pending_ids()
+            oldest = pending[0] if pending else None
+        if oldest is None:
+            return 0
+        posted = snowflake_time(oldest)
+        if posted is None:
+            return None
+        return max(0, time.time() - posted)
 
-    def handle_mentions(self):
+    def checkpoint(self, last_mention_id, flush=False):
+        """ Remember the id of the last mention handled, settings.ini is rewritten only every CHECKPOINT_EVERY calls
+            (the journal already knows the newest mention, settings.ini is only needed if the journal is lost).
+        :param last_mention_id: id of the mention (string)
+        :param flush: True to write settings.ini now
+        """
+        self._checkpoints += 1
+        flush = flush or self._checkpoints % self.CHECKPOINT_EVERY == 0
+        self.settings.write_last_mention_id(last_mention_id, flush=flush)
+
+    def handle_mentions(self, poll=True):
         """ Handle the mentions of this twitter bot.
-        :return: number of mentions handled
+        :param poll: False to handle only the mentions already in the journal, without downloading the new ones
+        :return: number of mentions handled, the stale ones dropped are not counted
         """
         mentions_handled = 0
-        mentions = self.load_mentions()
-        mentions = self.get_new_mentions(mentions, self.settings.read_last_mention_id())
-        self.save_mentions(mentions)
+        if poll:
+            self.get_new_mentions()
+        self.retry_parked()
+        pending_ids = self.journal.pending_ids()
+        tracker = CompletionTracker(self.journal, self.checkpoint)
+        tracker.track(pending_ids)
+        # every mention of this batch, the poller can return a mention that was already pending
+        queued = set(pending_ids)
+        mention_ids = deque(self.schedule_mentions(pending_ids, tracker))
+        # the pending word cloud requests of every twitter account, so that every word cloud is built only once
+        requests = self._group_by_target(mention_ids)
+        self.prefetch_profiles(requests)
+        # mentions already answered together with an older request for the same account, and counted as handled
+        answered = set()
+        # mentions_handled when the mentions were last downloaded
+        polled_at = 0
 
-        if mentions:
-            print("I'm going to handle {0} mention(s).".format(len(mentions)))
+        if mention_ids:
+            print("I'm going to handle {0} mention(s).".format(len(mention_ids)))
         else:
             print("No mentions :(")
 
-        while mentions:
-            mention = mentions.pop()
+        while mention_ids:
+            in_reply_to_status_id = mention_ids.popleft()
+            if in_reply_to_status_id in answered:
+                answered.remove(in_reply_to_status_id)
+                continue
+            if self.admission.drop_stale(in_reply_to_status_id):
+                # counted in mentions_shed_total, not handled
+                tracker.complete(in_reply_to_status_id, handled=False)
+                continue
             mentions_handled += 1
 
-            in_reply_to_status_id = mention['id_str']
-            self.settings.write_last_mention_id(in_reply_to_status_id)
+            # claiming the mentions downloaded by the poller is free, downloading them costs an api call
+            if poll and mention_ids and (self.poller is not None or mentions_handled - polled_at >= 10):
+                polled_at = mentions_handled
+                new_mentions = self.get_new_mentions()
+                new_ids = [m.id_str for m in reversed(new_mentions) if m.id_str not in queued]
+                queued.update(new_ids)
+                tracker.track(new_ids)
+                # the new mentions may go first, or push the oldest ones over the max backlog
+                mention_ids = [i for i in mention_ids if i not in answered] + new_ids
+                answered.clear()
+                mention_ids = deque(self.schedule_mentions(mention_ids, tracker))
+                self._group_by_target(new_ids, requests)
+                self.prefetch_profiles(requests)
+                print("\nThere are {0} new mentions, now I have to handle {1} mentions in total.\n".format(len(new_mentions), len(mention_ids)))
+                self.retry_parked()
 
-            if mentions and mentions_handled % 10 == 0:
-                old_num_mentions = len(mentions)
-                mentions = self.get_new_mentions(mentions, self.settings.read_last_mention_id())
-                self.save_mentions(mentions)
-                print("\nThere are {0} new mentions, now I have to handle {1} mentions in total.\n".format(len(mentions)-old_num_mentions, len(mentions)))
+            mention = self.journal.get(in_reply_to_status_id)
+            target = self.get_target(mention)
+            follower_ids = []
+            if target is not None:
+                # the mentions dropped meanwhile are not answered
+                follower_ids = [i for i in requests.pop(target.lower(), [])
+                                if i != in_reply_to_status_id and i in self.journal]
 
-            print("Handling mention: {0},\nfrom: @{1},\nwith id: {2}".format(mention['text'],
-                                                                             mention['user']['screen_name'],
-                                                                             mention['id_str']))
+            self.handle_mention(mention, [self.journal.get(i) for i in follower_ids])
+            tracker.complete(in_reply_to_status_id)
+            for i in follower_ids:
+                tracker.complete(i)
+                answered.add(i)
+            mentions_handled += len(follower_ids)
 
-            screen_name = mention['user']['screen_name']
-            if screen_name == self.BOT_NAME:
-                print("Skipping this self mention.\n")
-                self.save_mentions(mentions)
-                continue
+            # uncomment the following lines if you get rate-limited by twitter
+            #sleep_time = 10
+            #time.sleep(sleep_time)
 
-            status = '@' + screen_name + ' '
-
-            if self._contains_hashtag(mention, self.WORDCLOUD_HASHTAGS):
-                if len(mention['entities']['user_mentions']) > 1:
-                    # in the tweet, besides this bot mention, there's at least another one
-                    user_name = self._get_first_mention(mention)
-                    if user_name is None:
-                        # probably some twitter user tried to build a word cloud of the bot's twitter account
-                        print("Error: couldn't extract a user mention, this is weird!\n")
-                        self.save_mentions(mentions)
-                        continue
-                    status += 'here\'s the word cloud for @' + user_name + ' '
-                else:
-                    user_name = screen_name
-                    status += 'here\'s your word cloud'
-                    rand_suff = [' :D ', '! ', ' ^^ ', ' :P ', ' .(ಠ⌣ಠ). ', ' ＼(＠O＠)／ ' ,
-                                 ' ＼( ｀.∀´)／ ', ' ;) ', ' voilà ', ' ah! ', ' :^) ', ' :o) ', ' :3 ',
-                                 ' =] ', ' 8) ', ' B^D ', ' =3 ', ' ;^) ', ' (^o^)丿 ', ' ^ω^ ',
-                                 ' ＼(^o^)／ ', ' ＼(◎o◎)／ ', ' （⌒▽⌒） ', ' ( ﾟヮﾟ) ', ' ( ͡° ͜ʖ ͡°) ',
-                                 ' (☞ﾟヮﾟ)☞ ']
-                    status += random.choice(rand_suff)
-                    # uncomment the following line if you get blocked by Twitter because your replies are automated
-                    # status += ''.join(random.choice(string.ascii_lowercase) for _ in range(6)) + ' '
-                img_file = self.make_wordcloud(user_name)
-                if img_file is None:
-                    print("Error: failed building the word cloud\n")
-                    self.save_mentions(mentions)
-                    continue
-                title = 'Word cloud of http://twitter.com/' + user_name
-                imgur_id = self.upload_image(img_file, title)
-                if imgur_id is None:
-                    print("Error: failed uploading the word cloud image\n")
-                    self.save_mentions(mentions)
-                    continue
-                imgur_id = imgur_id['id']
-                status += 'http://imgur.com/' + imgur_id
+        self.settings.flush()
+        self.image_cache.flush()
+        return mentions_handled
+
+    def _group_by_target(self, mention_ids, requests=None):
+        """
+        :param mention_ids: ids of mentions in the journal, the oldest first
+        :param requests: dict to update, None to build a new one
+        :return: dict mapping the lowercase name of every requested twitter account to the list of the ids of the
+                 mentions requesting it, the oldest first
+        """
+        if requests is None:
+            requests = {}
+        for mention_id in mention_ids:
+            target = self.get_target(self.journal.get(mention_id))
+            if target is not None:
+                requests.setdefault(target.lower(), []).append(mention_id)
+        return requests
+
+    def prefetch_profiles(self, targets):
+        """ Look up the profiles of the requested accounts that are not cached yet, 100 per request (see ProfileCache)
+        :param targets: iterable of names of twitter accounts
+        """
+        if self.profiles is not None and targets:
+            self.profiles.prefetch(user for target in targets for user in CloudQuery.users_of(target))
+
+    def handle_mention(self, mention, followers=()):
+        """ Build the word cloud requested in a mention and reply with its link.
+        :param mention: Mention
+        :param followers: other Mention objects requesting the same word cloud, they are answered with the same link
+        """
+        request = self.parse_mention(mention)
+        if request is None:
+            return
+        user_name, status = request
+        replies = [(mention.id_str, status)]
+        for follower in followers:
+            request = self.parse_mention(follower)
+            if request is not None:
+                replies.append((follower.id_str, request[1]))
+        if followers:
+            print("{0} more mention(s) requested this word cloud".format(len(followers)))
+
+        imgur_id = self.get_wordcloud_link(user_name, replies)
+        if imgur_id is None:
+            return
+        link = 'http://imgur.com/' + imgur_id
+
+        for in_reply_to_status_id, status in replies:
+            if self.post_status(status + link, in_reply_to_status_id) is None:
+                self.park_reply(status + link, in_reply_to_status_id)
+
+    def handle_mentions_pipelined(self, poll=True):
+        """ Handle the mentions of this twitter bot with a MentionPipeline, many at the same time.
+        :param poll: False to handle only the mentions already in the journal, without downloading the new ones
+        :return: number of mentions handled, the stale ones dropped are not counted
+        """
+        if poll:
+            self.get_new_mentions()
+        self.retry_parked()
+        mention_ids = self.journal.pending_ids()
+
+        if mention_ids:
+            print("I'm going to handle {0} mention(s).".format(len(mention_ids)))
+        else:
+            print("No mentions :(")
+            return 0
+
+        self.prefetch_profiles(self._group_by_target(mention_ids))
+        workers = {stage: self.settings.read_pipeline_workers(stage) for stage in MentionPipeline.STAGES}
+        # claiming the mentions downloaded by the poller is free, downloading them costs an api call
+        poll_every = 0 if not poll else 1 if self.poller is not None else 10
+        pipeline = MentionPipeline(self, workers, self.settings.read_pipeline_queue_size(), poll_every)
+        mentions_handled = pipeline.run(mention_ids)
+        self.settings.flush()
+        self.image_cache.flush()
+        return mentions_handled
+
+    async def handle_mentions_async(self, twitter_api, imgur_client):
+        """ Handle the mentions of this twitter bot concurrently on the event loop, at most ASYNC_CONCURRENCY at the
+            same time. Mentions requesting the same word cloud share a single harvest, render and upload. The journal,
+            the retry queue and the caches are written in threads of the default executor, off the event loop.
+        :param twitter_api: asyncapi.AsyncTwitterApi object
+        :param imgur_client: asyncapi.AsyncImgurClient object
+        :return: number of mentions handled, the stale ones dropped are not counted
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        last_mention_id = self.journal.last_mention_id
+        if last_mention_id is None:
+            last_mention_id = self.settings.read_last_mention_id()
+        new_mentions = await twitter_api.get_mentions(last_mention_id)
+        await loop.run_in_executor(None, self.add_mentions, new_mentions)
+        if self.retry_queue is not None:
+            # the retries use the blocking TwitterApi and imgur client
+            await loop.run_in_executor(None, self.retry_parked)
+        mention_ids = self.journal.pending_ids()
+        tracker = CompletionTracker(self.journal, self.checkpoint)
+        tracker.track(mention_ids)
+        mention_ids = await loop.run_in_executor(None, self.schedule_mentions, mention_ids, tracker)
+
+        if mention_ids:
+            print("I'm going to handle {0} mention(s).".format(len(mention_ids)))
+        else:
+            print("No mentions :(")
+            return 0
+
+        semaphore = asyncio.Semaphore(self.ASYNC_CONCURRENCY)
+        # lowercase name of a twitter account -> task building and uploading its word cloud
+        links = {}
+        # lowercase name of a twitter account -> (cache key, image) of its word cloud if the upload failed
+        failed_uploads = {}
+
+        async def handle(mention_id):
+            # False if the mention was dropped, the drops are counted in mentions_shed_total
+            async with semaphore:
+                if self.admission.drop_stale(mention_id):
+                    await loop.run_in_executor(None, tracker.complete, mention_id, False)
+                    return False
+                try:
+                    mention = self.journal.get(mention_id)
+                    request = self.parse_mention(mention)
+                    if request is not None:
+                        user_name, status = request
+                        if user_name.lower() not in links:
+                            links[user_name.lower()] = asyncio.ensure_future(
+                                self.get_wordcloud_link_async(user_name, twitter_api, imgur_client, failed_uploads))
+                        imgur_id = await asyncio.shield(links[user_name.lower()])
+                        if imgur_id is not None:
+                            status += 'http://imgur.com/' + imgur_id
+                            if await self.post_status_async(status, mention_id, twitter_api) is None:
+                                await loop.run_in_executor(None, self.park_reply, status, mention_id)
+                        elif user_name.lower() in failed_uploads:
+                            key, image = failed_uploads[user_name.lower()]
+                            await loop.run_in_executor(None, self.park_upload, user_name, key, image,
+                                                       [(mention_id, status)])
+                except Exception as e:
+                    print("Error while handling the mention {0}: {1}\n".format(mention_id, e))
+            await loop.run_in_executor(None, tracker.complete, mention_id)
+            return True
+
+        handled = await asyncio.gather(*[handle(mention_id) for mention_id in mention_ids])
+        await loop.run_in_executor(None, self.settings.flush)
+        await loop.run_in_executor(None, self.image_cache.flush)
+        return sum(handled)
+
+    async def get_wordcloud_link_async(self, twitter_user, twitter_api, imgur_client, failed_uploads=None):
+        """ Same as get_wordcloud_link, the word cloud is rendered in a thread of the default executor.
+        :param failed_uploads: dict where (key in the image cache, image) is set for the lowercase twitter_user if the
+                               upload fails, to park it
+        :return: the imgur id of the word cloud image (string), None if an error occurs
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        if CloudQuery.parse(twitter_user) is not None:
+            # the tweet store is not asynchronous, build the word cloud of a CloudQuery in a thread
+            return await loop.run_in_executor(None, self.get_wordcloud_link, twitter_user)
+        try:
+            with REGISTRY.time('wordcloud_stage_seconds', stage='harvest'):
+                tweets = await self.tweet_cache.harvest_async(twitter_api, twitter_user, self.MAX_RESULTS)
+        except:
+            tweets = None
+        if not tweets:
+            print("Error: failed building the word cloud\n")
+            return None
+        key = self.wordcloud_key(twitter_user, tweets)
+        cached = await loop.run_in_executor(None, self.image_cache.get, key)
+        if cached is not None and cached[1] is not None:
+            print("This word cloud has already been uploaded: {0}".format(cached[1]))
+            return cached[1]
+        if cached is not None:
+            image = cached[0]
+        else:
+            frequencies = await loop.run_in_executor(None, self.get_word_frequencies, tweets)
+            if frequencies is None:
+                print("Error: failed building the word cloud\n")
+                return None
+            image = await loop.run_in_executor(None, self.render_to_cache, twitter_user, frequencies, key)
+        if image is None:
+            print("Error: failed building the word cloud\n")
+            return None
+        title = self.wordcloud_title(twitter_user)
+        with REGISTRY.time('wordcloud_stage_seconds', stage='upload'):
+            uploaded = await self.upload_image_async(image, title, imgur_client, self.inline_retries)
+        if uploaded is None:
+            print("Error: failed uploading the word cloud image\n")
+            if failed_uploads is not None:
+                failed_uploads[twitter_user.lower()] = (key, image)
+            return None
+        await loop.run_in_executor(None, self.image_cache.set_imgur_id, key, uploaded['id'])
+        return uploaded['id']
+
+    def get_target(self, mention):
+        """
+        :param mention: Mention
+        :return: the screen name (string) of the twitter account whose word cloud is requested by the mention, or the
+                 name of the CloudQuery requested, None if the mention is not a word cloud request (see parse_mention)
+        """
+        screen_name = mention.screen_name
+        if screen_name == self.BOT_NAME or not self._contains_hashtag(mention, self.WORDCLOUD_HASHTAGS):
+            return None
+        query = self.parse_query(mention)
+        if query is not None:
+            return query.name
+        if len(mention.user_mentions) > 1:
+            return self._get_first_mention(mention)
+        return screen_name
+
+    def parse_mention(self, mention):
+        """ Find out if a mention is a word cloud request and for which twitter user.
+        :param mention: Mention
+        :return: (name of the twitter account of the word cloud or of the CloudQuery, beginning of the reply status)
+                 (tuple of strings), None if the mention should be skipped
+        """
+        print("Handling mention: {0},\nfrom: @{1},\nwith id: {2}".format(mention.text,
+                                                                         mention.screen_name,
+                                                                         mention.id_str))
+
+        screen_name = mention.screen_name
+        if screen_name == self.BOT_NAME:
+            print("Skipping this self mention.\n")
+            return None
+
+        status = '@' + screen_name + ' '
+
+        if not self._contains_hashtag(mention, self.WORDCLOUD_HASHTAGS):
+            print("Skipping this mention because there are no relevant hashtags.\n")
+            return None
+
+        query = self.parse_query(mention)
+        if query is not None:
+            if query.users == [screen_name]:
+                status += 'here\'s your word cloud '
             else:
-                print("Skipping this mention because there are no relevant hashtags.\n")
-                self.save_mentions(mentions)
-                continue
+                status += 'here\'s the word cloud for ' + ' '.join('@' + u for u in query.users) + ' '
+            if query.days is not None:
+                status += 'of the last {0} day(s) '.format(query.days)
+            return query.name, status
 
-            if len(status) <= 140:
-                result = self.reply_to(status, in_reply_to_status_id)
-                if result is not None:
-                    print("Posted this tweet: {0}\n".format(status))
-                else:
-                    print("Error: tweet post failed\n")
+        if len(mention.user_mentions) > 1:
+            # in the tweet, besides this bot mention, there's at least another one
+            user_name = self._get_first_mention(mention)
+            if user_name is None:
+                # probably some twitter user tried to build a word cloud of the bot's twitter account
+                print("Error: couldn't extract a user mention, this is weird!\n")
+                return None
+            status += 'here\'s the word cloud for @' + user_name + ' '
+        else:
+            user_name = screen_name
+            status += 'here\'s your word cloud'
+            rand_suff = [' :D ', '! ', ' ^^ ', ' :P ', ' .(ಠ⌣ಠ). ', ' ＼(＠O＠)／ ' ,
+                         ' ＼( ｀.∀´)／ ', ' ;) ', ' voilà ', ' ah! ', ' :^) ', ' :o) ', ' :3 ',
+                         ' =] ', ' 8) ', ' B^D ', ' =3 ', ' ;^) ', ' (^o^)丿 ', ' ^ω^ ',
+                         ' ＼(^o^)／ ', ' ＼(◎o◎)／ ', ' （⌒▽⌒） ', ' ( ﾟヮﾟ) ', ' ( ͡° ͜ʖ ͡°) ',
+                         ' (☞ﾟヮﾟ)☞ ']
+            status += random.choice(rand_suff)
+            # uncomment the following line if you get blocked by Twitter because your replies are automated
+            # status += ''.join(random.choice(string.ascii_lowercase) for _ in range(6)) + ' '
+        return user_name, status
+
+    # "last N days" right after a hashtag or a mention, so that "my 3d printer" or "2 days ago" are not windows
+    P_days = re.compile(r'(?<![\w@#])[@#]\w+\s+last\s+(\d{1,3})\s+days?\b', re.IGNORECASE)
+    def parse_query(self, mention):
+        """ Find out if a word cloud request is answered from the tweet store: the word cloud of several accounts (the
+            accounts mentioned besides this bot, at most MAX_CLOUD_USERS) and/or of the tweets of the last days
+            (e.g. "#wordcloud @alice @bob last 7 days" or "#wordcloud last 30 days").
+        :param mention: Mention of a word cloud request
+        :return: CloudQuery, None if the mention requests the whole word cloud of a single account or the tweet store
+                 is disabled
+        """
+        if self.tweet_store is None:
+            return None
+        users = []
+        for u in mention.user_mentions:
+            if u != self.BOT_NAME and u.lower() not in [n.lower() for n in users]:
+                users.append(u)
+        users = users[:self.MAX_CLOUD_USERS] or [mention.screen_name]
+        match = self.P_days.search(mention.text)
+        days = int(match.group(1)) if match is not None and int(match.group(1)) > 0 else None
+        if len(users) < 2 and days is None:
+            return None
+        return CloudQuery(users, days)
+
+    @staticmethod
+    def wordcloud_title(user_name):
+        """
+        :param user_name: name of the twitter account of the word cloud or of a CloudQuery
+        :return: the title of the image on imgur
+        """
+        query = CloudQuery.parse(user_name)
+        if query is None:
+            return 'Word cloud of http://twitter.com/' + user_name
+        title = 'Word cloud of ' + ', '.join('http://twitter.com/' + u for u in query.users)
+        if query.days is not None:
+            title += ', last {0} day(s)'.format(query.days)
+        return title
+
+    def upload_wordcloud(self, image, user_name):
+        """
+        :param image: path to the word cloud image or the encoded image (bytes)
+        :param user_name: name of the twitter account of the word cloud or of a CloudQuery
+        :return: the imgur id of the uploaded image (string), None if an error occurs
+        """
+        title = self.wordcloud_title(user_name)
+        with REGISTRY.time('wordcloud_stage_seconds', stage='upload'):
+            imgur_id = self.upload_image(image, title, self.inline_retries)
+        if imgur_id is None:
+            return None
+        return imgur_id['id']
+
+    def post_status(self, status, in_reply_to_status_id):
+        """ Post the reply if it's not too long.
+        :return: see reply_to, None if the status was not posted
+        """
+        if len(status) <= 140:
+            with REGISTRY.time('wordcloud_stage_seconds', stage='reply'):
+                result = self.reply_to(status, in_reply_to_status_id, self.inline_retries)
+            self._record_reply(result, in_reply_to_status_id)
+            if result is not None:
+                print("Posted this tweet: {0}\n".format(status))
             else:
-                print("Error: This status was too long to be posted {0}\n".format(status))
-            
-            self.save_mentions(mentions)
+                print("Error: tweet post failed\n")
+            return result
+        else:
+            print("Error: This status was too long to be posted {0}\n".format(status))
+            REGISTRY.inc('replies_total', result='too_long')
+            return None
 
-            # uncomment the following lines if you get rate-limited by twitter
-            #sleep_time = 10
-            #time.sleep(sleep_time)
+    @staticmethod
+    def _record_reply(result, in_reply_to_status_id):
+        """ Count a reply and observe how long the mention waited for it. """
+        if result is None:
+            REGISTRY.inc('replies_total', result='failed')
+            REGISTRY.log('reply', mention_id=in_reply_to_status_id, result='failed')
+            return
+        REGISTRY.inc('replies_total', result='posted')
+        posted = snowflake_time(in_reply_to_status_id)
+        lag = None if posted is None else max(0, time.time() - posted)
+        if lag is not None:
+            REGISTRY.observe('mention_reply_lag_seconds', lag)
+        REGISTRY.log('reply', mention_id=in_reply_to_status_id, result='posted', lag=lag)
 
-        return mentions_handled
+    @property
+    def inline_retries(self):
+        """
+        :return: number of times upload_image and reply_to retry right away, none when the failures are parked in the
+                 retry queue
+        """
+        return 3 if self.retry_queue is None else 0
+
+    def park_upload(self, user_name, key, image, requests):
+        """ Park an upload that failed in the retry queue, with the mentions waiting for its link (see RetryQueue)
+        :param user_name: name of the twitter account of the word cloud or of a CloudQuery
+        :param key: key of the word cloud in the image cache
+        :param image: path to the word cloud image or the encoded image (bytes)
+        :param requests: list of (id of a mention, beginning of its reply status)
+        :return: False if there's no retry queue
+        """
+        if self.retry_queue is None:
+            return False
+        self.retry_queue.park_upload(user_name, key, image, requests)
+        return True
+
+    def park_reply(self, status, in_reply_to_status_id):
+        """ Park a reply that failed in the retry queue, unless it was too long to be posted (see post_status)
+        :return: False if the reply is not parked
+        """
+        if self.retry_queue is None or len(status) > 140:
+            return False
+        self.retry_queue.park_reply(in_reply_to_status_id, status)
+        return True
+
+    def retry_parked(self, deadline=None):
+        """ Try again the uploads and the replies of the retry queue that are due, once each: the mentions waiting
+            for the same upload share a single attempt.
+        :param deadline: unix time when to stop, None to try all of them
+        :return: number of operations tried
+        """
+        if self.retry_queue is None:
+            return 0
+        tried = 0
+        uploads = {}  # (name of the account, key in the image cache) -> parked uploads, in order
+        for retry in self.retry_queue.due():
+            if retry.op == RetryQueue.UPLOAD:
+                uploads.setdefault((retry.target, retry.cache_key), []).append(retry)
+                continue
+            if deadline is not None and time.time() >= deadline:
+                return tried
+            tried += 1
+            print("Retrying the reply to {0} (attempt {1})".format(retry.mention_id, retry.attempts + 1))
+            if self.post_status(retry.status, retry.mention_id) is not None:
+                self.retry_queue.done(retry)
+            else:
+                self.retry_queue.failed(retry)
+        for (user_name, key), retries in uploads.items():
+            if deadline is not None and time.time() >= deadline:
+                break
+            tried += 1
+            print("Retrying the upload of the word cloud of {0} (attempt {1})".format(user_name,
+                                                                                      retries[0].attempts + 1))
+            imgur_id = self.retry_upload(user_name, key)
+            for retry in retries:
+                if imgur_id is None:
+                    self.retry_queue.failed(retry)
+                    continue
+                status = retry.status + 'http://imgur.com/' + imgur_id
+                if self.post_status(status, retry.mention_id) is not None:
+                    self.retry_queue.done(retry)
+                elif not self.park_reply(status, retry.mention_id):
+                    # the reply can't be posted at all, don't retry the upload
+                    self.retry_queue.done(retry)
+        return tried
+
+    def retry_upload(self, user_name, key):
+        """ Upload again a word cloud parked in the retry queue: the image in the image cache or the one kept by the
+            retry queue, or a new one if both are gone. Nothing is uploaded if the image has been uploaded meanwhile.
+        :return: the imgur id of the word cloud image (string), None if an error occurs
+        """
+        cached = self.image_cache.get(key) if key is not None else None
+        if cached is not None and cached[1] is not None:
+            return cached[1]
+        image = cached[0] if cached is not None else None
+        if image is None and key is not None:
+            image = self.retry_queue.image(key)
+        if image is None:
+            return self.get_wordcloud_link(user_name)
+        imgur_id = self.upload_wordcloud(image, user_name)
+        if imgur_id is not None and key is not None:
+            self.image_cache.set_imgur_id(key, imgur_id)
+        return imgur_id
+
+    def next_retry_in(self, timeout=None):
+        """
+        :param timeout: max seconds to return
+        :return: seconds until the next operation of the retry queue is due, timeout if there are none
+        """
+        next_due = self.retry_queue.next_due() if self.retry_queue is not None else None
+        if next_due is None:
+            return timeout
+        wait = max(0, next_due - time.time())
+        return wait if timeout is None else min(wait, timeout)
 
     def reply_to(self, status, in_reply_to_status_id, max_errors=3, sleep_seconds=60):
         """
@@ -241,51 +1141,112 @@ class TwitterWordCloudBot:
 
                 if (errors > max_errors):
                     return None
+                REGISTRY.inc('reply_retries_total')
 
                 time.sleep(sleep_seconds)
 
-    def clean_tweets(self, tweets, min_length=2):
+    async def post_status_async(self, status, in_reply_to_status_id, twitter_api):
+        """ Same as post_status, on an asyncapi.AsyncTwitterApi """
+        if len(status) <= 140:
+            with REGISTRY.time('wordcloud_stage_seconds', stage='reply'):
+                result = await self.reply_to_async(status, in_reply_to_status_id, twitter_api, self.inline_retries)
+            self._record_reply(result, in_reply_to_status_id)
+            if result is not None:
+                print("Posted this tweet: {0}\n".format(status))
+            else:
+                print("Error: tweet post failed\n")
+            return result
+        else:
+            print("Error: This status was too long to be posted {0}\n".format(status))
+            REGISTRY.inc('replies_total', result='too_long')
+            return None
+
+    async def reply_to_async(self, status, in_reply_to_status_id, twitter_api, max_errors=3, sleep_seconds=60):
+        """ Same as reply_to, on an asyncapi.AsyncTwitterApi """
+        import asyncio
+
+        errors = 0
+        while True:
+            try:
+                return await twitter_api.reply_tweet(status, in_reply_to_status_id)
+            except Exception as e:
+                errors += 1
+
+                print("Error while trying to post a reply: " + str(e))
+                print('Encountered {0} error(s). Retrying in {1} seconds'.format(errors, sleep_seconds))
+
+                if (errors > max_errors):
+                    return None
+                REGISTRY.inc('reply_retries_total')
+
+                await asyncio.sleep(sleep_seconds)
+
+    def clean_tweets(self, tweets, min_length=2, langs=None):
         """ Given an array of tweets, remove the retweets (tweets that start with "RT @"), remove non-alphanumeric
-            characters and remove the stopwords.
-        :param tweets: array of tweets objects
+            characters, the stopwords and the numbers, and count how many times every word is used, the plurals
+            together with their singular (the same words WordCloud.process_text kept, without its collocations).
+        :param tweets: array of Tweet objects
         :param min_length: min length of a word
-        :return: array of words
-        """
-        words = []
-        langs = {} # for every language, keep track of how many times it is used
-        for t in tweets:
-            text = t['text']
-            if text.find('RT @') == 0:
-                # ignore retweets
-                continue
-            text = self.clean_text(text)
-
-            if 'lang' in t:
-                if t['lang'] in self.stopwords:
-                    stopwords = self.stopwords[t['lang']]
-                    try:
-                        langs[t['lang']] += 1
-                    except KeyError:
-                        langs[t['lang']] = 1
-                else:
-                    # if t['lang'] is not in self.stopwords, we don't have a stopword dictionary for this language.
-                    stopwords = None
-            elif len(langs) > 1:
-                # if 'lang' is not in t, twitter couldn't recognise the language of this tweet
-                # so use the most used language for this stream of tweets (maybe we are lucky)
-                max_cnt = 0
-                for l, cnt in langs.items():
-                    if cnt > max_cnt:
-                        max_cnt = cnt
-                        max_l = l
-                stopwords = self.stopwords[max_l]
-            else:
-                stopwords = None
+        :param langs: dict updated with how many times every language is used, to carry it over the pages of a timeline
+        :return: Counter mapping every word to its number of occurrences, ready for WordCloud.generate_from_frequencies
+        """
+        words = Counter()
+        if langs is None:
+            langs = {} # for every language, keep track of how many times it is used
+        # ignore retweets
+        tweets = [t for t in tweets if t.text.find('RT @') != 0]
+        # same words as self.clean_text(t.text).split(), in fewer passes (see TweetNormalizer)
+        tokens = self.normalizer.tokenize_many(t.text for t in tweets)
+        common = self.stopwords.common
+        for t, text_words in zip(tweets, tokens):
+            stopwords = self._tweet_stopwords(t, langs)
+            for word in text_words:
+                if (len(word) >= min_length and not word.isdigit() and word not in common and
+                        (stopwords is None or word not in stopwords)):
+                    words[word] += 1
+        return self.normalizer.fold_plurals(words)
 
-            for word in text.split():
-                if len(word) >= min_length and (stopwords is None or word not in stopwords):
-                    words.append(word)
-        return words
+    def tweet_words(self, tweets, min_length=2, langs=None):
+        """ Same as clean_tweets, but the words of every tweet are returned apart instead of counted (the plurals are
+            folded when they are counted, see TweetStore.terms).
+        :return: list of the lists of the words of every tweet, in the same order (empty for the retweets)
+        """
+        if langs is None:
+            langs = {}
+        result = [[] for _ in tweets]
+        indexes = [i for i, t in enumerate(tweets) if t.text.find('RT @') != 0]
+        tokens = self.normalizer.tokenize_many(tweets[i].text for i in indexes)
+        common = self.stopwords.common
+        for i, text_words in zip(indexes, tokens):
+            stopwords = self._tweet_stopwords(tweets[i], langs)
+            result[i] = [word for word in text_words
+                         if len(word) >= min_length and not word.isdigit() and word not in common and
+                         (stopwords is None or word not in stopwords)]
+        return result
+
+    def _tweet_stopwords(self, t, langs):
+        """
+        :return: the stopwords of the language of a tweet, None if unknown
+        """
+        if t.lang is not None:
+            if t.lang in self.stopwords:
+                try:
+                    langs[t.lang] += 1
+                except KeyError:
+                    langs[t.lang] = 1
+                return self.stopwords[t.lang]
+            # if t.lang is not in self.stopwords, we don't have a stopword dictionary for this language.
+            return None
+        elif len(langs) > 1:
+            # if t.lang is None, twitter couldn't recognise the language of this tweet
+            # so use the most used language for this stream of tweets (maybe we are lucky)
+            max_cnt = 0
+            for l, cnt in langs.items():
+                if cnt > max_cnt:
+                    max_cnt = cnt
+                    max_l = l
+            return self.stopwords[max_l]
+        return None
 
     P_emails = re.compile(r'\w+@\w+\.\w+')
     P_retweets = re.compile(r'(RT )?@[\w]+')
@@ -313,26 +1274,243 @@ class TwitterWordCloudBot:
         :param max_mentions_to_handle: max number of mentions to handle in every batch
         :return:
         """
+        if self.ADAPTIVE_POLLING:
+            return self.run_polling()
         while True:
-            self.handle_mentions()
+            if self.PIPELINE:
+                self.handle_mentions_pipelined()
+            else:
+                self.handle_mentions()
             print("I'm going to sleep for {0} seconds\n".format(sleep_seconds))
-            time.sleep(sleep_seconds)
+            self.idle(sleep_seconds)
+
+    def idle(self, seconds):
+        """ Sleep, trying again the parked uploads and replies when they are due and refreshing the popular word
+            clouds meanwhile (see RetryQueue and Prerenderer).
+        :param seconds: seconds to wait
+        """
+        deadline = time.time() + seconds
+        while True:
+            self.retry_parked(deadline)
+            if self.prerenderer is not None:
+                self.prerenderer.run(deadline)
+            wait = self.next_retry_in(max(0, deadline - time.time()))
+            time.sleep(wait)
+            if time.time() >= deadline:
+                return
+
+    def make_poll_schedule(self):
+        """
+        :return: PollSchedule configured in the settings
+        """
+        return PollSchedule(self.settings.read_poll_min_interval(), self.settings.read_poll_max_interval(),
+                            rate_limiter=getattr(self.twitter_api, 'rate_limiter', None))
+
+    def run_polling(self):
+        """ Run this twitter bot, polling the mentions in the background with a MentionPoller: a batch of mentions is
+            handled as soon as they arrive, and the mentions arriving meanwhile join the batch.
+        """
+        self.poller = MentionPoller(self.download_mentions, self.make_poll_schedule())
+        self.poller.start()
+        try:
+            while True:
+                self.retry_parked()
+                if not len(self.journal) and self.prerenderer is not None:
+                    # stop refreshing as soon as a mention arrives, and look again when the next refresh is due
+                    self.prerenderer.run(busy=lambda: len(self.journal) > 0)
+                    if not len(self.journal):
+                        self.poller.wait(self.next_retry_in(self.prerenderer.interval))
+                elif not len(self.journal):
+                    # wake up for the next parked upload or reply too
+                    self.poller.wait(self.next_retry_in())
+                if not len(self.journal):
+                    continue
+                if self.PIPELINE:
+                    self.handle_mentions_pipelined()
+                else:
+                    self.handle_mentions()
+        finally:
+            self.poller.stop()
+            self.poller = None
+
+    async def run_async(self, sleep_seconds=60*5):
+        """ Run this twitter bot on an asyncio event loop: the calls to Twitter and imgur share a pool of keep-alive
+            connections and many mentions are handled at the same time (see handle_mentions_async).
+        :param sleep_seconds: seconds to wait after having handled some mentions
+        """
+        import asyncio
+
+        # aiohttp is only needed by this mode
+        from asyncapi import AsyncImgurClient, AsyncTwitterApi, make_session
+
+        twitter = self.twitter_api.twitter_api
+        async with make_session(self.settings.read_async_connections()) as session:
+            twitter_api = AsyncTwitterApi(twitter.auth, session, rate_limiter=self.twitter_api.rate_limiter,
+                                          domain=twitter.domain, secure=twitter.secure)
+            imgur_client = AsyncImgurClient(self.imgur_client, session)
+            schedule = self.make_poll_schedule() if self.ADAPTIVE_POLLING else None
+            while True:
+                mentions_handled = await self.handle_mentions_async(twitter_api, imgur_client)
+                if schedule is not None:
+                    sleep_seconds = schedule.next_interval(mentions_handled)
+                print("I'm going to sleep for {0:.0f} seconds\n".format(sleep_seconds))
+                if self.prerenderer is not None or self.retry_queue is not None:
+                    # the refresh and the retries use the blocking TwitterApi and imgur client
+                    await asyncio.get_running_loop().run_in_executor(None, self.idle, sleep_seconds)
+                else:
+                    await asyncio.sleep(sleep_seconds)
 
     def run_noreply(self):
         """ Run this twitter bot but don't reply to requests, just save mentions so that they can be handled later.
         """
-        mentions = self.load_mentions()
-        print("Loaded {0} mentions from file\n".format(len(mentions)))
+        print("Loaded {0} mentions from file\n".format(len(self.journal)))
+        schedule = self.make_poll_schedule() if self.ADAPTIVE_POLLING else None
+        while True:
+            new_mentions = self.get_new_mentions()
+            print("\nThere are {0} new mentions, now there are {1} mentions saved.\n".format(len(new_mentions), len(self.journal)))
+            time.sleep(schedule.next_interval(len(new_mentions)) if schedule is not None else 60*5)
+
+    def run_backlog(self):
+        """ Handle the mentions saved in the journal (e.g. by run_noreply) without downloading the new ones, then
+            return.
+        :return: number of mentions handled
+        """
+        print("Loaded {0} mentions from file\n".format(len(self.journal)))
+        if self.PIPELINE:
+            return self.handle_mentions_pipelined(poll=False)
+        return self.handle_mentions(poll=False)
+
+    def run_poller(self):
+        """ Download the mentions and add them to the work queue, for the processes running run_worker.
+            The mentions still in the journal are moved to the queue first.
+        """
+        if self.work_queue is None:
+            raise ValueError('Set workqueue in settings.ini to run a poller')
+        pending_ids = self.journal.pending_ids()
+        if pending_ids:
+            mentions = [self.journal.get(i) for i in reversed(pending_ids)]
+            self.work_queue.add(mentions, self._queue_target)
+            for mention_id in pending_ids:
+                self.journal.complete(mention_id)
+            print("Moved {0} mentions from the journal to the work queue\n".format(len(pending_ids)))
+        schedule = self.make_poll_schedule() if self.ADAPTIVE_POLLING else None
         while True:
-            old_num_mentions = len(mentions)
-            mentions = self.get_new_mentions(mentions, self.settings.read_last_mention_id())
-            self.save_mentions(mentions)
-            print("\nThere are {0} new mentions, now there are {1} mentions saved.\n".format(len(mentions)-old_num_mentions, len(mentions)))
-            time.sleep(60*5)
+            last_mention_id = self.work_queue.last_mention_id or self.settings.read_last_mention_id()
+            try:
+                new_mentions = self.twitter_api.get_mentions(last_mention_id)
+            except Exception as e:
+                print("Error while polling the mentions: {0}".format(e))
+                new_mentions = []
+            REGISTRY.inc('mentions_received_total', len(new_mentions))
+            added = self.work_queue.add(self.admission.admit(new_mentions), self._queue_target)
+            if new_mentions:
+                # don't download the dropped mentions again
+                self.work_queue.advance(new_mentions[0].id_str)
+            print("\nThere are {0} new mentions, {1} mentions are waiting in the work queue.\n"
+                  .format(added, self.work_queue.pending_count()))
+            time.sleep(schedule.next_interval(added) if schedule is not None else 60*5)
 
-    def upload_image(self, image_path, title, max_errors=3, sleep_seconds=60):
+    def _queue_target(self, mention):
+        target = self.get_target(mention)
+        return target.lower() if target is not None else None
+
+    def run_worker(self):
+        """ Handle the mentions added to the work queue by the process running run_poller, together with any number of
+            other workers.
+        """
+        if self.work_queue is None:
+            raise ValueError('Set workqueue in settings.ini to run a worker')
+        # a claim whose upload or replies fail is released to the work queue and claimed again, up to maxattempts
+        # times (see handle_claim), instead of being parked in the retry queue
+        self.retry_queue = None
+        print("Worker {0} is waiting for mentions\n".format(self.work_queue.owner))
+        while True:
+            claim = self.work_queue.claim()
+            if claim is None:
+                time.sleep(self.WORKER_IDLE_SECONDS)
+                continue
+            try:
+                with self.work_queue.keep_lease(claim):
+                    handled = self.handle_claim(claim)
+            except Exception as e:
+                print("Error while handling the mentions {0}: {1}".format(', '.join(claim.mention_ids), e))
+                handled = False
+            if not handled:
+                # let another worker (or this one) try again, the replies already posted are not posted twice
+                self.work_queue.release(claim)
+                continue
+            if self.work_queue.ack(claim) < len(claim.mentions):
+                print("The lease of the mentions {0} expired before they were handled"
+                      .format(', '.join(claim.mention_ids)))
+
+    def handle_claim(self, claim):
+        """ Build the word cloud requested by the claimed mentions and reply to each of them, at most once.
+        :param claim: workqueue.Claim
+        :return: False if the word cloud or a reply failed and the mentions should be claimed again
+        """
+        # the stale mentions are acknowledged without a reply
+        mentions = [mention for mention in claim.mentions if not self.admission.drop_stale(mention.id_str)]
+        requests = [(mention, self.parse_mention(mention)) for mention in mentions]
+        requests = [(mention, request) for mention, request in requests if request is not None]
+        if not requests:
+            return True
+        if len(requests) > 1:
+            print("{0} more mention(s) requested this word cloud".format(len(requests) - 1))
+        imgur_id = self.get_wordcloud_link(requests[0][1][0])
+        if imgur_id is None:
+            return False
+        if not self.work_queue.extend(claim):
+            # another worker claimed the mentions meanwhile and replies to them
+            return False
+        link = 'http://imgur.com/' + imgur_id
+        replied = [self.reply_once(claim, mention.id_str, status + link) for mention, (user_name, status) in requests]
+        return all(replied)
+
+    def reply_once(self, claim, in_reply_to_status_id, status):
+        """ Post the reply to a claimed mention, unless it has already been posted by this or another worker.
+        :return: True if the mention has been answered, now or before
+        """
+        queue = self.work_queue
+        reservation = queue.reserve_reply(claim, in_reply_to_status_id)
+        if reservation == queue.UNKNOWN:
+            # a worker crashed while posting this reply, look for it before posting it again
+            reply_id = self.find_reply(in_reply_to_status_id)
+            if reply_id is not None:
+                print("The reply to {0} was already posted: {1}\n".format(in_reply_to_status_id, reply_id))
+                queue.replied(in_reply_to_status_id, reply_id)
+                return True
+            reservation = queue.reserve_reply(claim, in_reply_to_status_id, take_over=True)
+        if reservation == queue.POSTED:
+            print("The reply to {0} was already posted\n".format(in_reply_to_status_id))
+            return True
+        if reservation == queue.LOST:
+            print("The lease of the mention {0} expired, another worker will reply\n".format(in_reply_to_status_id))
+            return False
+        result = self.post_status(status, in_reply_to_status_id)
+        if result is None:
+            queue.cancel_reply(claim, in_reply_to_status_id)
+            return False
+        queue.replied(in_reply_to_status_id, result.get('id_str'))
+        return True
+
+    def find_reply(self, in_reply_to_status_id):
+        """
+        :return: id of the reply of the bot to a tweet (string), None if there's none or an error occurs
+        """
+        try:
+            tweets = self.twitter_api.harvest_user_timeline(screen_name=self.BOT_NAME, max_results=200,
+                                                            since_id=in_reply_to_status_id)
+        except Exception as e:
+            print("Error while looking for the reply to {0}: {1}".format(in_reply_to_status_id, e))
+            return None
+        for tweet in tweets:
+            if tweet.in_reply_to_status_id_str == in_reply_to_status_id:
+                return tweet.id_str
+        return None
+
+    def upload_image(self, image, title, max_errors=3, sleep_seconds=60):
         """ Try to upload the image to imgur.com.
-        :param image_path: path to the image file
+        :param image: path to the image file or the encoded image (bytes)
         :param title: title of the image
         :param max_errors: max number of retries
         :param sleep_seconds: number of seconds to wait when an error happens
@@ -345,11 +1523,15 @@ class TwitterWordCloudBot:
         errors = 0
         while True:
             try:
-                print("I'm going to upload this image: {0}".format(image_path))
-                return self.imgur_client.upload_from_path(image_path, config=config, anon=False)
+                print("I'm going to upload this image: {0}".format(self._describe_image(image)))
+                REGISTRY.inc('imgur_uploads_total')
+                if isinstance(image, bytes):
+                    return self._imgur_upload(image, config)
+                return self.imgur_client.upload_from_path(image, config=config, anon=False)
             except Exception as e:
                 errors += 1
                 print(e)
+                REGISTRY.inc('imgur_upload_errors_total')
 
                 print('Encountered {0} error(s). Retrying in {1} seconds'.format(errors, sleep_seconds))
 
@@ -358,22 +1540,89 @@ class TwitterWordCloudBot:
 
                 time.sleep(sleep_seconds)
 
-if __name__ == "__main__":
-    s = Settings("./settings.ini")
-    stopwords = s.read_stopwords()
+    async def upload_image_async(self, image, title, imgur_client, max_errors=3, sleep_seconds=60):
+        """ Same as upload_image, on an asyncapi.AsyncImgurClient """
+        import asyncio
+
+        config = {'title': title,
+                  'name': title,
+                  'description': title + '\n' + self.settings.read_description_image_str()}
+        errors = 0
+        while True:
+            try:
+                print("I'm going to upload this image: {0}".format(self._describe_image(image)))
+                REGISTRY.inc('imgur_uploads_total')
+                return await imgur_client.upload(image, config=config, anon=False)
+            except Exception as e:
+                errors += 1
+                print(e)
+                REGISTRY.inc('imgur_upload_errors_total')
+
+                print('Encountered {0} error(s). Retrying in {1} seconds'.format(errors, sleep_seconds))
+
+                if (errors > max_errors):
+                    return None
+
+                await asyncio.sleep(sleep_seconds)
+
+    def _imgur_upload(self, image, config):
+        """ Same as ImgurClient.upload_from_path, for an image already in memory.
+        :param image: the encoded image (bytes)
+        """
+        data = {'image': base64.b64encode(image), 'type': 'base64'}
+        data.update({meta: config[meta] for meta in set(self.imgur_client.allowed_image_fields).intersection(config)})
+        return self.imgur_client.make_request('POST', 'upload', data, False)
+
+    @staticmethod
+    def _describe_image(image):
+        if isinstance(image, bytes):
+            return '<{0} bytes>'.format(len(image))
+        return image
+
+def make_bot(settings):
+    """
+    :param settings: Settings object
+    :return: TwitterWordCloudBot using the accounts in the settings, its imgur client is built by the first upload
+    """
     try:
-        access_token = s.read_twitter_access_token()
+        access_token = settings.read_twitter_access_token()
     except:
         access_token = None
     try:
-        access_token_secret = s.read_twitter_access_token_secret()
+        access_token_secret = settings.read_twitter_access_token_secret()
     except:
         access_token_secret = None
-    twitter_api = TwitterApi(s.read_twitter_consumer_key(), s.read_twitter_consumer_secret(),
+    twitter_api = TwitterApi(settings.read_twitter_consumer_key(), settings.read_twitter_consumer_secret(),
                              access_token, access_token_secret)
+    return TwitterWordCloudBot(twitter_api, None, settings.read_stopwords(), settings)
+
 
-    imgur_client = ImgurClient(s.read_imgur_client_id(), s.read_imgur_client_secret(),
-                               s.read_imgur_access_token(), s.read_imgur_refresh_token())
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Twitter bot replying with word clouds')
+    parser.add_argument('role', nargs='?', choices=['run', 'collect', 'backlog', 'poller', 'worker'], default='run',
+                        help='run: handle the mentions in this process (default), collect: only save the mentions '
+                             'in the journal, backlog: handle the mentions saved in the journal and exit, poller: add '
+                             'the mentions to the work queue, worker: handle the mentions of the work queue')
+    parser.add_argument('--settings', default='./settings.ini', help='path to settings.ini')
+    args = parser.parse_args(argv)
 
-    t = TwitterWordCloudBot(twitter_api, imgur_client, stopwords, s)
-    t.run()
+    s = Settings(args.settings)
+    t = make_bot(s)
+    if args.role == 'collect':
+        t.run_noreply()
+    elif args.role == 'backlog':
+        t.run_backlog()
+    elif args.role == 'poller':
+        t.run_poller()
+    elif args.role == 'worker':
+        t.run_worker()
+    elif s.read_asyncio():
+        import asyncio
+
+        asyncio.run(t.run_async())
+    else:
+        t.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import json
+import os
+import threading
+from collections import deque
+
+from metrics import REGISTRY
+from records import Mention
+
+
+class MentionJournal(object):
+    """ Append-only journal of the mentions waiting to be handled.
+
+        Every line of the file is a record:
+            + <id> <mention json>   a new mention
+            - <id>                  the mention has been handled (or dropped)
+            = <id>                  the newest mention ever downloaded (written by compact and advance)
+        Loading the journal only reads the ids and the offsets of the pending mentions, the json of a mention is
+        parsed only when it's needed. When the handled mentions outnumber the pending ones the file is compacted:
+        the pending mentions are copied to a new file that atomically replaces the old one.
+        The journal can be shared by many threads.
+    """
+    def __init__(self, path, fsync_every=1, compact_min_records=1000):
+        """
+        :param path: path to the journal file
+        :param fsync_every: fsync the journal every this many records, 0 to leave it to the operating system
+        :param compact_min_records: don't compact journals with fewer handled mentions than this
+        """
+        self.path = path
+        self.fsync_every = fsync_every
+        self.compact_min_records = compact_min_records
+
+        self.pending = {}  # id -> offset of its '+' record, the oldest mention first
+        self.last_mention_id = None
+        self._num_completed = 0
+        self._unsynced = 0
+        self._lock = threading.RLock()
+        self._load()
+        self.file = open(self.path, 'ab')
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            offset = 0
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # the last record was cut by a crash, drop it
+                    break
+                kind, mention_id = line[:1], line[2:].split(b' ', 1)[0].strip().decode('ascii')
+                if kind == b'+':
+                    self.pending[mention_id] = offset
+                    self._set_last_mention_id(mention_id)
+                elif kind == b'-':
+                    if self.pending.pop(mention_id, None) is not None:
+                        self._num_completed += 1
+                elif kind == b'=':
+                    self._set_last_mention_id(mention_id)
+                offset += len(line)
+        if offset != os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(offset)
+
+    def _set_last_mention_id(self, mention_id):
+        if self.last_mention_id is None or int(mention_id) > int(self.last_mention_id):
+            self.last_mention_id = mention_id
+
+    def _append(self, record):
+        offset = self.file.tell()
+        self.file.write(record)
+        self.file.flush()
+        self._unsynced += 1
+        if self.fsync_every and self._unsynced >= self.fsync_every:
+            self.sync()
+        return offset
+
+    def sync(self):
+        os.fsync(self.file.fileno())
+        self._unsynced = 0
+
+    def add(self, mentions):
+        """ Append new mentions to the journal.
+        :param mentions: list of Mention, the newest at the top (as returned by TwitterApi.get_mentions)
+        :return: number of mentions added
+        """
+        added = 0
+        with self._lock:
+            for m in reversed(mentions):
+                if m.id_str in self.pending:
+                    continue
+                record = '+ {0} {1}\n'.format(m.id_str, json.dumps(m.to_json(), separators=(',', ':')))
+                self.pending[m.id_str] = self._append(record.encode('utf-8'))
+                self._set_last_mention_id(m.id_str)
+                added += 1
+        return added
+
+    def get(self, mention_id):
+        """
+        :param mention_id: id of a pending mention (string)
+        :return: Mention
+        """
+        with self._lock, open(self.path, 'rb') as f:
+            f.seek(self.pending[mention_id])
+            line = f.readline()
+        # the older versions wrote the whole mention objects
+        return Mention.from_json(json.loads(line.split(b' ', 2)[2].decode('utf-8')))
+
+    def pending_ids(self):
+        """
+        :return: list of the ids of the mentions not handled yet, the oldest first
+        """
+        with self._lock:
+            return list(self.pending)
+
+    def complete(self, mention_id, handled=True):
+        """ Record that a mention has been handled.
+        :param mention_id: id of the mention (string)
+        :param handled: False if the mention was dropped without handling it (see AdmissionControl)
+        """
+        with self._lock:
+            if self.pending.pop(mention_id, None) is None:
+                return
+            self._append('- {0}\n'.format(mention_id).encode('ascii'))
+            self._num_completed += 1
+            if handled:
+                REGISTRY.inc('mentions_completed_total')
+            if self._num_completed >= self.compact_min_records and self._num_completed > len(self.pending):
+                self.compact()
+
+    def advance(self, mention_id):
+        """ Record that the mentions up to mention_id have been downloaded, even if they weren't added.
+        :param mention_id: id of a mention (string)
+        """
+        with self._lock:
+            if self.last_mention_id is not None and int(mention_id) <= int(self.last_mention_id):
+                return
+            self._append('= {0}\n'.format(mention_id).encode('ascii'))
+            self.last_mention_id = mention_id
+
+    def compact(self):
+        """ Rewrite the journal keeping only the pending mentions. """
+        tmp_path = self.path + '.tmp'
+        pending = {}
+        with self._lock, open(self.path, 'rb') as old, open(tmp_path, 'wb') as new:
+            if self.last_mention_id is not None:
+                new.write('= {0}\n'.format(self.last_mention_id).encode('ascii'))
+            for mention_id, offset in self.pending.items():
+                old.seek(offset)
+                pending[mention_id] = new.tell()
+                new.write(old.readline())
+            new.flush()
+            os.fsync(new.fileno())
+            self.file.close()
+            os.replace(tmp_path, self.path)
+            self.pending = pending
+            self._num_completed = 0
+            self._unsynced = 0
+            self.file = open(self.path, 'ab')
+
+    def close(self):
+        self.file.close()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def __contains__(self, mention_id):
+        return mention_id in self.pending
+
+
+class CompletionTracker(object):
+    """ Follow mentions that are handled concurrently and can complete in any order: every mention is marked as
+        handled in the journal as soon as it completes, while the checkpoint only moves forward up to the newest
+        mention such that all the older ones are completed.
+    """
+    def __init__(self, journal, checkpoint):
+        """
+        :param journal: MentionJournal object
+        :param checkpoint: function called with the id of the newest mention such that all the older are completed
+        """
+        self.journal = journal
+        self.checkpoint = checkpoint
+        self._order = deque()  # ids of the mentions not completed yet, the oldest first
+        self._completed = set()
+        self._lock = threading.Lock()
+
+    def track(self, mention_ids):
+        """ Add mentions (the oldest first) to the ones not completed yet. """
+        with self._lock:
+            self._order.extend(mention_ids)
+
+    def complete(self, mention_id, handled=True):
+        """ Mark the mention as handled (or dropped, see MentionJournal.complete) and move the checkpoint forward. """
+        with self._lock:
+            self.journal.complete(mention_id, handled)
+            self._completed.add(mention_id)
+            last_id = None
+            while self._order and self._order[0] in self._completed:
+                last_id = self._order.popleft()
+                self._completed.remove(last_id)
+            if last_id is not None:
+                self.checkpoint(last_id)
@@ -0,0 +1,226 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# seconds
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+LAG_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 3*3600, 12*3600, 24*3600)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'wordcloud_stage_seconds': ('histogram', 'Time spent in every stage of a word cloud request.', STAGE_BUCKETS),
+    'twitter_api_call_seconds': ('histogram', 'Time of the calls to the Twitter API.', STAGE_BUCKETS),
+    'mention_reply_lag_seconds': ('histogram', 'Time from a mention to its reply.', LAG_BUCKETS),
+    'twitter_api_calls_total': ('counter', 'Calls to the Twitter API, retries included.', None),
+    'twitter_api_retries_total': ('counter', 'Calls to the Twitter API retried after an error.', None),
+    'twitter_api_rate_limited_total': ('counter', 'Calls to the Twitter API rejected with a 429.', None),
+    'imgur_uploads_total': ('counter', 'Uploads to imgur, retries included.', None),
+    'imgur_upload_errors_total': ('counter', 'Uploads to imgur that failed.', None),
+    'replies_total': ('counter', 'Replies to the mentions.', None),
+    'reply_retries_total': ('counter', 'Replies retried after an error.', None),
+    'retries_total': ('counter', 'Uploads and replies parked in the retry queue and tried again, by result.', None),
+    'retries_pending': ('gauge', 'Uploads and replies waiting in the retry queue.', None),
+    'cache_lookups_total': ('counter', 'Lookups in the tweet and image caches.', None),
+    'prerenders_total': ('counter', 'Word clouds of popular accounts refreshed while idle, by result.', None),
+    'profile_skips_total': ('counter', 'Requests skipped because the account is protected or not found.', None),
+    'mentions_received_total': ('counter', 'Mentions downloaded.', None),
+    'mentions_completed_total': ('counter', 'Mentions handled.', None),
+    'mentions_shed_total': ('counter', 'Mentions dropped without a reply, by reason (see AdmissionControl).', None),
+    'mentions_pending': ('gauge', 'Mentions waiting to be handled.', None),
+    'mention_lag_seconds': ('gauge', 'Age of the oldest mention waiting to be handled.', None),
+    'pipeline_queue_depth': ('gauge', 'Mentions waiting in front of every stage of the pipeline.', None),
+    'work_queue_expired_leases_total': ('counter', 'Mentions claimed again after the lease of a worker expired.', None),
+    'work_queue_failed_total': ('counter', 'Mentions given up after too many attempts.', None),
+}
+
+# milliseconds, the time of the first tweet id with a timestamp
+TWITTER_EPOCH = 1288834974657
+
+
+def snowflake_time(tweet_id):
+    """
+    :param tweet_id: id of a tweet (int or string)
+    :return: unix time when the tweet was posted, None for ids older than November 2010 (no timestamp)
+    """
+    tweet_id = int(tweet_id)
+    if tweet_id < 1 << 32:
+        return None
+    return ((tweet_id >> 22) + TWITTER_EPOCH) / 1000.0
+
+
+class Metrics(object):
+    """ Counters, gauges and timers of the bot, exported in the Prometheus text format (see MetricsServer).
+        Every metric is identified by a name declared in METRICS and by its labels, e.g.
+        REGISTRY.inc('twitter_api_calls_total', endpoint='statuses/update')
+        The observations of the timers and the events can also be written as json lines to a log file.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}  # (name, labels) -> value
+        self._gauges = {}  # (name, labels) -> value or function returning it
+        self._histograms = {}  # (name, labels) -> [count of every bucket, sum, count]
+        self._json_log = None
+
+    @staticmethod
+    def _key(name, labels):
+        if name not in METRICS:
+            raise KeyError('Unknown metric ' + name)
+        return name, tuple(sorted(labels.items()))
+
+    def open_json_log(self, path):
+        """ Append the observations of the timers and the events (see log) to a file of json lines. """
+        with self._lock:
+            if self._json_log is not None:
+                self._json_log.close()
+            self._json_log = open(path, 'a', buffering=1, encoding='utf-8')
+
+    def log(self, event, **fields):
+        """ Write an event to the json log, if it's open. """
+        if self._json_log is None:
+            return
+        record = dict(fields, time=time.time(), event=event)
+        line = json.dumps(record, default=str) + '\n'
+        with self._lock:
+            if self._json_log is not None:
+                self._json_log.write(line)
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """ Set a gauge to a value, or to a function called at every export. """
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        buckets = METRICS[name][2]
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+        self.log(name, value=value, **labels)
+
+    @contextmanager
+    def time(self, name, **labels):
+        """ Observe how many seconds the block takes. """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def value(self, name, **labels):
+        """
+        :return: the value of a counter or a gauge, the number of observations of a histogram
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            if key in self._histograms:
+                return self._histograms[key][2]
+            value = self._gauges.get(key, self._counters.get(key, 0))
+        return value() if callable(value) else value
+
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        labels = list(labels) + list(extra)
+        if not labels:
+            return ''
+        return '{' + ','.join('{0}="{1}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                              for k, v in labels) + '}'
+
+    def render(self):
+        """
+        :return: all the metrics in the Prometheus text format
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {k: (list(v[0]), v[1], v[2]) for k, v in self._histograms.items()}
+
+        lines = []
+        for name, (kind, help_text, buckets) in sorted(METRICS.items()):
+            samples = {'counter': counters, 'gauge': gauges, 'histogram': histograms}[kind]
+            keys = sorted(k for k in samples if k[0] == name)
+            if not keys:
+                continue
+            lines.append('# HELP {0} {1}'.format(name, help_text))
+            lines.append('# TYPE {0} {1}'.format(name, kind))
+            for key in keys:
+                labels = key[1]
+                if kind == 'histogram':
+                    counts, total, count = samples[key]
+                    for bound, bucket_count in zip(buckets, counts):
+                        lines.append('{0}_bucket{1} {2}'.format(name, self._format_labels(labels, [('le', bound)]),
+                                                                bucket_count))
+                    lines.append('{0}_bucket{1} {2}'.format(name, self._format_labels(labels, [('le', '+Inf')]),
+                                                            count))
+                    lines.append('{0}_sum{1} {2}'.format(name, self._format_labels(labels), total))
+                    lines.append('{0}_count{1} {2}'.format(name, self._format_labels(labels), count))
+                else:
+                    value = samples[key]
+                    if callable(value):
+                        try:
+                            value = value()
+                        except Exception:
+                            continue
+                    if value is None:
+                        continue
+                    lines.append('{0}{1} {2}'.format(name, self._format_labels(labels), value))
+        return '\n'.join(lines) + '\n'
+
+
+# the metrics of this process
+REGISTRY = Metrics()
+
+
+class MetricsServer(object):
+    """ Serve the metrics at http://host:port/metrics from a background thread. """
+    def __init__(self, metrics, port, host='127.0.0.1'):
+        """
+        :param metrics: Metrics object
+        :param port: port to listen on, 0 for any free port (see port)
+        :param host: address to listen on, 127.0.0.1 to only accept local connections
+        """
+        self.metrics = metrics
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler(metrics))
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        print('Serving the metrics at http://{0}:{1}/metrics'.format(self.httpd.server_address[0], self.port))
+        return self
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    @staticmethod
+    def _make_handler(metrics):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                data = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+        return Handler
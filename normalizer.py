@@ -0,0 +1,55 @@
+import html
+import re
+from collections import Counter
+
+
+class TweetNormalizer(object):
+    """ Split tweets into the words used by the word clouds, with the same result as
+        TwitterWordCloudBot.clean_text(text).split() but in fewer passes: removing the non-alphanumeric symbols,
+        collapsing the spaces and splitting the text is a single findall of the runs of alphanumeric characters.
+    """
+    P_emails = re.compile(r'\w+@\w+\.\w+')
+    # clean_text removes '(RT )?@[\w]+' after lowercasing the text, so 'RT ' can never match
+    P_mentions = re.compile(r'@\w+')
+    P_links = re.compile(r'https?://.+?(\s|$)')
+    P_words = re.compile(r'\w+')
+
+    @staticmethod
+    def fold_plurals(frequencies):
+        """ Count the plurals as their singular, when both are used, like WordCloud does (a word ending with 's' but
+            not with 'ss' is the plural of the same word without the 's').
+        :param frequencies: Counter of lowercase words
+        :return: Counter of the words with the plurals folded
+        """
+        folded = Counter(frequencies)
+        for word in list(folded):
+            if word.endswith('s') and not word.endswith('ss') and word[:-1] in frequencies:
+                folded[word[:-1]] += folded.pop(word)
+        return folded
+
+    def _strip(self, text):
+        """ Remove emails, mentions and links from an unescaped lowercase text. """
+        text = self.P_emails.sub(' ', text)
+        text = self.P_mentions.sub(' ', text)
+        return self.P_links.sub(' ', text)
+
+    def tokenize(self, text):
+        """
+        :param text: text of a tweet
+        :return: list of the words of the text (same as clean_text(text).split())
+        """
+        return self.P_words.findall(self._strip(html.unescape(text).lower()))
+
+    def normalize(self, text):
+        """
+        :param text: text of a tweet
+        :return: the text cleaned (same as clean_text(text))
+        """
+        return ' '.join(self.tokenize(text))
+
+    def tokenize_many(self, texts):
+        """ Split many tweets into words.
+        :param texts: iterable of tweet texts
+        :return: iterator over the lists of words, one for every text in the same order (same as tokenize)
+        """
+        return map(self.tokenize, texts)
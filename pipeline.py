@@ -0,0 +1,215 @@
+import queue
+import threading
+from collections import deque
+
+from mentionjournal import CompletionTracker
+from metrics import REGISTRY
+
+
+class MentionJob(object):
+    """ A mention travelling through the pipeline, every stage fills in its own result. """
+    def __init__(self, mention):
+        self.mention = mention
+        self.user_name = None
+        self.status = None
+        self.frequencies = None
+        self.cache_key = None
+        self.image = None  # path to the image or the encoded image (bytes)
+        self.imgur_id = None
+        # jobs requesting the same word cloud while this one was building it
+        self.followers = []
+
+
+class MentionPipeline(object):
+    """ Handle many mentions at the same time: downloading the timelines, rendering, uploading to imgur and replying
+        run in separate stages connected by bounded queues, every stage with its own pool of worker threads.
+
+        The mentions enter the pipeline from the oldest to the newest (the newest first during a flood, see
+        AdmissionControl), but they can complete in any order.
+        Every mention is marked as handled in the journal as soon as it completes, while 'lastmentionid' only moves
+        forward up to the newest mention such that all the older ones are completed.
+
+        A mention requesting the word cloud of an account that is already being built waits for it instead of
+        building it again: when the image is uploaded, its link is sent to every requester. When the upload or a reply
+        fails, it's parked in the retry queue of the bot (see RetryQueue) with the mentions waiting for it.
+    """
+    STAGES = ['fetch', 'render', 'upload', 'reply']
+    JOINED = object()
+
+    def __init__(self, bot, workers, queue_size=10, poll_every=10):
+        """
+        :param bot: TwitterWordCloudBot object
+        :param workers: dict mapping every stage name (see STAGES) to its number of worker threads
+        :param queue_size: max number of mentions waiting in front of every stage
+        :param poll_every: download the new mentions after this many mentions entered the pipeline, 0 to never
+                           download them
+        """
+        self.bot = bot
+        self.workers = workers
+        self.queue_size = queue_size
+        self.poll_every = poll_every
+
+        self._lock = threading.Lock()
+        self._tracker = None
+        self._handled = 0
+        self._inflight = {}  # lowercase name of a twitter account -> job building its word cloud
+        self._queues = []
+
+    def run(self, mention_ids):
+        """ Handle the mentions and the ones arriving in the meantime.
+        :param mention_ids: list of the ids of mentions in the journal of the bot, the oldest first
+        :return: number of mentions handled
+        """
+        self._tracker = CompletionTracker(self.bot.journal, self.bot.checkpoint)
+        self._handled = 0
+        self._inflight = {}
+        self._tracker.track(mention_ids)
+        mention_ids = self.bot.schedule_mentions(mention_ids, self._tracker)
+
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.STAGES]
+        queues.append(None)  # the reply stage doesn't pass the jobs any further
+        self._queues = queues
+        steps = [self._fetch, self._render, self._upload, self._reply]
+        threads = []
+        for i, stage in enumerate(self.STAGES):
+            REGISTRY.set('pipeline_queue_depth', queues[i].qsize, stage=stage)
+            stage_threads = [threading.Thread(target=self._work, args=(steps[i], queues[i], queues[i+1]),
+                                              name='{0}-{1}'.format(stage, n), daemon=True)
+                             for n in range(max(1, self.workers.get(stage, 1)))]
+            for t in stage_threads:
+                t.start()
+            threads.append(stage_threads)
+
+        self._feed(mention_ids, queues[0])
+
+        # shut the stages down in order, so that every job still queued is handled before the stop markers
+        for i, stage_threads in enumerate(threads):
+            for _ in stage_threads:
+                queues[i].put(None)
+            for t in stage_threads:
+                t.join()
+            REGISTRY.set('pipeline_queue_depth', 0, stage=self.STAGES[i])
+        return self._handled
+
+    def _feed(self, mention_ids, fetch_queue):
+        mention_ids = deque(mention_ids)
+        queued = set(mention_ids)
+        fed = 0
+        while mention_ids:
+            mention_id = mention_ids.popleft()
+            if self.bot.admission.drop_stale(mention_id):
+                self._tracker.complete(mention_id, handled=False)
+                continue
+            fed += 1
+            self._handled += 1
+            # the mentions are read from the journal only when they enter the pipeline
+            fetch_queue.put(MentionJob(self.bot.journal.get(mention_id)))
+
+            if self.poll_every and fed % self.poll_every == 0:
+                new_mentions = self.bot.get_new_mentions()
+                # the poller of the bot can return a mention that was already pending
+                new_ids = [m.id_str for m in reversed(new_mentions) if m.id_str not in queued]
+                if new_ids:
+                    queued.update(new_ids)
+                    self._tracker.track(new_ids)
+                    # the new mentions may go first, or push the oldest ones over the max backlog
+                    mention_ids = deque(self.bot.schedule_mentions(list(mention_ids) + new_ids, self._tracker))
+                    print("\nThere are {0} new mentions, now I have to handle {1} mentions in total.\n"
+                          .format(len(new_ids), len(mention_ids)))
+
+    def _detach_followers(self, job):
+        """ Stop accepting followers for the word cloud of the job.
+        :return: the list of followers of the job
+        """
+        with self._lock:
+            key = job.user_name.lower() if job.user_name is not None else None
+            if self._inflight.get(key) is job:
+                del self._inflight[key]
+            followers, job.followers = job.followers, []
+        return followers
+
+    def _complete(self, job):
+        """ Mark the mention (and the followers still waiting for it) as handled and move the checkpoint forward. """
+        for follower in self._detach_followers(job):
+            # the word cloud failed, it would fail for them as well
+            self._complete(follower)
+        self._tracker.complete(job.mention.id_str)
+
+    def _work(self, step, in_queue, out_queue):
+        while True:
+            job = in_queue.get()
+            if job is None:
+                return
+            try:
+                keep_going = step(job)
+            except Exception as e:
+                print("Error while handling mention {0}: {1}\n".format(job.mention.id_str, e))
+                keep_going = False
+            if keep_going is self.JOINED:
+                continue
+            if keep_going and out_queue is not None:
+                out_queue.put(job)
+            else:
+                self._complete(job)
+
+    # Every step returns True if the job should go on to the next stage, False if it's completed and JOINED if it's
+    # waiting for the word cloud of another job
+
+    def _fetch(self, job):
+        request = self.bot.parse_mention(job.mention)
+        if request is None:
+            return False
+        job.user_name, job.status = request
+        with self._lock:
+            leader = self._inflight.get(job.user_name.lower())
+            if leader is not None:
+                leader.followers.append(job)
+                print("Mention {0} is waiting for the word cloud of @{1} requested by mention {2}\n"
+                      .format(job.mention.id_str, job.user_name, leader.mention.id_str))
+                return self.JOINED
+            self._inflight[job.user_name.lower()] = job
+        fetched = self.bot.fetch_wordcloud(job.user_name)
+        if fetched is None:
+            print("Error: failed building the word cloud\n")
+            return False
+        job.cache_key, cached, job.frequencies = fetched
+        if cached is not None:
+            # the render (and maybe the upload) can be skipped
+            job.image, job.imgur_id = cached
+        return True
+
+    def _render(self, job):
+        if job.image is not None or job.imgur_id is not None:
+            return True
+        job.image = self.bot.render_to_cache(job.user_name, job.frequencies, job.cache_key)
+        job.frequencies = None
+        if job.image is None:
+            print("Error: failed building the word cloud\n")
+            return False
+        return True
+
+    def _upload(self, job):
+        if job.imgur_id is None:
+            job.imgur_id = self.bot.upload_wordcloud(job.image, job.user_name)
+            image, job.image = job.image, None
+            if job.imgur_id is None:
+                print("Error: failed uploading the word cloud image\n")
+                if self.bot.retry_queue is not None:
+                    # the followers wait for the retry with the job
+                    followers = self._detach_followers(job)
+                    self.bot.park_upload(job.user_name, job.cache_key, image,
+                                         [(j.mention.id_str, j.status) for j in [job] + followers])
+                    for follower in followers:
+                        self._complete(follower)
+                return False
+            self.bot.image_cache.set_imgur_id(job.cache_key, job.imgur_id)
+        for follower in self._detach_followers(job):
+            follower.imgur_id = job.imgur_id
+            self._queues[self.STAGES.index('reply')].put(follower)
+        return True
+
+    def _reply(self, job):
+        status = job.status + 'http://imgur.com/' + job.imgur_id
+        if self.bot.post_status(status, job.mention.id_str) is None:
+            self.bot.park_reply(status, job.mention.id_str)
+        return False
@@ -0,0 +1,112 @@
+import threading
+import time
+
+
+class PollSchedule(object):
+    """ How long to wait before the next poll of the mentions: the interval shrinks by speedup for every new mention
+        found by a poll, down to min_interval, and it grows by backoff at every poll finding none, up to max_interval.
+        A single mention in a quiet period halves the interval, while a burst of mentions brings it to min_interval
+        right away, so the polls are spent when many mentions are waiting for them. The polls saved while it's quiet
+        (max_interval is longer than the 5 minutes of the fixed schedule) pay for the ones of the bursts: with the
+        defaults it makes a few less calls than polling every 5 minutes (see benchmarks/bench_polling.py).
+        The interval is never shorter than what the rate limit of the endpoint allows, spreading its remaining calls
+        until the reset of the window.
+    """
+    def __init__(self, min_interval=60, max_interval=400, backoff=2.0, speedup=2.0, rate_limiter=None,
+                 endpoint='statuses/mentions_timeline', clock=time.time):
+        """
+        :param min_interval: seconds between the polls while mentions are arriving
+        :param max_interval: max seconds between the polls while there are no mentions
+        :param backoff: factor by which the interval grows after every poll without new mentions
+        :param speedup: factor by which the interval shrinks for every new mention
+        :param rate_limiter: RateLimiter of the TwitterApi polling the mentions, None to ignore the rate limit
+        :param endpoint: endpoint polled
+        :param clock: function returning the current unix time
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.speedup = speedup
+        self.rate_limiter = rate_limiter
+        self.endpoint = endpoint
+        self.clock = clock
+        self.interval = min_interval
+
+    def next_interval(self, num_new_mentions):
+        """
+        :param num_new_mentions: number of new mentions found by the last poll
+        :return: seconds to wait before the next poll
+        """
+        if num_new_mentions > 0:
+            self.interval = max(self.min_interval, self.interval / self.speedup ** min(num_new_mentions, 10))
+        else:
+            self.interval = min(self.max_interval, self.interval * self.backoff)
+        return max(self.interval, self.budget_interval())
+
+    def budget_interval(self):
+        """
+        :return: seconds between the polls that spread the remaining calls to the endpoint until the reset of its rate
+                 limit window, 0 if the rate limit is unknown
+        """
+        if self.rate_limiter is None:
+            return 0
+        limit = self.rate_limiter.endpoint(self.endpoint)
+        with limit.lock:
+            remaining, reset = limit.remaining, limit.reset
+        now = self.clock()
+        if remaining is None or reset is None or reset <= now:
+            return 0
+        return (reset - now) / max(remaining, 1)
+
+
+class MentionPoller(threading.Thread):
+    """ Download the new mentions in the background on a PollSchedule, while the bot is handling the ones already
+        downloaded. The bot takes the new mentions with claim instead of calling the API (see
+        TwitterWordCloudBot.get_new_mentions).
+    """
+    def __init__(self, download, schedule):
+        """
+        :param download: function downloading the new mentions, adding them to the journal and returning them
+                         (the newest at the top)
+        :param schedule: PollSchedule
+        """
+        super(MentionPoller, self).__init__(name='mention-poller', daemon=True)
+        self.download = download
+        self.schedule = schedule
+        self._unclaimed = []
+        self._lock = threading.Lock()
+        self._arrived = threading.Event()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                new_mentions = self.download()
+            except Exception as e:
+                print("Error while polling the mentions: {0}".format(e))
+                new_mentions = []
+            if new_mentions:
+                with self._lock:
+                    self._unclaimed = new_mentions + self._unclaimed
+                self._arrived.set()
+            interval = self.schedule.next_interval(len(new_mentions))
+            self._stop_event.wait(interval)
+
+    def claim(self):
+        """
+        :return: list of the mentions downloaded since the last call, the newest at the top
+        """
+        with self._lock:
+            new_mentions, self._unclaimed = self._unclaimed, []
+        return new_mentions
+
+    def wait(self, timeout=None):
+        """ Block until some new mentions are downloaded (even if they were already claimed).
+        :return: True if there are new mentions, False if the timeout expired
+        """
+        arrived = self._arrived.wait(timeout)
+        self._arrived.clear()
+        return arrived
+
+    def stop(self):
+        self._stop_event.set()
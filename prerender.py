@@ -0,0 +1,100 @@
+import threading
+import time
+
+from metrics import REGISTRY
+from sketch import SpaceSaving
+
+
+class Prerenderer(object):
+    """ Build and upload the word clouds of the accounts requested most often while the bot is idle, so that their
+        next requests find a fresh link in the image cache and are answered right away.
+
+        The requests of every account are counted in a SpaceSaving sketch of 10 * top accounts. While the bot is idle,
+        the word cloud of the top accounts requested at least min_requests times, and at least once in the last
+        window seconds, is built again every interval seconds: only the new tweets are downloaded, and the image is
+        rendered and uploaded only if they changed it. The refresh stops while less than reserve of the calls to
+        statuses/user_timeline are left in the current window, to keep them for the requests.
+    """
+    ENDPOINT = 'statuses/user_timeline'
+
+    def __init__(self, build, top=20, min_requests=2, interval=900, reserve=0.5, window=24*3600, rate_limiter=None,
+                 clock=time.time):
+        """
+        :param build: function building and uploading the word cloud of an account, returning its imgur id or None
+                      (see TwitterWordCloudBot.get_wordcloud_link)
+        :param top: number of accounts whose word clouds are kept fresh
+        :param min_requests: min number of requests of an account
+        :param interval: seconds between two refreshes of the word cloud of an account
+        :param reserve: fraction of the calls to statuses/user_timeline kept for the requests
+        :param window: seconds since the last request after which an account is not refreshed anymore
+        :param rate_limiter: RateLimiter of the Twitter API, None to ignore the rate limits
+        :param clock: function returning the current unix time
+        """
+        self.build = build
+        self.top = top
+        self.min_requests = min_requests
+        self.interval = interval
+        self.reserve = reserve
+        self.window = window
+        self.rate_limiter = rate_limiter
+        self.clock = clock
+        self._requests = SpaceSaving(10 * top)
+        self._last_requested = {}  # lowercase name of an account -> time of its last request
+        self._refreshed = {}  # lowercase name of an account -> time of the last refresh of its word cloud
+        self._lock = threading.Lock()
+
+    def record(self, target):
+        """ Count a request.
+        :param target: name of the twitter account (or of the query, see CloudQuery) requested by a mention
+        """
+        target = target.lower()
+        with self._lock:
+            self._requests.add(target)
+            self._last_requested[target] = self.clock()
+            if len(self._last_requested) > 2 * self._requests.capacity:
+                # forget the accounts evicted from the sketch
+                self._last_requested = {t: v for t, v in self._last_requested.items() if t in self._requests}
+                self._refreshed = {t: v for t, v in self._refreshed.items() if t in self._requests}
+
+    def due(self):
+        """
+        :return: list of the accounts whose word clouds should be refreshed now, the most requested first
+        """
+        now = self.clock()
+        with self._lock:
+            return [target for target, count in self._requests.most_common(self.top)
+                    if count - self._requests.error(target) >= self.min_requests
+                    and now - self._last_requested.get(target, 0) <= self.window
+                    and now - self._refreshed.get(target, 0) >= self.interval]
+
+    def has_budget(self):
+        """
+        :return: True if more than reserve of the calls to statuses/user_timeline are left in the current window
+        """
+        if self.rate_limiter is None:
+            return True
+        return self.rate_limiter.spare(self.ENDPOINT, self.reserve)
+
+    def run(self, deadline=None, busy=None):
+        """ Refresh the word clouds that are due, one after the other.
+        :param deadline: unix time when to stop, None to stop only when nothing is due
+        :param busy: function returning True when the bot has mentions to handle, to stop before the next refresh
+        :return: number of word clouds refreshed
+        """
+        refreshed = 0
+        for target in self.due():
+            if deadline is not None and self.clock() >= deadline:
+                break
+            if (busy is not None and busy()) or not self.has_budget():
+                break
+            print("Refreshing the word cloud of {0} while idle".format(target))
+            with self._lock:
+                self._refreshed[target] = self.clock()
+            try:
+                imgur_id = self.build(target)
+            except Exception as e:
+                print("Error while refreshing the word cloud of {0}: {1}".format(target, e))
+                imgur_id = None
+            REGISTRY.inc('prerenders_total', result='ok' if imgur_id is not None else 'error')
+            refreshed += 1
+        return refreshed
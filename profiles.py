@@ -0,0 +1,113 @@
+import math
+import threading
+import time
+
+from metrics import REGISTRY
+
+# users/lookup takes up to 100 users per request, user_timeline returns up to 200 tweets per page and only the
+# 3200 newest tweets of a user
+LOOKUP_BATCH = 100
+PAGE_SIZE = 200
+MAX_TIMELINE = 3200
+
+
+class ProfileCache(object):
+    """ The profiles of the twitter accounts whose word clouds are requested, downloaded with users/lookup 100 at a
+        time (see prefetch) and kept for ttl seconds.
+
+        A profile tells, before downloading any tweet, whether the account exists and is public, how many tweets it
+        has and which is its newest tweet: so the bot can skip the requests that can't give a word cloud, skip the
+        timeline when the word cloud of the newest tweet is already cached, and download exactly the pages needed
+        (see pages_needed).
+    """
+    NOT_FOUND, PROTECTED = 'not_found', 'protected'
+
+    def __init__(self, twitter_api, ttl=300, clock=time.time):
+        """
+        :param twitter_api: TwitterApi object
+        :param ttl: seconds a profile is kept
+        :param clock: function returning the current unix time
+        """
+        self.twitter_api = twitter_api
+        self.ttl = ttl
+        self.clock = clock
+        self._profiles = {}  # lowercase screen name -> (time of the lookup, Profile or None if not found)
+        self._lock = threading.Lock()
+
+    def _fresh(self, screen_name, now):
+        entry = self._profiles.get(screen_name.lower())
+        return entry is not None and now - entry[0] < self.ttl
+
+    def prefetch(self, screen_names):
+        """ Download the profiles of the accounts which are not cached yet, in batches of 100.
+        :param screen_names: iterable of twitter account names
+        """
+        now = self.clock()
+        with self._lock:
+            missing = sorted({name.lower() for name in screen_names if not self._fresh(name, now)})
+        for i in range(0, len(missing), LOOKUP_BATCH):
+            batch = missing[i:i + LOOKUP_BATCH]
+            try:
+                users = self.twitter_api.lookup_users(batch)
+            except Exception as e:
+                # without the profiles the bot works as before
+                print("Error while looking up {0} users: {1}".format(len(batch), e))
+                continue
+            found = {u.screen_name.lower(): u for u in users}
+            with self._lock:
+                # the accounts missing from the response don't exist or are suspended
+                for name in batch:
+                    self._profiles[name] = (now, found.get(name))
+                self._expire(now)
+
+    def _expire(self, now):
+        if len(self._profiles) > 10000:
+            self._profiles = {k: v for k, v in self._profiles.items() if now - v[0] < self.ttl}
+
+    def get(self, screen_name):
+        """
+        :return: (Profile or None, NOT_FOUND, PROTECTED or None if a word cloud can be built). The Profile is None
+                 also when the lookup failed, then nothing is known about the account
+        """
+        now = self.clock()
+        with self._lock:
+            fresh = self._fresh(screen_name, now)
+        if not fresh:
+            self.prefetch([screen_name])
+        with self._lock:
+            entry = self._profiles.get(screen_name.lower())
+        if entry is None:
+            return None, None
+        profile = entry[1]
+        if profile is None:
+            REGISTRY.inc('profile_skips_total', reason=self.NOT_FOUND)
+            return None, self.NOT_FOUND
+        if profile.protected:
+            REGISTRY.inc('profile_skips_total', reason=self.PROTECTED)
+            return profile, self.PROTECTED
+        return profile, None
+
+    @staticmethod
+    def newest_id(profile):
+        """
+        :return: id of the newest tweet of a user (int), None if it has none or it's unknown
+        """
+        return profile.newest_id if profile is not None else None
+
+    @staticmethod
+    def pages_needed(profile, max_results, cached_count=None):
+        """
+        :param profile: Profile from users/lookup
+        :param max_results: max number of tweets to download
+        :param cached_count: statuses_count of the user when its cached tweets were downloaded, None for a full
+                             harvest
+        :return: number of user_timeline pages to download, 0 if there are no tweets to download
+        """
+        count = profile.statuses_count
+        if cached_count is not None:
+            # tweets deleted since the last harvest make the difference too small, one page catches up anyway
+            new = max(count - cached_count, 1)
+        else:
+            new = count
+        new = min(new, max_results, MAX_TIMELINE)
+        return int(math.ceil(new / float(PAGE_SIZE)))
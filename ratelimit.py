@@ -0,0 +1,171 @@
+import threading
+import time
+
+
+class EndpointLimit(object):
+    """ The rate limit of a single endpoint, as reported by the x-rate-limit-* headers of its last response.
+
+        The calls are paced with a token bucket: it holds at most `burst` calls and it's refilled at the rate that
+        spreads the remaining calls evenly until the reset of the window. When the window is exhausted the calls
+        wait until its reset time.
+    """
+    def __init__(self, burst, clock):
+        self.burst = burst
+        self.clock = clock
+        self.limit = None
+        self.remaining = None
+        self.reset = None
+        self.tokens = float(burst)
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _rate(self, now):
+        """
+        :return: calls per second that can be made until the reset, None if there's no limit known
+        """
+        if self.remaining is None or self.reset is None or now >= self.reset:
+            return None
+        return self.remaining / (self.reset - now)
+
+    def _refill(self, now):
+        rate = self._rate(now)
+        if rate is None:
+            self.tokens = float(self.burst)
+        else:
+            self.tokens = min(float(self.burst), self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+    def delay(self):
+        """
+        :return: seconds to wait before the next call
+        """
+        now = self.clock()
+        if self.reset is not None and now >= self.reset:
+            # a new window started, its quota is unknown until the next response
+            self.remaining = None
+            self.reset = None
+        if self.remaining is not None and self.remaining <= 0:
+            return self.reset - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self._rate(now)
+
+    def take(self):
+        self.tokens -= 1
+        if self.remaining is not None:
+            self.remaining -= 1
+
+    def update(self, limit, remaining, reset):
+        self._refill(self.clock())
+        self.limit = limit
+        self.remaining = remaining
+        self.reset = reset
+
+
+class RateLimiter(object):
+    """ Schedule the calls to the Twitter API according to the rate limit of every endpoint, so that an exhausted
+        endpoint (e.g. statuses/user_timeline) doesn't stop the calls to the others (e.g. statuses/update).
+        Every endpoint has its own lock, so the threads (or the coroutines, see acquire_async) waiting for an endpoint
+        don't block the other endpoints.
+    """
+    # seconds added to the reset times, to be safe from clock differences with Twitter
+    RESET_MARGIN = 2
+    # seconds to wait after a 429 without rate limit headers
+    DEFAULT_WAIT = 60*15 + 5
+
+    def __init__(self, burst=5, clock=time.time, sleep=time.sleep):
+        """
+        :param burst: max number of calls to an endpoint that can be made one after the other without pacing
+        :param clock: function returning the current unix time
+        :param sleep: function sleeping for the given seconds
+        """
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def endpoint(self, name):
+        """
+        :param name: name of the endpoint, e.g. 'statuses/user_timeline'
+        :return: the EndpointLimit of the endpoint
+        """
+        with self._lock:
+            if name not in self._endpoints:
+                self._endpoints[name] = EndpointLimit(self.burst, self.clock)
+            return self._endpoints[name]
+
+    def try_acquire(self, name):
+        """ Take a call to the endpoint if it can be made now.
+        :return: 0 if the call can be made, otherwise the seconds to wait before trying again
+        """
+        limit = self.endpoint(name)
+        with limit.lock:
+            delay = limit.delay()
+            if delay <= 0:
+                limit.take()
+                return 0
+            if limit.remaining is not None and limit.remaining <= 0:
+                print('Rate limit of {0} exhausted, waiting {1:.0f} seconds for its reset'.format(name, delay))
+            return delay
+
+    def spare(self, name, reserve):
+        """
+        :param reserve: fraction of the calls of a window, between 0 and 1
+        :return: True if more than reserve of the calls to the endpoint are left in the current window, or if its limit
+                 is unknown
+        """
+        limit = self.endpoint(name)
+        with limit.lock:
+            if limit.limit is None or limit.remaining is None or limit.reset is None or self.clock() >= limit.reset:
+                return True
+            return limit.remaining > reserve * limit.limit
+
+    def acquire(self, name):
+        """ Block until a call to the endpoint can be made. """
+        while True:
+            delay = self.try_acquire(name)
+            if delay <= 0:
+                return
+            self.sleep(delay)
+
+    async def acquire_async(self, name):
+        """ Wait without blocking the event loop until a call to the endpoint can be made. """
+        import asyncio
+
+        while True:
+            delay = self.try_acquire(name)
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _read_headers(headers):
+        try:
+            return (int(headers['x-rate-limit-limit']), int(headers['x-rate-limit-remaining']),
+                    int(headers['x-rate-limit-reset']))
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def update(self, name, headers):
+        """ Record the rate limit headers of a response of the endpoint. """
+        values = self._read_headers(headers)
+        if values is None:
+            return
+        limit, remaining, reset = values
+        endpoint = self.endpoint(name)
+        with endpoint.lock:
+            endpoint.update(limit, remaining, reset + self.RESET_MARGIN)
+
+    def rate_limited(self, name, headers):
+        """ Record a 429 response of the endpoint: no more calls until the reset of its window. """
+        values = self._read_headers(headers)
+        if values is None:
+            limit, reset = None, self.clock() + self.DEFAULT_WAIT
+        else:
+            limit, _, reset = values
+            reset += self.RESET_MARGIN
+        endpoint = self.endpoint(name)
+        with endpoint.lock:
+            endpoint.update(limit, 0, reset)
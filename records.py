@@ -0,0 +1,116 @@
+class Tweet(object):
+    """ A tweet of a timeline, with the fields needed to count its words.
+        The objects of the Twitter API are dicts of dozens of fields (entities, metadata, coordinates, the whole user
+        object in every mention) while the bot needs only a few of them: TwitterApi projects every object into a
+        Tweet, Mention or Profile as soon as it's downloaded, so the full objects are never kept (see
+        benchmarks/bench_records.py).
+    """
+    __slots__ = ('id', 'text', 'lang', 'in_reply_to_status_id_str')
+
+    def __init__(self, id, text, lang=None, in_reply_to_status_id_str=None):
+        """
+        :param id: id of the tweet (int)
+        :param text: text of the tweet
+        :param lang: language of the tweet detected by Twitter, None if unknown
+        :param in_reply_to_status_id_str: id of the tweet this one replies to (string), None if it's not a reply
+        """
+        self.id = id
+        self.text = text
+        self.lang = lang
+        self.in_reply_to_status_id_str = in_reply_to_status_id_str
+
+    @property
+    def id_str(self):
+        return str(self.id)
+
+    @classmethod
+    def from_json(cls, tweet):
+        """
+        :param tweet: tweet object of the Twitter API (dict), or a Tweet
+        :return: Tweet
+        """
+        if isinstance(tweet, cls):
+            return tweet
+        return cls(tweet['id'], tweet['text'], tweet.get('lang'), tweet.get('in_reply_to_status_id_str'))
+
+    def __repr__(self):
+        return 'Tweet({0!r}, {1!r}, {2!r})'.format(self.id, self.text, self.lang)
+
+
+class Mention(object):
+    """ A tweet mentioning the bot, with the fields needed to parse a word cloud request and to reply to it. """
+    __slots__ = ('id_str', 'text', 'screen_name', 'hashtags', 'user_mentions')
+
+    def __init__(self, id_str, text, screen_name, hashtags=(), user_mentions=()):
+        """
+        :param id_str: id of the mention (string)
+        :param text: text of the mention
+        :param screen_name: name of the twitter account which posted the mention
+        :param hashtags: tuple of the hashtags in the mention, without the #
+        :param user_mentions: tuple of the names of the twitter accounts mentioned, in order
+        """
+        self.id_str = id_str
+        self.text = text
+        self.screen_name = screen_name
+        self.hashtags = tuple(hashtags)
+        self.user_mentions = tuple(user_mentions)
+
+    @property
+    def id(self):
+        return int(self.id_str)
+
+    @classmethod
+    def from_json(cls, mention):
+        """
+        :param mention: tweet object of the Twitter API (dict), as returned by statuses/mentions_timeline or to_json,
+                        or a Mention
+        :return: Mention
+        """
+        if isinstance(mention, cls):
+            return mention
+        entities = mention.get('entities', {})
+        return cls(mention['id_str'], mention['text'], mention['user']['screen_name'],
+                   [h['text'] for h in entities.get('hashtags', ())],
+                   [u['screen_name'] for u in entities.get('user_mentions', ())])
+
+    def to_json(self):
+        """
+        :return: the fields of the mention as a tweet object of the Twitter API (dict), see from_json
+        """
+        return {'id_str': self.id_str, 'text': self.text, 'user': {'screen_name': self.screen_name},
+                'entities': {'hashtags': [{'text': h} for h in self.hashtags],
+                             'user_mentions': [{'screen_name': u} for u in self.user_mentions]}}
+
+    def __repr__(self):
+        return 'Mention({0!r}, {1!r}, {2!r})'.format(self.id_str, self.text, self.screen_name)
+
+
+class Profile(object):
+    """ A twitter account looked up with users/lookup (see ProfileCache). """
+    __slots__ = ('screen_name', 'protected', 'statuses_count', 'newest_id')
+
+    def __init__(self, screen_name, protected=False, statuses_count=0, newest_id=None):
+        """
+        :param screen_name: name of the twitter account
+        :param protected: True if only the followers of the account can see its tweets
+        :param statuses_count: number of tweets of the account, retweets included
+        :param newest_id: id of the newest tweet of the account (int), None if it has none or it's unknown
+        """
+        self.screen_name = screen_name
+        self.protected = protected
+        self.statuses_count = statuses_count
+        self.newest_id = newest_id
+
+    @classmethod
+    def from_json(cls, user):
+        """
+        :param user: user object of the Twitter API (dict)
+        :return: Profile
+        """
+        status = user.get('status')
+        return cls(user['screen_name'], bool(user.get('protected')), user.get('statuses_count', 0),
+                   status['id'] if status else None)
+
+    def __repr__(self):
+        return 'Profile({0!r}, {1!r}, {2!r}, {3!r})'.format(self.screen_name, self.protected, self.statuses_count,
+                                                           self.newest_id)
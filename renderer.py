@@ -0,0 +1,65 @@
+import multiprocessing
+
+from encoder import ImageEncoder
+from layout import new_wordcloud
+
+# the workers are started by a fork server (spawned where there is none), never forked from the bot: by the first render
+# the bot runs threads (pipeline, feeder, retries), and a forked worker could inherit a lock one of them held
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# configuration of the render worker process, set once by _init_worker
+_worker_config = None
+_worker_encoder = None
+
+
+def _init_worker(width, height, max_words, font_path, layout_scale, encoder):
+    """ Run once in every worker process: import the rendering stack, load the font and render a tiny word cloud so
+        that the first real request doesn't pay for the warm up.
+    """
+    global _worker_config, _worker_encoder
+    _worker_config = {'width': width, 'height': height, 'max_words': max_words, 'font_path': font_path,
+                      'layout_scale': layout_scale}
+    _worker_encoder = encoder
+    wordcloud = new_wordcloud(64, 64, 1, font_path, layout_scale)
+    encoder.encode(wordcloud.generate_from_frequencies({'warmup': 1}).to_image())
+
+
+def _render(frequencies):
+    wordcloud = new_wordcloud(**_worker_config).generate_from_frequencies(frequencies)
+    return _worker_encoder.encode(wordcloud.to_image())
+
+
+class RenderPool(object):
+    """ Render word clouds in a pool of worker processes, so that rendering is not limited to the core running the
+        bot. The workers are started only once and keep the font and the image configuration loaded.
+    """
+    def __init__(self, processes, width, height, max_words, font_path=None, encoder=None, layout_scale=1):
+        """
+        :param processes: number of worker processes
+        :param width: width of the images
+        :param height: height of the images
+        :param max_words: max number of words displayed in the images
+        :param font_path: path to the font used in the images, None to use the default font of WordCloud
+        :param encoder: ImageEncoder of the images, None for the default one
+        :param layout_scale: see layout.FastWordCloud, 1 to render with a plain WordCloud
+        """
+        self.max_words = max_words
+        encoder = encoder if encoder is not None else ImageEncoder()
+        context = multiprocessing.get_context(START_METHOD)
+        self.pool = context.Pool(processes, initializer=_init_worker,
+                                 initargs=(width, height, max_words, font_path, layout_scale, encoder))
+
+    def render(self, frequencies):
+        """ Render a word cloud, this call blocks until a worker is free and the image is ready, so call it from many
+            threads to keep all the workers busy.
+        :param frequencies: dict mapping every word to its frequency
+        :return: the encoded image (bytes)
+        """
+        # WordCloud only uses the most frequent words, don't send the others to the worker
+        if len(frequencies) > self.max_words:
+            frequencies = dict(sorted(frequencies.items(), key=lambda f: f[1], reverse=True)[:self.max_words])
+        return self.pool.apply(_render, (frequencies,))
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
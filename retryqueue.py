@@ -0,0 +1,184 @@
+import random
+import sqlite3
+import threading
+import time
+
+from metrics import REGISTRY
+
+
+class Retry(object):
+    """ An upload or a reply parked in the RetryQueue. """
+    def __init__(self, op, mention_id, target, status, cache_key, attempts):
+        """
+        :param op: RetryQueue.UPLOAD or RetryQueue.REPLY
+        :param mention_id: id of the mention waiting for the operation (string)
+        :param target: name of the twitter account (or of the CloudQuery) of the word cloud
+        :param status: text of the reply, without the link of the word cloud for an upload
+        :param cache_key: key of the word cloud in the image cache, None for a reply
+        :param attempts: number of times the operation failed
+        """
+        self.op = op
+        self.mention_id = mention_id
+        self.target = target
+        self.status = status
+        self.cache_key = cache_key
+        self.attempts = attempts
+
+
+class RetryQueue(object):
+    """ The uploads and the replies that failed, parked in a SQLite database to be tried again later, so that a flaky
+        response of imgur or Twitter doesn't keep the other mentions waiting, and the operations parked survive a
+        restart of the bot.
+
+        After its n-th failure an operation waits base_delay * 2 ** (n - 1) seconds, at most max_delay, before it's
+        tried again, minus a random jitter of up to half of it so that the operations failed together are not all
+        tried again at the same time. After max_attempts failures it's given up.
+
+        An upload is parked together with every mention waiting for its link, the key of the word cloud in the image
+        cache and the encoded image when it's in memory, so that the retry uploads the image already rendered. When
+        the upload succeeds, the mentions are answered and their replies that fail are parked on their own.
+        A reply is parked with its whole text, the link included.
+    """
+    UPLOAD, REPLY = 'upload', 'reply'
+
+    def __init__(self, path, base_delay=60, max_delay=3600, max_attempts=8, clock=time.time, rnd=None):
+        """
+        :param path: path to the database file
+        :param base_delay: seconds before the first retry
+        :param max_delay: max seconds between two retries
+        :param max_attempts: max number of failures of an operation, then it's given up
+        :param clock: function returning the current unix time
+        :param rnd: random.Random drawing the jitter, None for a new one
+        """
+        self.path = path
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self.rnd = rnd if rnd is not None else random.Random()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS retries (
+                mention_id TEXT PRIMARY KEY,
+                op TEXT NOT NULL,
+                target TEXT NOT NULL,
+                status TEXT NOT NULL,
+                cache_key TEXT,
+                attempts INTEGER NOT NULL,
+                due REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS retries_due ON retries (due);
+            CREATE TABLE IF NOT EXISTS images (
+                cache_key TEXT PRIMARY KEY,
+                image BLOB NOT NULL);
+        ''')
+        self._db.commit()
+
+    def delay(self, attempts):
+        """
+        :param attempts: number of times the operation failed
+        :return: seconds to wait before the next attempt
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay - self.rnd.uniform(0, delay / 2.0)
+
+    def park_upload(self, target, cache_key, image, requests):
+        """ Park an upload that failed.
+        :param target: name of the twitter account (or of the CloudQuery) of the word cloud
+        :param cache_key: key of the word cloud in the image cache
+        :param image: path to the image or the encoded image (bytes), which is kept until the upload succeeds
+        :param requests: list of (id of a mention waiting for the link, beginning of its reply status)
+        """
+        due = self.clock() + self.delay(1)
+        with self._lock:
+            if isinstance(image, bytes) and cache_key is not None:
+                self._db.execute('INSERT OR REPLACE INTO images (cache_key, image) VALUES (?, ?)',
+                                 (cache_key, sqlite3.Binary(image)))
+            self._db.executemany('INSERT OR REPLACE INTO retries (mention_id, op, target, status, cache_key, attempts, '
+                                 'due) VALUES (?, ?, ?, ?, ?, 1, ?)',
+                                 [(mention_id, self.UPLOAD, target, status, cache_key, due)
+                                  for mention_id, status in requests])
+            self._db.commit()
+        REGISTRY.inc('retries_total', len(requests), operation=self.UPLOAD, result='parked')
+        print("Parked the upload of the word cloud of {0} for {1} mention(s), retrying in {2:.0f} seconds"
+              .format(target, len(requests), due - self.clock()))
+
+    def park_reply(self, mention_id, status):
+        """ Park a reply that failed.
+        :param mention_id: id of the mention (string)
+        :param status: text of the reply
+        """
+        due = self.clock() + self.delay(1)
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO retries (mention_id, op, target, status, cache_key, attempts, '
+                             'due) VALUES (?, ?, ?, ?, NULL, 1, ?)', (mention_id, self.REPLY, '', status, due))
+            self._collect_images()
+            self._db.commit()
+        REGISTRY.inc('retries_total', operation=self.REPLY, result='parked')
+        print("Parked the reply to {0}, retrying in {1:.0f} seconds".format(mention_id, due - self.clock()))
+
+    def due(self):
+        """
+        :return: list of the Retry objects due now, the first due first
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT op, mention_id, target, status, cache_key, attempts FROM retries '
+                                    'WHERE due <= ? ORDER BY due, mention_id', (self.clock(),)).fetchall()
+        return [Retry(*row) for row in rows]
+
+    def next_due(self):
+        """
+        :return: unix time when the next operation is due, None if there are none
+        """
+        with self._lock:
+            return self._db.execute('SELECT MIN(due) FROM retries').fetchone()[0]
+
+    def image(self, cache_key):
+        """
+        :return: the encoded image (bytes) kept for a parked upload, None if it wasn't in memory
+        """
+        with self._lock:
+            row = self._db.execute('SELECT image FROM images WHERE cache_key = ?', (cache_key,)).fetchone()
+        return bytes(row[0]) if row is not None else None
+
+    def done(self, retry):
+        """ Remove an operation that succeeded. """
+        with self._lock:
+            self._db.execute('DELETE FROM retries WHERE mention_id = ?', (retry.mention_id,))
+            self._collect_images()
+            self._db.commit()
+        REGISTRY.inc('retries_total', operation=retry.op, result='ok')
+
+    def failed(self, retry):
+        """ Schedule the next attempt of an operation that failed again, or give it up after max_attempts.
+        :return: False if the operation was given up
+        """
+        attempts = retry.attempts + 1
+        with self._lock:
+            if attempts >= self.max_attempts:
+                self._db.execute('DELETE FROM retries WHERE mention_id = ?', (retry.mention_id,))
+                self._collect_images()
+            else:
+                self._db.execute('UPDATE retries SET attempts = ?, due = ? WHERE mention_id = ?',
+                                 (attempts, self.clock() + self.delay(attempts), retry.mention_id))
+            self._db.commit()
+        if attempts >= self.max_attempts:
+            REGISTRY.inc('retries_total', operation=retry.op, result='given_up')
+            print("Gave up the {0} for the mention {1} after {2} attempts".format(retry.op, retry.mention_id, attempts))
+            return False
+        REGISTRY.inc('retries_total', operation=retry.op, result='failed')
+        return True
+
+    def _collect_images(self):
+        """ Delete the images no parked upload is waiting for. """
+        self._db.execute('DELETE FROM images WHERE cache_key NOT IN '
+                         '(SELECT cache_key FROM retries WHERE op = ? AND cache_key IS NOT NULL)', (self.UPLOAD,))
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM retries').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
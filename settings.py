@@ -1,10 +1,15 @@
 import configparser
+import os
+
+from stopwords import StopwordIndex
+
 
 class Settings(object):
     def __init__(self, settings_file):
         self.settings_file = settings_file
         self.config = configparser.ConfigParser()
         self.config.read(self.settings_file)
+        self._dirty = False
 
         self.IMGUR = 'imgur'
         self.TWITTER = 'twitter'
@@ -22,17 +27,31 @@ class Settings(object):
     def read_twitter_access_token_secret(self):
         return self.config[self.TWITTER]['accesstokensecret']
 
-    def write_last_mention_id(self, id):
+    def write_last_mention_id(self, id, flush=True):
         """ Save to file the last mention id.
         :param id: last mention id
+        :param flush: False to only update it in memory, it will be written by the next flush
         :return:
         """
         self.config[self.CONFIGS]['lastmentionid'] = str(id)
-        self._write()
+        self._dirty = True
+        if flush:
+            self.flush()
+
+    def flush(self):
+        """ Write the settings to file if they changed. """
+        if self._dirty:
+            self._write()
 
     def _write(self):
-        with open(self.settings_file, 'w') as configfile:
+        # write a new file and rename it, so that a crash never leaves a half written settings.ini
+        tmp_file = self.settings_file + '.tmp'
+        with open(tmp_file, 'w') as configfile:
             self.config.write(configfile)
+            configfile.flush()
+            os.fsync(configfile.fileno())
+        os.replace(tmp_file, self.settings_file)
+        self._dirty = False
 
     NO_MENTIONS = 1
     def read_last_mention_id(self):
@@ -42,15 +61,11 @@ class Settings(object):
             return self.NO_MENTIONS
 
     def read_stopwords(self):
-        stopwords = {}
-        file_str = 'assets/stopwords-{0}.txt'
-        langs = ['de', 'en', 'es', 'fr', 'it']
-        for l in langs:
-            stopwords[l] = {}
-            with open(file_str.format(l), 'r') as f:
-                for line in f.readlines():
-                    stopwords[l][line[:-1]] = 1
-        return stopwords
+        return StopwordIndex(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets'),
+                             compiled=self.read_compile_stopwords())
+
+    def read_compile_stopwords(self):
+        return self.config.getboolean(self.CONFIGS, 'compilestopwords', fallback=True)
 
     def read_imgur_client_id(self):
         return self.config[self.IMGUR]['clientid']
@@ -76,6 +91,9 @@ class Settings(object):
     def read_output_dir(self):
         return self.config[self.CONFIGS]['outputdir']
 
+    def read_image_cache_bytes(self):
+        return self.config.getint(self.CONFIGS, 'imagecachemegabytes', fallback=500) * 1024 * 1024
+
     def read_max_results(self):
         return int(self.config[self.CONFIGS]['maxresults'])
 
@@ -85,5 +103,155 @@ class Settings(object):
     def read_height(self):
         return int(self.config[self.CONFIGS]['height'])
 
+    def read_font_path(self):
+        return self.config.get(self.CONFIGS, 'fontpath', fallback=None)
+
+    def read_render_processes(self):
+        return self.config.getint(self.CONFIGS, 'renderprocesses', fallback=0)
+
+    def read_layout_scale(self):
+        return self.config.getint(self.CONFIGS, 'layoutscale', fallback=1)
+
+    def read_image_format(self):
+        return self.config.get(self.CONFIGS, 'imageformat', fallback='png')
+
+    def read_image_colors(self):
+        return self.config.getint(self.CONFIGS, 'imagecolors', fallback=256)
+
+    def read_png_compress_level(self):
+        return self.config.getint(self.CONFIGS, 'pngcompresslevel', fallback=6)
+
+    def read_image_quality(self):
+        return self.config.getint(self.CONFIGS, 'imagequality', fallback=85)
+
+    def read_save_images(self):
+        return self.config.getboolean(self.CONFIGS, 'saveimages', fallback=True)
+
     def read_description_image_str(self):
-        return self.config[self.CONFIGS]['descriptionimagestr']
\ No newline at end of file
+        return self.config[self.CONFIGS]['descriptionimagestr']
+
+    def read_preflight_lookup(self):
+        return self.config.getboolean(self.CONFIGS, 'preflightlookup', fallback=False)
+
+    def read_profile_ttl(self):
+        return self.config.getint(self.CONFIGS, 'profilettl', fallback=300)
+
+    def read_stream_harvest(self):
+        return self.config.getboolean(self.CONFIGS, 'streamharvest', fallback=False)
+
+    def read_sketch_factor(self):
+        return self.config.getint(self.CONFIGS, 'sketchfactor', fallback=10)
+
+    def read_stable_pages(self):
+        return self.config.getint(self.CONFIGS, 'stablepages', fallback=3)
+
+    def read_stable_overlap(self):
+        return self.config.getfloat(self.CONFIGS, 'stableoverlap', fallback=0.99)
+
+    def read_tweet_cache_dir(self):
+        return self.config.get(self.CONFIGS, 'tweetcachedir', fallback='./cache')
+
+    def read_tweet_store(self):
+        return self.config.get(self.CONFIGS, 'tweetstore', fallback='')
+
+    def read_max_cloud_users(self):
+        return self.config.getint(self.CONFIGS, 'maxcloudusers', fallback=5)
+
+    def read_mentions_journal(self):
+        return self.config.get(self.CONFIGS, 'mentionsjournal', fallback='./mentions.journal')
+
+    def read_journal_fsync_every(self):
+        return self.config.getint(self.CONFIGS, 'journalfsyncevery', fallback=1)
+
+    def read_checkpoint_every(self):
+        return self.config.getint(self.CONFIGS, 'checkpointevery', fallback=10)
+
+    def read_adaptive_polling(self):
+        return self.config.getboolean(self.CONFIGS, 'adaptivepolling', fallback=False)
+
+    def read_poll_min_interval(self):
+        return self.config.getfloat(self.CONFIGS, 'pollmininterval', fallback=60)
+
+    def read_poll_max_interval(self):
+        return self.config.getfloat(self.CONFIGS, 'pollmaxinterval', fallback=400)
+
+    def read_requester_quota(self):
+        return self.config.getint(self.CONFIGS, 'requesterquota', fallback=0)
+
+    def read_quota_seconds(self):
+        return self.config.getfloat(self.CONFIGS, 'quotaseconds', fallback=3600)
+
+    def read_max_mention_age(self):
+        return self.config.getfloat(self.CONFIGS, 'maxmentionage', fallback=0)
+
+    def read_max_pending(self):
+        return self.config.getint(self.CONFIGS, 'maxpending', fallback=0)
+
+    def read_lifo_depth(self):
+        return self.config.getint(self.CONFIGS, 'lifodepth', fallback=0)
+
+    def read_prerender(self):
+        return self.config.getboolean(self.CONFIGS, 'prerender', fallback=False)
+
+    def read_prerender_targets(self):
+        return self.config.getint(self.CONFIGS, 'prerendertargets', fallback=20)
+
+    def read_prerender_min_requests(self):
+        return self.config.getint(self.CONFIGS, 'prerenderminrequests', fallback=2)
+
+    def read_prerender_interval(self):
+        return self.config.getfloat(self.CONFIGS, 'prerenderinterval', fallback=900)
+
+    def read_prerender_reserve(self):
+        return self.config.getfloat(self.CONFIGS, 'prerenderreserve', fallback=0.5)
+
+    def read_pipeline(self):
+        return self.config.getboolean(self.CONFIGS, 'pipeline', fallback=False)
+
+    def read_work_queue(self):
+        return self.config.get(self.CONFIGS, 'workqueue', fallback=None)
+
+    def read_lease_seconds(self):
+        return self.config.getint(self.CONFIGS, 'leaseseconds', fallback=300)
+
+    def read_max_attempts(self):
+        return self.config.getint(self.CONFIGS, 'maxattempts', fallback=3)
+
+    def read_worker_idle_seconds(self):
+        return self.config.getfloat(self.CONFIGS, 'workeridleseconds', fallback=5)
+
+    def read_retry_queue(self):
+        return self.config.get(self.CONFIGS, 'retryqueue', fallback='')
+
+    def read_retry_base_delay(self):
+        return self.config.getfloat(self.CONFIGS, 'retrybasedelay', fallback=60)
+
+    def read_retry_max_delay(self):
+        return self.config.getfloat(self.CONFIGS, 'retrymaxdelay', fallback=3600)
+
+    def read_retry_max_attempts(self):
+        return self.config.getint(self.CONFIGS, 'retrymaxattempts', fallback=8)
+
+    def read_pipeline_workers(self, stage):
+        return self.config.getint(self.CONFIGS, stage + 'workers', fallback=1)
+
+    def read_pipeline_queue_size(self):
+        return self.config.getint(self.CONFIGS, 'pipelinequeuesize', fallback=10)
+
+    def read_asyncio(self):
+        return self.config.getboolean(self.CONFIGS, 'asyncio', fallback=False)
+
+    def read_async_concurrency(self):
+        return self.config.getint(self.CONFIGS, 'asyncconcurrency', fallback=20)
+
+    def read_async_connections(self):
+        return self.config.getint(self.CONFIGS, 'asyncconnections', fallback=20)
+
+    def read_metrics_port(self):
+        return self.config.getint(self.CONFIGS, 'metricsport', fallback=None)
+
+    def read_metrics_host(self):
+        return self.config.get(self.CONFIGS, 'metricshost', fallback='127.0.0.1')
+
+    def read_metrics_json_log(self):
+        return self.config.get(self.CONFIGS, 'metricsjsonlog', fallback=None)
@@ -0,0 +1,75 @@
+import heapq
+
+
+class SpaceSaving(object):
+    """ Approximate counts of the most frequent items of a stream in bounded memory (the Space-Saving algorithm of
+        Metwally, Agrawal and El Abbadi).
+
+        At most `capacity` items are tracked. When a new item arrives and the sketch is full, it replaces the tracked
+        item with the smallest count and inherits that count, so a count is overestimated by at most its error (see
+        error). Every item occurring more than total/capacity times is always tracked, and the most frequent items
+        come out in the right order as long as their counts are far enough apart.
+    """
+    def __init__(self, capacity):
+        """
+        :param capacity: max number of items tracked
+        """
+        self.capacity = capacity
+        self.total = 0
+        self._counts = {}  # item -> count
+        self._errors = {}  # item -> max overestimation of its count
+        # (count, item) for every tracked item, the counts can be stale: they only grow, so a stale entry is too small
+        self._heap = []
+
+    def add(self, item, count=1):
+        self.total += count
+        if item in self._counts:
+            self._counts[item] += count
+            return
+        if len(self._counts) < self.capacity:
+            self._counts[item] = count
+            self._errors[item] = 0
+            heapq.heappush(self._heap, (count, item))
+            return
+        min_count, min_item = self._pop_min()
+        del self._counts[min_item]
+        del self._errors[min_item]
+        self._counts[item] = min_count + count
+        self._errors[item] = min_count
+        heapq.heappush(self._heap, (min_count + count, item))
+
+    def _pop_min(self):
+        while True:
+            count, item = heapq.heappop(self._heap)
+            current = self._counts[item]
+            if current == count:
+                return count, item
+            heapq.heappush(self._heap, (current, item))
+
+    def update(self, counts):
+        """ Add the counts of a dict (e.g. a Counter) mapping items to how many times they occur. """
+        for item, count in counts.items():
+            self.add(item, count)
+
+    def most_common(self, n=None):
+        """
+        :return: list of the n (all if None) items with the highest counts and their counts, the highest first
+        """
+        if n is None:
+            return sorted(self._counts.items(), key=lambda kv: kv[1], reverse=True)
+        return heapq.nlargest(n, self._counts.items(), key=lambda kv: kv[1])
+
+    def error(self, item):
+        """
+        :return: max overestimation of the count of a tracked item
+        """
+        return self._errors[item]
+
+    def __getitem__(self, item):
+        return self._counts.get(item, 0)
+
+    def __contains__(self, item):
+        return item in self._counts
+
+    def __len__(self):
+        return len(self._counts)
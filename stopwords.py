@@ -0,0 +1,105 @@
+import importlib.util
+import os
+import re
+import tempfile
+import threading
+try:
+   import cPickle as pickle
+except:
+   import pickle
+
+
+class StopwordIndex(object):
+    """ The stopwords of every language, looked up like a dict: index['en'] is a frozenset of words.
+
+        The languages are the files assets_dir/stopwords-<lang>.txt (one word per line, <lang> is the code used by
+        twitter in the 'lang' field of the tweets), so adding a language only means adding its file.
+        Nothing is read until a language is used for the first time. If compiled is True, the words of every language
+        are also pickled next to its text file, and the next processes load the pickle instead of parsing the text.
+
+        The stopwords of WordCloud (see common) are dropped from the tweets of every language, like WordCloud did
+        when it counted the words itself.
+    """
+    P_filename = re.compile(r'^stopwords-(.+)\.txt$')
+
+    def __init__(self, assets_dir, compiled=True):
+        """
+        :param assets_dir: directory containing the stopwords-<lang>.txt files
+        :param compiled: True to read and write the pickled stopwords next to the text files
+        """
+        self.assets_dir = assets_dir
+        self.compiled = compiled
+        self._langs = {}
+        for filename in sorted(os.listdir(assets_dir)):
+            m = self.P_filename.match(filename)
+            if m:
+                self._langs[m.group(1)] = os.path.join(assets_dir, filename)
+        self._loaded = {}
+        self._common = None
+        self._lock = threading.Lock()
+
+    def __contains__(self, lang):
+        return lang in self._langs
+
+    def __iter__(self):
+        return iter(self._langs)
+
+    def __len__(self):
+        return len(self._langs)
+
+    def __getitem__(self, lang):
+        try:
+            return self._loaded[lang]
+        except KeyError:
+            pass
+        path = self._langs[lang]
+        with self._lock:
+            if lang not in self._loaded:
+                self._loaded[lang] = self._load(path)
+        return self._loaded[lang]
+
+    @property
+    def common(self):
+        """
+        :return: frozenset of the stopwords of WordCloud (wordcloud.STOPWORDS), read from the wordcloud package without
+                 importing it, empty if it's not installed
+        """
+        if self._common is None:
+            spec = importlib.util.find_spec('wordcloud')
+            words = frozenset()
+            if spec is not None and spec.submodule_search_locations:
+                path = os.path.join(list(spec.submodule_search_locations)[0], 'stopwords')
+                if os.path.exists(path):
+                    with open(path, 'r', encoding='utf-8') as f:
+                        words = frozenset(line.strip().lower() for line in f if line.strip())
+            self._common = words
+        return self._common
+
+    def get(self, lang, default=None):
+        if lang not in self._langs:
+            return default
+        return self[lang]
+
+    def _load(self, path):
+        compiled_path = path[:-len('.txt')] + '.pickle'
+        if self.compiled:
+            try:
+                if os.path.getmtime(compiled_path) >= os.path.getmtime(path):
+                    with open(compiled_path, 'rb') as f:
+                        return pickle.load(f)
+            except Exception:
+                pass
+
+        # utf-8-sig drops the byte order mark at the beginning of the files
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            words = frozenset(line.strip() for line in f if line.strip())
+
+        if self.compiled:
+            try:
+                with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix='.tmp', delete=False) as f:
+                    pickle.dump(words, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(f.name, compiled_path)
+            except OSError:
+                # read only assets, just don't cache them
+                pass
+        return words
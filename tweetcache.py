@@ -0,0 +1,135 @@
+import os
+import tempfile
+try:
+   import cPickle as pickle
+except:
+   import pickle
+
+from metrics import REGISTRY
+from profiles import ProfileCache
+from records import Tweet
+
+
+class TweetCache(object):
+    """ On-disk store of the tweets already harvested for every twitter user, so that the next word cloud of the same
+        user only needs to download the tweets posted in the meantime.
+        Every user is stored in its own pickle file inside cache_dir.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def _path(self, screen_name):
+        # twitter screen names are case insensitive and only contain [A-Za-z0-9_], so they are safe file names
+        return os.path.join(self.cache_dir, screen_name.lower() + '.pickle')
+
+    def load(self, screen_name):
+        """
+        :param screen_name: name of the twitter account (string)
+        :return: a dict with the keys 'max_results' (the max_results used when the tweets were harvested),
+                 'tweets' (list of Tweet, the newest at the top) and 'statuses_count' (the number of tweets of the
+                 user when they were harvested, None if unknown), None if the user is not in the cache
+        """
+        try:
+            with open(self._path(screen_name), 'rb') as f:
+                cached = pickle.load(f)
+        except:
+            return None
+        # the older versions cached the whole tweet objects
+        cached['tweets'] = [Tweet.from_json(t) for t in cached['tweets']]
+        return cached
+
+    def save(self, screen_name, tweets, max_results, statuses_count=None):
+        """ Atomically replace the cached tweets of a user.
+        :param screen_name: name of the twitter account (string)
+        :param tweets: list of tweets, the newest at the top
+        :param max_results: max number of tweets that were requested for this user
+        :param statuses_count: number of tweets of the user according to its profile, None if unknown
+        """
+        # a unique temporary file, the same user can be harvested by several threads at the same time
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix='.tmp', delete=False) as f:
+            pickle.dump({'max_results': max_results, 'tweets': tweets, 'statuses_count': statuses_count}, f)
+        os.replace(f.name, self._path(screen_name))
+
+    @staticmethod
+    def newest_id(tweets):
+        """
+        :param tweets: list of tweets
+        :return: the id of the newest tweet, None if the list is empty
+        """
+        if not tweets:
+            return None
+        return max(t.id for t in tweets)
+
+    @staticmethod
+    def merge(new_tweets, cached_tweets, max_results):
+        """ Merge the freshly downloaded tweets with the cached ones.
+        :param new_tweets: list of tweets newer than the cached ones
+        :param cached_tweets: list of cached tweets
+        :param max_results: max number of tweets to keep
+        :return: list of at most max_results tweets without duplicates, the newest at the top
+        """
+        seen = set()
+        tweets = []
+        for t in sorted(new_tweets + cached_tweets, key=lambda t: t.id, reverse=True):
+            if t.id not in seen:
+                seen.add(t.id)
+                tweets.append(t)
+        return tweets[:max_results]
+
+    def harvest(self, twitter_api, screen_name, max_results, profile=None):
+        """ Return the timeline of a user, downloading only the tweets that are not in the cache yet.
+        :param twitter_api: TwitterApi object
+        :param screen_name: name of the twitter account (string)
+        :param max_results: max number of tweets to return
+        :param profile: Profile of the user from users/lookup, to download only the pages needed (none if the newest tweet is
+                        already cached), None if unknown
+        :return: list of at most max_results tweets, the newest at the top
+        """
+        cached, since_id, cached_count = self._lookup(screen_name, max_results)
+        max_pages = None
+        if profile is not None:
+            if cached is not None and ProfileCache.newest_id(profile) == since_id:
+                print('The cached tweets of @{0} are up to date'.format(screen_name))
+                return cached
+            max_pages = ProfileCache.pages_needed(profile, max_results, cached_count if cached is not None else None)
+            if max_pages == 0:
+                return cached if cached is not None else []
+        tweets = twitter_api.harvest_user_timeline(screen_name=screen_name, max_results=max_results, since_id=since_id,
+                                                   max_pages=max_pages)
+        statuses_count = profile.statuses_count if profile is not None else None
+        return self._update(screen_name, cached, tweets, max_results, statuses_count)
+
+    async def harvest_async(self, twitter_api, screen_name, max_results):
+        """ Same as harvest, with an AsyncTwitterApi object, the cache is read and written in a thread of the default
+            executor.
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        cached, since_id, _ = await loop.run_in_executor(None, self._lookup, screen_name, max_results)
+        tweets = await twitter_api.harvest_user_timeline(screen_name, max_results=max_results, since_id=since_id)
+        return await loop.run_in_executor(None, self._update, screen_name, cached, tweets, max_results)
+
+    def _lookup(self, screen_name, max_results):
+        """
+        :return: (the cached tweets or None, the since_id for the harvest, the statuses_count saved with the tweets)
+        """
+        cached = self.load(screen_name)
+        if cached is None or cached['max_results'] < max_results or not cached['tweets']:
+            # the cache can't satisfy this request, so download the whole timeline again
+            REGISTRY.inc('cache_lookups_total', cache='tweets', result='miss')
+            return None, 1, None
+        REGISTRY.inc('cache_lookups_total', cache='tweets', result='hit')
+        print('Found {0} cached tweets of @{1}'.format(len(cached['tweets']), screen_name))
+        return cached['tweets'], self.newest_id(cached['tweets']), cached.get('statuses_count')
+
+    def _update(self, screen_name, cached, new_tweets, max_results, statuses_count=None):
+        if cached is None:
+            tweets = new_tweets
+        else:
+            tweets = self.merge(new_tweets, cached, max_results)
+        if tweets:
+            self.save(screen_name, tweets, max_results, statuses_count)
+        return tweets
@@ -0,0 +1,207 @@
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from metrics import snowflake_time
+
+DAY_SECONDS = 24 * 3600
+
+
+class CloudQuery(object):
+    """ A word cloud request answered from the TweetStore: the tweets of several twitter accounts and/or only the ones
+        posted in the last days.
+        A query has a name (e.g. 'alice+bob~7d') that stands for it wherever the name of a twitter account is expected
+        (grouping the mentions, the work queue, the image cache), since '+' and '~' can't appear in a screen name.
+    """
+    P_name = re.compile(r'^(\w+(?:\+\w+)*)(?:~(\d+)d)?$')
+
+    def __init__(self, users, days=None):
+        """
+        :param users: list of names of twitter accounts
+        :param days: number of days, None for all the stored tweets
+        """
+        self.users = users
+        self.days = days
+
+    @property
+    def name(self):
+        name = '+'.join(self.users)
+        if self.days is not None:
+            name += '~{0}d'.format(self.days)
+        return name
+
+    @classmethod
+    def parse(cls, name):
+        """
+        :param name: name of a query or of a twitter account
+        :return: CloudQuery, None if the name is the name of a twitter account
+        """
+        if '+' not in name and '~' not in name:
+            return None
+        match = cls.P_name.match(name)
+        if match is None:
+            return None
+        days = match.group(2)
+        return cls(match.group(1).split('+'), int(days) if days is not None else None)
+
+    @staticmethod
+    def users_of(name):
+        """
+        :return: list of the names of the twitter accounts in a query, or [name] if it's the name of an account
+        """
+        query = CloudQuery.parse(name)
+        return query.users if query is not None else [name]
+
+
+class TweetStore(object):
+    """ SQLite store of the words of the tweets harvested for every twitter user, with their counts kept up to date as
+        the tweets are added, so that a word cloud is a single aggregate query instead of cleaning thousands of tweets
+        again. It answers the CloudQuery requests too: the word cloud of several users, of the last days and of a
+        language, from the counts of every user, day (UTC) and language.
+
+        Every user keeps only its max_tweets newest tweets, like the TweetCache, and the counts of the tweets dropped
+        are subtracted. The tweets are stored already cleaned: the words the word cloud counts, in the order they
+        appear (see TwitterWordCloudBot.tweet_words).
+    """
+    # lang of the tweets whose language is unknown
+    NO_LANG = ''
+
+    def __init__(self, path, max_tweets=3200):
+        """
+        :param path: path to the database file
+        :param max_tweets: max number of tweets kept for every user
+        """
+        self.path = path
+        self.max_tweets = max_tweets
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        # the store can be built again from the timelines, losing the last transactions is fine
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.execute('PRAGMA synchronous = NORMAL')
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS tweets (
+                user TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                day INTEGER NOT NULL,
+                lang TEXT NOT NULL,
+                words TEXT NOT NULL,
+                PRIMARY KEY (user, id)) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS terms (
+                user TEXT NOT NULL,
+                word TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (user, word)) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS daily_terms (
+                user TEXT NOT NULL,
+                day INTEGER NOT NULL,
+                lang TEXT NOT NULL,
+                word TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (user, day, lang, word)) WITHOUT ROWID;
+        ''')
+
+    def newest_id(self, users):
+        """
+        :param users: list of names of twitter accounts
+        :return: the id of the newest tweet stored for these users, None if there are none
+        """
+        users = [u.lower() for u in users]
+        with self._lock:
+            row = self._db.execute('SELECT MAX(id) FROM tweets WHERE user IN ({0})'.format(self._params(users)),
+                                   users).fetchone()
+        return row[0]
+
+    def add(self, screen_name, tweets, tweet_words):
+        """ Store the tweets of a user newer than the stored ones and update the counts of their words.
+        :param screen_name: name of the twitter account (string)
+        :param tweets: list of Tweet of the user, e.g. its whole timeline, the newest at the top
+        :param tweet_words: function mapping a list of tweets to the list of the words counted for each of them
+        :return: number of tweets added
+        """
+        user = screen_name.lower()
+        newest_id = self.newest_id([user])
+        new = [t for t in tweets if newest_id is None or t.id > newest_id]
+        if not new:
+            return 0
+        rows = []
+        for tweet, words in zip(new, tweet_words(new)):
+            # the time of the tweets older than November 2010 is unknown, they are never among the last days
+            posted = snowflake_time(tweet.id)
+            day = int(posted // DAY_SECONDS) if posted is not None else 0
+            rows.append((user, tweet.id, day, tweet.lang or self.NO_LANG, ' '.join(words)))
+        with self._lock, self._db:
+            # another thread may have added some of them meanwhile
+            newest_id = self._db.execute('SELECT MAX(id) FROM tweets WHERE user = ?', (user,)).fetchone()[0]
+            rows = [r for r in rows if newest_id is None or r[1] > newest_id]
+            self._db.executemany('INSERT INTO tweets (user, id, day, lang, words) VALUES (?, ?, ?, ?, ?)', rows)
+            self._count(user, rows, 1)
+            # forget the oldest tweets beyond max_tweets
+            old = self._db.execute('SELECT user, id, day, lang, words FROM tweets WHERE user = ? '
+                                   'ORDER BY id DESC LIMIT -1 OFFSET ?', (user, self.max_tweets)).fetchall()
+            if old:
+                self._db.executemany('DELETE FROM tweets WHERE user = ? AND id = ?', [(user, r[1]) for r in old])
+                self._count(user, old, -1)
+        return len(rows)
+
+    def _count(self, user, rows, sign):
+        """ Add (sign 1) or subtract (sign -1) the words of some tweets to the counts of a user. """
+        totals = Counter()
+        daily = Counter()
+        for _, _, day, lang, words in rows:
+            for word in words.split():
+                totals[word] += 1
+                daily[day, lang, word] += 1
+        self._db.executemany('INSERT INTO terms (user, word, count) VALUES (?, ?, ?) '
+                             'ON CONFLICT (user, word) DO UPDATE SET count = count + excluded.count',
+                             [(user, word, sign * count) for word, count in totals.items()])
+        self._db.executemany('INSERT INTO daily_terms (user, day, lang, word, count) VALUES (?, ?, ?, ?, ?) '
+                             'ON CONFLICT (user, day, lang, word) DO UPDATE SET count = count + excluded.count',
+                             [(user, day, lang, word, sign * count) for (day, lang, word), count in daily.items()])
+        if sign < 0:
+            self._db.execute('DELETE FROM terms WHERE user = ? AND count <= 0', (user,))
+            self._db.execute('DELETE FROM daily_terms WHERE user = ? AND count <= 0', (user,))
+
+    def terms(self, users, days=None, lang=None, limit=None, now=None):
+        """
+        :param users: list of names of twitter accounts
+        :param days: count only the tweets of the last days (today included, UTC), None for all the stored tweets
+        :param lang: count only the tweets in this language, None for all the languages
+        :param limit: max number of words, the most frequent ones
+        :param now: unix time of today, None for the current time
+        :return: Counter mapping every word of the tweets of the users to its number of occurrences
+        """
+        users = [u.lower() for u in users]
+        args = list(users)
+        if days is None and lang is None:
+            sql = 'SELECT word, SUM(count) FROM terms WHERE user IN ({0})'
+        else:
+            sql = 'SELECT word, SUM(count) FROM daily_terms WHERE user IN ({0})'
+            if days is not None:
+                sql += ' AND day > ?'
+                args.append(self.today(now) - days)
+            if lang is not None:
+                sql += ' AND lang = ?'
+                args.append(lang)
+        sql += ' GROUP BY word ORDER BY 2 DESC, word'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            args.append(limit)
+        with self._lock:
+            return Counter(dict(self._db.execute(sql.format(self._params(users)), args).fetchall()))
+
+    @staticmethod
+    def today(now=None):
+        """
+        :return: number of the current day since the epoch (UTC)
+        """
+        return int((time.time() if now is None else now) // DAY_SECONDS)
+
+    @staticmethod
+    def _params(values):
+        return ', '.join('?' * len(values))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
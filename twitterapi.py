@@ -4,13 +4,24 @@ from urllib.error import URLError
 import twitter
 import os
 
+from metrics import REGISTRY
+from ratelimit import RateLimiter
+from records import Mention, Profile, Tweet
+
 
 class TwitterApi():
-    def __init__(self, consumer_key, consumer_secret, access_token=None, access_token_secret=None):
-        self.twitter_api = self.oauth_login(consumer_key, consumer_secret, access_token, access_token_secret)
+    def __init__(self, consumer_key, consumer_secret, access_token=None, access_token_secret=None, rate_limiter=None,
+                 **twitter_args):
+        """
+        :param rate_limiter: RateLimiter scheduling the calls, None for a new one
+        :param twitter_args: other arguments for twitter.Twitter, e.g. domain and secure to use another server
+        """
+        self.twitter_api = self.oauth_login(consumer_key, consumer_secret, access_token, access_token_secret,
+                                            **twitter_args)
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
 
     @staticmethod
-    def oauth_login(consumer_key, consumer_secret, access_token, access_token_secret):
+    def oauth_login(consumer_key, consumer_secret, access_token, access_token_secret, **twitter_args):
         if not access_token or not access_token_secret:
             oauth_file = './twitter_oauth'
             if not os.path.exists(oauth_file):
@@ -20,13 +31,23 @@ class TwitterApi():
         auth = twitter.oauth.OAuth(access_token, access_token_secret,
                                    consumer_key, consumer_secret)
 
-        return twitter.Twitter(auth=auth)
+        return twitter.Twitter(auth=auth, **twitter_args)
+
+    @staticmethod
+    def endpoint_name(twitter_api_func):
+        """
+        :return: the name of the endpoint called by twitter_api_func, e.g. 'statuses/user_timeline'
+        """
+        # uriparts starts with the api version, e.g. ('1.1', 'statuses', 'user_timeline')
+        parts = [p for p in getattr(twitter_api_func, 'uriparts', ()) if not p.replace('.', '').isdigit()]
+        return '/'.join(parts) or str(twitter_api_func)
 
     def make_twitter_request(self, twitter_api_func, max_errors=10, *args, **kw):
         # A nested helper function that handles common HTTPErrors. Return an updated
-        # value for wait_period if the problem is a 500 level error. Block until the
-        # rate limit is reset if it's a rate limiting issue (429 error). Returns None
-        # for 401 and 404 errors, which requires special handling by the caller.
+        # value for wait_period if the problem is a 500 level error. Let the rate limiter
+        # wait until the rate limit of the endpoint is reset if it's a rate limiting issue
+        # (429 error). Returns None for 401 and 404 errors, which requires special handling
+        # by the caller.
         def handle_twitter_http_error(e, wait_period=2, sleep_when_rate_limited=True):
             if wait_period > 3600: # Seconds
                 print('Too many retries. Quitting.')
@@ -41,17 +62,18 @@ class TwitterApi():
                 print('Encountered 404 Error (Not Found)')
                 return None
             elif e.e.code == 429:
-                print('Encountered 429 Error (Rate Limit Exceeded)')
+                print('Encountered 429 Error (Rate Limit Exceeded) on {0}'.format(endpoint))
+                REGISTRY.inc('twitter_api_rate_limited_total', endpoint=endpoint)
+                self.rate_limiter.rate_limited(endpoint, e.e.headers)
                 if sleep_when_rate_limited:
-                    print("Retrying in 15 minutes...ZzZ...")
-                    time.sleep(60*15 + 5)
-                    print('...ZzZ...Awake now and trying again.')
+                    # the next rate_limiter.acquire waits until the reset of this endpoint only
                     return 2
                 else:
                     raise e # Caller must handle the rate limiting issue
             elif e.e.code in (500, 502, 503, 504):
                 print('Encountered {0} Error. Retrying in {1} seconds' \
                     .format(e.e.code, wait_period))
+                REGISTRY.inc('twitter_api_retries_total', endpoint=endpoint, reason=str(e.e.code))
                 time.sleep(wait_period)
                 wait_period *= 1.5
                 return wait_period
@@ -62,10 +84,16 @@ class TwitterApi():
 
         wait_period = 2
         error_count = 0
+        endpoint = self.endpoint_name(twitter_api_func)
 
         while True:
+            self.rate_limiter.acquire(endpoint)
+            REGISTRY.inc('twitter_api_calls_total', endpoint=endpoint)
             try:
-                return twitter_api_func(*args, **kw)
+                with REGISTRY.time('twitter_api_call_seconds', endpoint=endpoint):
+                    result = twitter_api_func(*args, **kw)
+                self.rate_limiter.update(endpoint, getattr(result, 'headers', None))
+                return result
             except twitter.api.TwitterHTTPError as e:
                 error_count = 0
                 wait_period = handle_twitter_http_error(e, wait_period)
@@ -74,17 +102,35 @@ class TwitterApi():
             except URLError as e:
                 error_count += 1
                 print("URLError encountered. Continuing.")
+                REGISTRY.inc('twitter_api_retries_total', endpoint=endpoint, reason='URLError')
                 if error_count > max_errors:
                     print("Too many consecutive errors...bailing out.")
                     raise
             except BadStatusLine as e:
                 error_count += 1
                 print("BadStatusLine encountered. Continuing.")
+                REGISTRY.inc('twitter_api_retries_total', endpoint=endpoint, reason='BadStatusLine')
                 if error_count > max_errors:
                     print("Too many consecutive errors...bailing out.")
                     raise
 
-    def harvest_user_timeline(self, screen_name=None, user_id=None, max_results=3200):
+    def harvest_user_timeline(self, screen_name=None, user_id=None, max_results=3200, since_id=1, max_pages=None):
+        """ Download the timeline of a user, the newest tweet at the top.
+        :return: list of Tweet
+        :param since_id: only download the tweets newer than this id. When it's not 1 the caller already has the older
+                         tweets, so the pagination stops at the first page that isn't full
+        :param max_pages: max number of pages to download (see ProfileCache.pages_needed), None for as many as needed
+        """
+        results = []
+        for tweets in self.iter_user_timeline(screen_name, user_id, max_results, since_id, max_pages):
+            results += tweets
+        return results
+
+    def iter_user_timeline(self, screen_name=None, user_id=None, max_results=3200, since_id=1, max_pages=None):
+        """ Same as harvest_user_timeline, but yield every page of tweets (a list, the newest tweet at the top) as soon
+            as it's downloaded, so that the caller doesn't need to keep all of them. Closing the generator stops the
+            download.
+        """
         assert (screen_name != None) != (user_id != None), \
         "Must have screen_name or user_id, but not both"
 
@@ -92,7 +138,7 @@ class TwitterApi():
             'count': 200,
             'trim_user': 'true',
             'include_rts' : 'true',
-            'since_id' : 1
+            'since_id' : since_id
             }
 
         if screen_name:
@@ -100,17 +146,18 @@ class TwitterApi():
         else:
             kw['user_id'] = user_id
 
-        max_pages = 16
-        results = []
+        # the api returns at most 3200 tweets
+        max_pages = min(max_pages, 16) if max_pages is not None else 16
+        num_results = 0
 
         tweets = self.make_twitter_request(self.twitter_api.statuses.user_timeline, **kw)
 
         if tweets is None: # 401 (Not Authorized) - Need to bail out on loop entry
             tweets = []
 
-        results += tweets
-
         print('Fetched {0} tweets'.format(len(tweets)))
+        num_results += len(tweets)
+        yield [Tweet.from_json(t) for t in tweets[:max_results]]
 
         page_num = 1
 
@@ -122,14 +169,19 @@ class TwitterApi():
         # a possible 400 tweets after your second request. Twitter does do some
         # post-filtering on censored and deleted tweets out of batches of 'count', though,
         # so you can't strictly check for the number of results being 200. You might get
-        # back 198, for example, and still have many more tweets to go. If you have the
-        # total number of tweets for an account (by GET /users/lookup/), then you could
-        # simply use this value as a guide.
+        # back 198, for example, and still have many more tweets to go. When the caller has
+        # the total number of tweets of the account (by GET /users/lookup/), it passes the
+        # number of pages to download as max_pages (see ProfileCache.pages_needed).
 
         if max_results == kw['count']:
             page_num = max_pages # Prevent loop entry
 
-        while page_num < max_pages and len(tweets) > 0 and len(results) < max_results:
+        if since_id != 1 and len(tweets) < kw['count']:
+            # An incremental harvest: a short page means we have caught up with the tweets the caller already has,
+            # a few tweets post-filtered by Twitter are not worth another request.
+            page_num = max_pages
+
+        while page_num < max_pages and len(tweets) > 0 and num_results < max_results:
 
             # Necessary for traversing the timeline in Twitter's v1.1 API:
             # get the next query's max-id parameter to pass in.
@@ -137,17 +189,37 @@ class TwitterApi():
             kw['max_id'] = min([ tweet['id'] for tweet in tweets]) - 1
 
             tweets = self.make_twitter_request(self.twitter_api.statuses.user_timeline, **kw)
-            results += tweets
+            if tweets is None:
+                tweets = []
 
             print('Fetched {0} tweets'.format(len(tweets)))
+            yield [Tweet.from_json(t) for t in tweets[:max_results - num_results]]
+            num_results += len(tweets)
 
             page_num += 1
 
         print('Done fetching tweets')
 
-        return results[:max_results]
+    def lookup_users(self, screen_names):
+        """ Download the profiles of many users, 100 per request.
+        :param screen_names: list of names of twitter accounts
+        :return: list of Profile, the accounts that don't exist or are suspended are missing
+        """
+        users = []
+        for i in range(0, len(screen_names), 100):
+            kw = {  # Keyword args for the Twitter API call
+                'screen_name': ','.join(screen_names[i:i + 100]),
+                'include_entities': 'false'
+                }
+            # 404 if none of the accounts exist
+            found = self.make_twitter_request(self.twitter_api.users.lookup, **kw) or []
+            users += [Profile.from_json(u) for u in found]
+        return users
 
     def get_mentions(self, last_mention_id=1):
+        """
+        :return: list of Mention, the newest at the top
+        """
         kw = {  # Keyword args for the Twitter API call
             'count': 200,
             'trim_user': 'false',
@@ -158,7 +230,7 @@ class TwitterApi():
         mentions = self.make_twitter_request(self.twitter_api.statuses.mentions_timeline, **kw)
         if mentions is None:
             mentions = []
-        return mentions
+        return [Mention.from_json(m) for m in mentions]
 
     def reply_tweet(self, status, in_reply_to_status_id):
         kw = {  # Keyword args for the Twitter API call
@@ -0,0 +1,327 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from metrics import REGISTRY
+from records import Mention
+
+
+class Claim(object):
+    """ Mentions leased to a worker by WorkQueue.claim, all requesting the same word cloud. """
+    def __init__(self, token, mentions):
+        """
+        :param token: id of the lease, needed to acknowledge the mentions and to reply to them
+        :param mentions: list of Mention, the oldest first
+        """
+        self.token = token
+        self.mentions = mentions
+
+    @property
+    def mention_ids(self):
+        return [m.id_str for m in self.mentions]
+
+
+class WorkQueue(object):
+    """ Queue of the mentions shared by one poller process, which adds them, and many worker processes, which handle
+        them, in a SQLite database. The processes can run on several hosts sharing the database file on a volume with
+        working file locks.
+
+        A worker claims the oldest mention waiting to be handled together with the other waiting mentions requesting
+        the same word cloud (see shard), so that two workers never build the same word cloud at the same time. The
+        mentions are leased to the worker for lease_seconds: if it crashes, the lease expires and another worker
+        handles them again, up to max_attempts times. A worker acknowledges the mentions once handled.
+
+        Every reply is recorded before it's posted and after (see reserve_reply), so that a mention is answered
+        exactly once even if its worker crashes in the middle: a worker finding a reply started by a crashed worker
+        looks for it on Twitter before posting it again.
+    """
+    # states of the mentions
+    PENDING, LEASED, DONE, FAILED = 'pending', 'leased', 'done', 'failed'
+    # state of a reply reserved but not posted yet
+    POSTING = 'posting'
+    # results of reserve_reply
+    RESERVED, POSTED, UNKNOWN, LOST = 'reserved', 'posted', 'unknown', 'lost'
+    # the handled mentions and their replies are kept this long
+    RETENTION_SECONDS = 30 * 24 * 3600
+
+    def __init__(self, path, lease_seconds=300, max_attempts=3, clock=time.time):
+        """
+        :param path: path to the database file
+        :param lease_seconds: seconds a worker has to handle the mentions it claimed
+        :param max_attempts: max number of times a mention is claimed, then it's given up
+        :param clock: function returning the current unix time
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self.owner = '{0}:{1}'.format(socket.gethostname(), os.getpid())
+        self._lock = threading.Lock()
+        # autocommit, the transactions are opened explicitly (see _transaction)
+        self._db = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS mentions (
+                id TEXT PRIMARY KEY,
+                seq INTEGER NOT NULL,
+                shard TEXT NOT NULL,
+                mention TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_token TEXT,
+                lease_owner TEXT,
+                lease_expires REAL,
+                updated REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS mentions_state ON mentions (state, seq);
+            CREATE INDEX IF NOT EXISTS mentions_shard ON mentions (shard, state);
+            CREATE TABLE IF NOT EXISTS replies (
+                mention_id TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                lease_token TEXT,
+                reply_id TEXT,
+                updated REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        ''')
+
+    def _transaction(self):
+        """ Lock the database for writing until the end of the with block """
+        return _Transaction(self._db, self._lock)
+
+    @staticmethod
+    def shard(mention_id, target):
+        """
+        :param target: lowercase name of the twitter account requested by the mention, None if there's none
+        :return: the shard of a mention, the mentions of a shard are claimed together
+        """
+        return '@' + target if target is not None else '#' + mention_id
+
+    def add(self, mentions, targets):
+        """ Add new mentions to the queue, the ones already added are skipped.
+        :param mentions: list of Mention, the newest at the top (as returned by TwitterApi.get_mentions)
+        :param targets: function returning the lowercase name of the twitter account requested by a mention or None
+        :return: number of mentions added
+        """
+        now = self.clock()
+        added = 0
+        with self._transaction() as db:
+            for m in reversed(mentions):
+                cursor = db.execute('INSERT OR IGNORE INTO mentions (id, seq, shard, mention, state, updated) '
+                                    'VALUES (?, ?, ?, ?, ?, ?)',
+                                    (m.id_str, int(m.id_str), self.shard(m.id_str, targets(m)),
+                                     json.dumps(m.to_json(), separators=(',', ':')), self.PENDING, now))
+                added += cursor.rowcount
+                self._set_meta(db, 'last_mention_id', m.id_str, newer=True)
+            # forget the mentions handled long ago
+            db.execute('DELETE FROM mentions WHERE state IN (?, ?) AND updated < ?',
+                       (self.DONE, self.FAILED, now - self.RETENTION_SECONDS))
+            db.execute('DELETE FROM replies WHERE state = ? AND updated < ?',
+                       (self.POSTED, now - self.RETENTION_SECONDS))
+        return added
+
+    def advance(self, mention_id):
+        """ Record that the mentions up to mention_id have been downloaded, even if they weren't added.
+        :param mention_id: id of a mention (string)
+        """
+        with self._transaction() as db:
+            self._set_meta(db, 'last_mention_id', mention_id, newer=True)
+
+    @property
+    def last_mention_id(self):
+        """
+        :return: id of the newest mention ever added, None if the queue is empty
+        """
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'last_mention_id'").fetchone()
+        return row[0] if row is not None else None
+
+    @staticmethod
+    def _set_meta(db, key, value, newer=False):
+        if newer:
+            row = db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+            if row is not None and int(row[0]) >= int(value):
+                return
+        db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def claim(self):
+        """ Lease the oldest mention waiting to be handled (or whose lease expired), together with the waiting
+            mentions of the same shard. The mentions already claimed max_attempts times are given up.
+        :return: Claim, None if no mentions are waiting
+        """
+        now = self.clock()
+        token = uuid.uuid4().hex
+        available = '(state = ? OR (state = ? AND lease_expires < ?))'
+        with self._transaction() as db:
+            failed = db.execute('UPDATE mentions SET state = ?, updated = ? WHERE {0} AND attempts >= ?'
+                                .format(available),
+                                (self.FAILED, now, self.PENDING, self.LEASED, now, self.max_attempts)).rowcount
+            row = db.execute('SELECT shard FROM mentions WHERE {0} ORDER BY seq LIMIT 1'.format(available),
+                             (self.PENDING, self.LEASED, now)).fetchone()
+            mentions = []
+            retried = 0
+            if row is not None:
+                rows = db.execute('SELECT id, mention, state FROM mentions WHERE shard = ? AND {0} ORDER BY seq'
+                                  .format(available), (row[0], self.PENDING, self.LEASED, now)).fetchall()
+                db.executemany('UPDATE mentions SET state = ?, attempts = attempts + 1, lease_token = ?, '
+                               'lease_owner = ?, lease_expires = ?, updated = ? WHERE id = ?',
+                               [(self.LEASED, token, self.owner, now + self.lease_seconds, now, r[0]) for r in rows])
+                mentions = [Mention.from_json(json.loads(r[1])) for r in rows]
+                retried = sum(1 for r in rows if r[2] == self.LEASED)
+        if failed:
+            print("Gave up {0} mention(s) after {1} attempts".format(failed, self.max_attempts))
+            REGISTRY.inc('work_queue_failed_total', failed)
+        if not mentions:
+            return None
+        if retried:
+            REGISTRY.inc('work_queue_expired_leases_total', retried)
+        return Claim(token, mentions)
+
+    def extend(self, claim):
+        """ Renew the lease of the claimed mentions for lease_seconds.
+        :return: False if the lease expired and the mentions were claimed by another worker
+        """
+        now = self.clock()
+        with self._transaction() as db:
+            return db.execute('UPDATE mentions SET lease_expires = ? WHERE lease_token = ? AND state = ?',
+                              (now + self.lease_seconds, claim.token, self.LEASED)).rowcount > 0
+
+    def keep_lease(self, claim):
+        """ Renew the lease of the claimed mentions in the background until the end of the with block, so that a
+            long harvest or render doesn't let it expire while the worker is alive.
+        """
+        return _LeaseKeeper(self, claim)
+
+    def ack(self, claim):
+        """ Mark the claimed mentions as handled.
+        :return: number of mentions acknowledged, fewer than the claimed ones if the lease expired meanwhile
+        """
+        with self._transaction() as db:
+            done = db.execute('UPDATE mentions SET state = ?, lease_token = NULL, updated = ? '
+                              'WHERE lease_token = ? AND state = ?',
+                              (self.DONE, self.clock(), claim.token, self.LEASED)).rowcount
+        REGISTRY.inc('mentions_completed_total', done)
+        return done
+
+    def release(self, claim):
+        """ Give the claimed mentions back to the queue, to be handled again right away by any worker. """
+        with self._transaction() as db:
+            db.execute('UPDATE mentions SET state = ?, lease_token = NULL, updated = ? '
+                       'WHERE lease_token = ? AND state = ?',
+                       (self.PENDING, self.clock(), claim.token, self.LEASED))
+
+    def reserve_reply(self, claim, mention_id, take_over=False):
+        """ Record that the reply to a mention is about to be posted, renewing the lease.
+        :param take_over: True to reserve the reply even if another worker started posting it (see UNKNOWN)
+        :return: RESERVED if the reply can be posted,
+                 POSTED if it was already posted,
+                 UNKNOWN if another worker started posting it and crashed: it may have been posted or not,
+                 LOST if the lease expired and the mention was claimed by another worker
+        """
+        now = self.clock()
+        with self._transaction() as db:
+            # an expired lease still holds until another worker claims the mention
+            leased = db.execute('SELECT 1 FROM mentions WHERE id = ? AND lease_token = ? AND state = ?',
+                                (mention_id, claim.token, self.LEASED)).fetchone()
+            if leased is None:
+                return self.LOST
+            row = db.execute('SELECT state, lease_token FROM replies WHERE mention_id = ?', (mention_id,)).fetchone()
+            if row is not None and row[0] == self.POSTED:
+                return self.POSTED
+            if row is not None and row[1] != claim.token and not take_over:
+                return self.UNKNOWN
+            db.execute('INSERT OR REPLACE INTO replies (mention_id, state, lease_token, updated) VALUES (?, ?, ?, ?)',
+                       (mention_id, self.POSTING, claim.token, now))
+            db.execute('UPDATE mentions SET lease_expires = ? WHERE lease_token = ?',
+                       (now + self.lease_seconds, claim.token))
+        return self.RESERVED
+
+    def replied(self, mention_id, reply_id):
+        """ Record that the reply to a mention was posted.
+        :param reply_id: id of the reply tweet (string), None if unknown
+        """
+        with self._transaction() as db:
+            db.execute('INSERT OR REPLACE INTO replies (mention_id, state, reply_id, updated) VALUES (?, ?, ?, ?)',
+                       (mention_id, self.POSTED, reply_id, self.clock()))
+
+    def cancel_reply(self, claim, mention_id):
+        """ Record that the reserved reply to a mention was not posted. """
+        with self._transaction() as db:
+            db.execute('DELETE FROM replies WHERE mention_id = ? AND lease_token = ? AND state = ?',
+                       (mention_id, claim.token, self.POSTING))
+
+    def counts(self):
+        """
+        :return: dict mapping every state to its number of mentions
+        """
+        with self._lock:
+            return dict(self._db.execute('SELECT state, COUNT(*) FROM mentions GROUP BY state').fetchall())
+
+    def pending_count(self):
+        """
+        :return: number of mentions not handled yet, leased ones included
+        """
+        counts = self.counts()
+        return counts.get(self.PENDING, 0) + counts.get(self.LEASED, 0)
+
+    def oldest_pending_id(self):
+        """
+        :return: id of the oldest mention not handled yet, leased ones included, None if there are none
+        """
+        with self._lock:
+            row = self._db.execute('SELECT id FROM mentions WHERE state IN (?, ?) ORDER BY seq LIMIT 1',
+                                   (self.PENDING, self.LEASED)).fetchone()
+        return row[0] if row is not None else None
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class _Transaction(object):
+    def __init__(self, db, lock):
+        self.db = db
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            # take the write lock of the database now, so that two processes never claim the same mentions
+            self.db.execute('BEGIN IMMEDIATE')
+        except:
+            self.lock.release()
+            raise
+        return self.db
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.db.execute('COMMIT' if exc_type is None else 'ROLLBACK')
+        finally:
+            self.lock.release()
+
+
+class _LeaseKeeper(object):
+    def __init__(self, queue, claim):
+        self.queue = queue
+        self.claim = claim
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='lease-keeper', daemon=True)
+
+    def _run(self):
+        # renew well before the lease expires, a renewal can wait for the lock of the database
+        while not self._stop_event.wait(self.queue.lease_seconds / 3.0):
+            try:
+                if not self.queue.extend(self.claim):
+                    return
+            except Exception as e:
+                print("Error while renewing the lease of the mentions {0}: {1}"
+                      .format(', '.join(self.claim.mention_ids), e))
+
+    def __enter__(self):
+        self._thread.start()
+        return self.claim
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop_event.set()
+        self._thread.join()